@@ -0,0 +1,168 @@
+"""
+Benchmark load time, memory and generation speed of the local fallback model.
+
+Usage:
+    python ai/benchmark_local_model.py                                  # current LLM_LOCAL_* settings
+    python ai/benchmark_local_model.py --quantize int8 --threads 4
+    python ai/benchmark_local_model.py --dtype stored --batch 1 4 8 --max-new-tokens 64
+    python ai/benchmark_local_model.py --quantize int8 --json >> bench.jsonl
+    python ai/benchmark_local_model.py --draft-model JackFram/llama-68m --draft-tokens 5
+
+Loads the model in this process exactly as the API's worker does (local_llm),
+then runs batched generations over a sample exam page and reports load seconds,
+resident memory and tokens/sec per batch size. Run one configuration per
+invocation: RSS only means something for a fresh process.
+
+With --draft-model, single-request generation is also timed with speculative
+(assisted) decoding, and the draft's acceptance rate is measured: the share of
+the local model's greedy tokens that the draft predicts when fed the same
+prefix (teacher-forced), i.e. how many of its proposals would be accepted.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+from dotenv import load_dotenv
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+load_dotenv(os.path.join(PROJECT_ROOT, ".env"))
+
+import local_llm  # noqa: E402  (needs env loaded first)
+
+SYSTEM_PROMPT = (
+    "You are an academic assistant that provides concise, structured solutions to exam questions. "
+    "Explain reasoning, show working for calculations, and if multiple distinct questions appear, number answers."
+)
+SAMPLE_PAGES = [
+    "Question 3 (10 marks)\n(a) Differentiate f(x) = x^3 sin(x).\n(b) Evaluate the integral of 2x e^(x^2) dx from 0 to 1.",
+    "Question 7\nA stack is implemented with a dynamic array that doubles when full. "
+    "Show that push has amortised O(1) cost.",
+    "Question 1\nWhich of the following is NOT a property of a hash function used in a hash table?\n"
+    "A. Deterministic  B. Uniform  C. Reversible  D. Fast to compute",
+    "Question 5\nExplain the difference between TCP and UDP, giving one application suited to each.",
+]
+
+
+def acceptance_rate(model, draft, tokenizer, max_new_tokens):
+    """Share of the target's greedy tokens that the draft's argmax matches, over the sample pages."""
+    import torch
+
+    matched = total = 0
+    for page in SAMPLE_PAGES:
+        prompt = local_llm.format_prompt(SYSTEM_PROMPT, page)
+        inputs = tokenizer(prompt, return_tensors="pt", return_token_type_ids=False).to(model.device)
+        prompt_len = inputs["input_ids"].shape[1]
+        with torch.no_grad():
+            out = model.generate(
+                **inputs, max_new_tokens=max_new_tokens, do_sample=False, pad_token_id=tokenizer.pad_token_id
+            )
+            target = out[0, prompt_len:]
+            # Draft prediction for position i comes from the logits at i - 1
+            logits = draft(input_ids=out.to(draft.device)).logits[0, prompt_len - 1:-1]
+        predicted = logits.argmax(-1).to(target.device)
+        matched += int((predicted == target).sum())
+        total += target.shape[0]
+    return round(matched / max(total, 1), 3)
+
+
+def run_batch(model, tokenizer, batch_size, max_new_tokens, extra=None):
+    prompts = [
+        local_llm.format_prompt(SYSTEM_PROMPT, SAMPLE_PAGES[i % len(SAMPLE_PAGES)])
+        for i in range(batch_size)
+    ]
+    started = time.time()
+    _, generated = local_llm._generate_batch(
+        model,
+        tokenizer,
+        prompts,
+        [max_new_tokens] * batch_size,
+        [local_llm.DEFAULT_STOP] * batch_size,
+        extra=extra,
+    )
+    elapsed = time.time() - started
+    return {
+        "batch": batch_size,
+        "seconds": round(elapsed, 2),
+        "generated_tokens": generated,
+        "tokens_per_sec": round(generated / max(elapsed, 1e-6), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the local fallback model configuration.")
+    parser.add_argument("--model", default=local_llm.LLM_LOCAL_MODEL, help="HF model id")
+    parser.add_argument("--quantize", choices=["none", "int8"], default=None, help="Override LLM_LOCAL_QUANTIZE")
+    parser.add_argument("--dtype", default=None, help="Override LLM_LOCAL_DTYPE (auto/stored/float32/bfloat16/float16)")
+    parser.add_argument("--threads", type=int, default=None, help="Override LLM_LOCAL_THREADS")
+    parser.add_argument("--interop-threads", type=int, default=None, help="Override LLM_LOCAL_INTEROP_THREADS")
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 4], help="Batch sizes to measure")
+    parser.add_argument("--max-new-tokens", type=int, default=64, help="Tokens generated per request")
+    parser.add_argument("--runs", type=int, default=2, help="Timed runs per batch size (after one warm-up)")
+    parser.add_argument("--draft-model", default=local_llm.LLM_LOCAL_DRAFT_MODEL or None,
+                        help="Draft model for speculative decoding (default LLM_LOCAL_DRAFT_MODEL)")
+    parser.add_argument("--draft-tokens", type=int, default=None, help="Override LLM_LOCAL_DRAFT_TOKENS")
+    parser.add_argument("--json", action="store_true", help="Print one JSON line instead of a table")
+    args = parser.parse_args()
+
+    options = local_llm.load_options(
+        quantize=args.quantize,
+        dtype=args.dtype,
+        threads=args.threads,
+        interop_threads=args.interop_threads,
+    )
+    rss_before = local_llm.rss_mb()
+    model, tokenizer, info = local_llm._load_model(args.model, options)
+    result = {"model": args.model, "options": options, **info, "rss_before_load_mb": rss_before, "runs": []}
+    if not args.json:
+        print(f"[+] Loaded {args.model} in {info['load_seconds']}s "
+              f"(dtype={info['dtype']}, quantize={info['quantize']}, threads={info['threads']}), "
+              f"RSS {info['rss_mb']} MB")
+
+    run_batch(model, tokenizer, 1, 8)  # warm-up: first call pays for lazy kernel init
+    for batch_size in args.batch:
+        for _ in range(args.runs):
+            run = run_batch(model, tokenizer, batch_size, args.max_new_tokens)
+            result["runs"].append(run)
+            if not args.json:
+                print(f"[✓] batch={run['batch']:<3} {run['generated_tokens']:>5} tokens "
+                      f"in {run['seconds']:>7.2f}s  -> {run['tokens_per_sec']:>7.2f} tok/s")
+
+    if args.draft_model:
+        if args.draft_tokens:
+            local_llm.LLM_LOCAL_DRAFT_TOKENS = args.draft_tokens
+        assist = local_llm._load_draft(args.draft_model, options, tokenizer)
+        draft = assist["assistant_model"]
+        run_batch(model, tokenizer, 1, 8, assist)  # warm-up
+        plain = [run_batch(model, tokenizer, 1, args.max_new_tokens) for _ in range(args.runs)]
+        assisted = [run_batch(model, tokenizer, 1, args.max_new_tokens, assist) for _ in range(args.runs)]
+        plain_tps = sum(r["tokens_per_sec"] for r in plain) / len(plain)
+        assisted_tps = sum(r["tokens_per_sec"] for r in assisted) / len(assisted)
+        result["speculative"] = {
+            "draft_model": args.draft_model,
+            "draft_tokens": local_llm.LLM_LOCAL_DRAFT_TOKENS,
+            # Teacher-forced argmax agreement needs a shared vocabulary
+            "acceptance_rate": (
+                acceptance_rate(model, draft, tokenizer, args.max_new_tokens) if "assistant_tokenizer" not in assist else None
+            ),
+            "tokens_per_sec": round(plain_tps, 2),
+            "assisted_tokens_per_sec": round(assisted_tps, 2),
+            "speedup": round(assisted_tps / max(plain_tps, 1e-6), 2),
+        }
+        if not args.json:
+            spec = result["speculative"]
+            print(f"[✓] draft {args.draft_model} ({spec['draft_tokens']} tokens/step): "
+                  f"acceptance {spec['acceptance_rate']}, {spec['tokens_per_sec']} -> "
+                  f"{spec['assisted_tokens_per_sec']} tok/s (x{spec['speedup']})")
+    result["rss_peak_mb"] = local_llm.rss_mb()
+
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print(f"[+] RSS after generation: {result['rss_peak_mb']} MB")
+
+
+if __name__ == "__main__":
+    main()
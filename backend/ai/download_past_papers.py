@@ -58,29 +58,49 @@ def s3_client():
     )
 
 
-def s3_file_exists(s3, s3_key):
-    try:
-        s3.head_object(Bucket=S3_BUCKET, Key=s3_key)
-        return True
-    except Exception:
-        return False
+def list_s3_objects(s3, course_code):
+    """
+    List every object under the course prefix in one pass.
+    Returns {key: size in bytes} so callers can diff against scraped URLs
+    without a head_object call per PDF.
+    """
+    existing = {}
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=S3_BUCKET, Prefix=f"{course_code}/"):
+        for obj in page.get("Contents", []):
+            existing[obj["Key"]] = obj.get("Size", 0)
+    return existing
 
 
-def upload_to_s3(file_path, s3_key):
-    s3 = s3_client()
+def is_mirrored(existing, s3_key):
+    # Zero-byte objects are left behind by interrupted uploads; treat them as missing
+    return existing.get(s3_key, 0) > 0
+
+
+def missing_pdf_urls(course_code, pdf_urls, existing):
+    missing = []
+    for url in pdf_urls:
+        s3_key = f"{course_code}/{os.path.basename(url)}"
+        if not is_mirrored(existing, s3_key):
+            missing.append(url)
+    return missing
+
+
+def upload_to_s3(file_path, s3_key, s3=None):
+    s3 = s3 or s3_client()
     with open(file_path, "rb") as f:
         s3.upload_fileobj(f, S3_BUCKET, s3_key)
     print(f"[S3] Uploaded {file_path} to {S3_BUCKET}/{s3_key}")
 
 
-def download_pdfs(course_code):
-    # Use a temporary directory for downloads
-    download_dir = tempfile.mkdtemp(prefix=f"{course_code}_pdfs_")
-
-    # 1. Launch visible browser for login
-    chrome_options = Options()
-    chrome_options.add_argument("--start-maximized")
-    chrome_options.add_experimental_option(
+def chrome_options(download_dir, headless=False):
+    options = Options()
+    if headless:
+        options.add_argument("--headless=new")
+        options.add_argument("--window-size=1920,1080")
+    else:
+        options.add_argument("--start-maximized")
+    options.add_experimental_option(
         "prefs",
         {
             "plugins.always_open_pdf_externally": True,
@@ -88,27 +108,15 @@ def download_pdfs(course_code):
             "download.default_directory": download_dir,
         },
     )
-    driver = webdriver.Chrome(options=chrome_options)
-    wait = WebDriverWait(driver, 60)
+    return options
 
-    course_url = f"{BASE_URL}{course_code}"
-    print(f"[+] Opening course page: {course_url}")
-    driver.get(course_url)
-
-    # Check for PDF links BEFORE login/authentication
-    try:
-        pdf_elements_pre = driver.find_elements(By.CSS_SELECTOR, "a[href$='.pdf']")
-        if not pdf_elements_pre:
-            print(f"[!] No past papers found for {course_code}. Exiting early.")
-            driver.quit()
-            shutil.rmtree(download_dir, ignore_errors=True)
-            return False  # Indicate no past papers
-    except Exception as e:
-        print(f"[!] Error checking for PDFs: {e}")
-        driver.quit()
-        shutil.rmtree(download_dir, ignore_errors=True)
-        return False
 
+def wait_for_login(driver, timeout=60):
+    """
+    Click the UQ login button and block until PDF links are visible
+    (i.e. the user finished UQ login + Duo). Returns the PDF link elements.
+    """
+    wait = WebDriverWait(driver, timeout)
     # Click login button
     try:
         login_btn = wait.until(EC.element_to_be_clickable((By.TAG_NAME, "auth-button")))
@@ -120,38 +128,13 @@ def download_pdfs(course_code):
     print("[i] Waiting for UQ login + Duo Mobile authentication...")
 
     # Wait until at least one PDF link appears (login complete)
-    pdf_elements = wait.until(
+    return wait.until(
         EC.presence_of_all_elements_located((By.CSS_SELECTOR, "a[href$='.pdf']"))
     )
-    print(f"[✓] Login detected. Found {len(pdf_elements)} PDF links.")
 
-    # Get PDF URLs immediately to avoid stale element references
-    pdf_urls = []
-    for i, el in enumerate(pdf_elements):
-        try:
-            href = el.get_attribute("href")
-            pdf_urls.append(href)
-        except Exception as e:
-            print(f"[!] Skipping a stale PDF element at index {i}: {e}")
-
-    # Extract cookies from the visible browser
-    cookies = driver.get_cookies()
-    driver.quit()
-    print("[+] Login complete. Switching to headless mode for background downloads...")
 
-    # 2. Launch headless browser for background downloads
-    headless_options = Options()
-    headless_options.add_argument("--headless=new")
-    headless_options.add_argument("--window-size=1920,1080")
-    headless_options.add_experimental_option(
-        "prefs",
-        {
-            "plugins.always_open_pdf_externally": True,
-            "download.prompt_for_download": False,
-            "download.default_directory": download_dir,
-        },
-    )
-    headless_driver = webdriver.Chrome(options=headless_options)
+def headless_driver_with_cookies(cookies, download_dir, course_url):
+    headless_driver = webdriver.Chrome(options=chrome_options(download_dir, headless=True))
     headless_driver.get(course_url)
     # Set cookies in headless browser
     for cookie in cookies:
@@ -163,34 +146,103 @@ def download_pdfs(course_code):
         except Exception as e:
             print(f"[!] Failed to add cookie: {cookie_dict.get('name')}: {e}")
     headless_driver.refresh()
+    return headless_driver
 
-    # Wait for PDF links to appear again (should be instant)
-    wait2 = WebDriverWait(headless_driver, 30)
-    pdf_elements2 = wait2.until(
-        EC.presence_of_all_elements_located((By.CSS_SELECTOR, "a[href$='.pdf']"))
-    )
-    print(f"[✓] Headless mode: Found {len(pdf_elements2)} PDF links.")
 
-    s3 = s3_client()
+def mirror_urls(driver, s3, course_code, pdf_urls, existing, download_dir):
+    """
+    Download every URL not already in `existing` through an authenticated
+    driver and upload it to S3. Returns the number of PDFs uploaded.
+    """
+    uploaded = 0
     # Download PDFs one at a time, skip if already in S3
     for i, url in enumerate(pdf_urls, start=1):
         pdf_name = os.path.basename(url)
         s3_key = f"{course_code}/{pdf_name}"
-        if s3_file_exists(s3, s3_key):
+        if is_mirrored(existing, s3_key):
             print(f"[S3] Skipping {pdf_name}, already exists in S3.")
             continue
         print(f"[{i}/{len(pdf_urls)}] Downloading: {pdf_name}")
-        headless_driver.get(url)
+        driver.get(url)
         time.sleep(5)  # adjust if downloads are slow
         # After download, upload to S3, then delete local file
         local_pdf = os.path.join(download_dir, pdf_name)
         if os.path.exists(local_pdf):
             try:
-                upload_to_s3(local_pdf, s3_key)
+                upload_to_s3(local_pdf, s3_key, s3)
+                existing[s3_key] = os.path.getsize(local_pdf)
                 os.remove(local_pdf)
+                uploaded += 1
                 print(f"[Local] Deleted {local_pdf}")
             except Exception as e:
                 print(f"[S3] Upload failed for {local_pdf}: {e}")
+    return uploaded
+
+
+def download_pdfs(course_code):
+    # Use a temporary directory for downloads
+    download_dir = tempfile.mkdtemp(prefix=f"{course_code}_pdfs_")
+
+    # 1. Launch visible browser for login
+    driver = webdriver.Chrome(options=chrome_options(download_dir))
+
+    course_url = f"{BASE_URL}{course_code}"
+    print(f"[+] Opening course page: {course_url}")
+    driver.get(course_url)
+
+    # Check for PDF links BEFORE login/authentication
+    try:
+        pdf_elements_pre = driver.find_elements(By.CSS_SELECTOR, "a[href$='.pdf']")
+        if not pdf_elements_pre:
+            print(f"[!] No past papers found for {course_code}. Exiting early.")
+            driver.quit()
+            shutil.rmtree(download_dir, ignore_errors=True)
+            return False  # Indicate no past papers
+        pre_login_urls = [el.get_attribute("href") for el in pdf_elements_pre]
+    except Exception as e:
+        print(f"[!] Error checking for PDFs: {e}")
+        driver.quit()
+        shutil.rmtree(download_dir, ignore_errors=True)
+        return False
+
+    # List the course prefix once; every existence check below is an in-memory lookup
+    s3 = s3_client()
+    existing = list_s3_objects(s3, course_code)
+    print(f"[S3] Found {len(existing)} objects under {course_code}/")
+    if not missing_pdf_urls(course_code, pre_login_urls, existing):
+        print(f"[S3] All {len(pre_login_urls)} papers for {course_code} already mirrored. Nothing to download.")
+        driver.quit()
+        shutil.rmtree(download_dir, ignore_errors=True)
+        return True
+
+    pdf_elements = wait_for_login(driver)
+    print(f"[✓] Login detected. Found {len(pdf_elements)} PDF links.")
+
+    # Get PDF URLs immediately to avoid stale element references
+    pdf_urls = []
+    for i, el in enumerate(pdf_elements):
+        try:
+            href = el.get_attribute("href")
+            pdf_urls.append(href)
+        except Exception as e:
+            print(f"[!] Skipping a stale PDF element at index {i}: {e}")
+
+    # Extract cookies from the visible browser
+    cookies = driver.get_cookies()
+    driver.quit()
+    print("[+] Login complete. Switching to headless mode for background downloads...")
+
+    # 2. Launch headless browser for background downloads
+    headless_driver = headless_driver_with_cookies(cookies, download_dir, course_url)
+
+    # Wait for PDF links to appear again (should be instant)
+    wait2 = WebDriverWait(headless_driver, 30)
+    pdf_elements2 = wait2.until(
+        EC.presence_of_all_elements_located((By.CSS_SELECTOR, "a[href$='.pdf']"))
+    )
+    print(f"[✓] Headless mode: Found {len(pdf_elements2)} PDF links.")
+
+    mirror_urls(headless_driver, s3, course_code, pdf_urls, existing, download_dir)
 
     # Clean up temp directory
     shutil.rmtree(download_dir, ignore_errors=True)
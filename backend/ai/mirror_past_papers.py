@@ -0,0 +1,304 @@
+"""
+Batch past-paper mirroring for many courses in one session.
+
+Usage:
+    python ai/mirror_past_papers.py CSSE2310 DECO2500 ...
+    python ai/mirror_past_papers.py --all                 # every course in Supabase `courses`
+    python ai/mirror_past_papers.py --all --workers 3     # 3 courses in parallel
+
+Logs in once (visible browser, UQ login + Duo), then hands the session cookies
+to headless workers. Progress is checkpointed to a JSON state file after every
+course, so an interrupted run picks up where it stopped when re-run with the
+same --state file.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import shutil
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from dotenv import load_dotenv
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+from download_past_papers import (
+    BASE_URL,
+    PROJECT_ROOT,
+    chrome_options,
+    wait_for_login,
+    headless_driver_with_cookies,
+    list_s3_objects,
+    missing_pdf_urls,
+    mirror_urls,
+    s3_client,
+)
+
+load_dotenv()
+sys.stdout.reconfigure(encoding="utf-8")
+
+SUPABASE_URL = os.environ.get("SUPABASE_URL")
+SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
+
+DEFAULT_STATE_PATH = os.path.join(PROJECT_ROOT, "mirror_state.json")
+
+# Queue statuses
+PENDING = "pending"
+DONE = "done"
+NO_PAPERS = "no_papers"
+FAILED = "failed"
+
+# Queued courses tried for the login page when --login-course isn't given
+LOGIN_ATTEMPTS = 3
+
+
+def fetch_all_course_codes(page_size=1000):
+    """Page through the Supabase `courses` table and return every course code."""
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set to use --all")
+    headers = {
+        "apikey": SUPABASE_KEY,
+        "Authorization": f"Bearer {SUPABASE_KEY}",
+    }
+    codes = []
+    offset = 0
+    while True:
+        resp = requests.get(
+            f"{SUPABASE_URL}/rest/v1/courses",
+            headers=headers,
+            params={
+                "select": "name",
+                "order": "name.asc",
+                "limit": str(page_size),
+                "offset": str(offset),
+            },
+            timeout=30,
+        )
+        resp.raise_for_status()
+        rows = resp.json()
+        codes.extend(row["name"].strip().upper() for row in rows if row.get("name"))
+        if len(rows) < page_size:
+            break
+        offset += page_size
+    return codes
+
+
+class MirrorQueue:
+    """
+    Persistent work queue backed by a JSON checkpoint file.
+
+    Each course has a status (pending/done/no_papers/failed), an attempt counter
+    and the number of PDFs uploaded. Courses that fail (including pages that
+    showed no PDF links, which may just be slow) are retried on later runs;
+    no_papers is only recorded once a course has shown none on every attempt. The file is rewritten atomically after every
+    state change so a crash never loses more than the course in flight.
+    """
+
+    def __init__(self, path, max_attempts=3):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self.courses = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.courses = json.load(f).get("courses", {})
+
+    def add(self, course_codes, refresh=False):
+        with self._lock:
+            for code in course_codes:
+                entry = self.courses.get(code)
+                if entry is None:
+                    self.courses[code] = {"status": PENDING, "attempts": 0, "uploaded": 0}
+                elif refresh and entry["status"] in (DONE, NO_PAPERS):
+                    entry["status"] = PENDING
+                    entry["attempts"] = 0
+            self._save()
+
+    def runnable(self):
+        with self._lock:
+            return [
+                code
+                for code, entry in self.courses.items()
+                if entry["status"] == PENDING
+                or (entry["status"] == FAILED and entry["attempts"] < self.max_attempts)
+            ]
+
+    def attempts(self, code):
+        with self._lock:
+            return self.courses.get(code, {}).get("attempts", 0)
+
+    def mark(self, code, status, **fields):
+        with self._lock:
+            entry = self.courses.setdefault(code, {"attempts": 0, "uploaded": 0})
+            entry["status"] = status
+            entry["updated_at"] = datetime.now(timezone.utc).isoformat()
+            if status == FAILED:
+                entry["attempts"] = entry.get("attempts", 0) + 1
+            entry.update(fields)
+            self._save()
+
+    def summary(self):
+        with self._lock:
+            counts = {}
+            for entry in self.courses.values():
+                counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+            return counts
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"courses": self.courses}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def interactive_login(course_codes, timeout=180):
+    """
+    Open a visible browser on a course page, wait for UQ login and return the session cookies.
+
+    Login is detected by PDF links appearing, so a course without past papers
+    never completes it; each of `course_codes` is tried in turn in the same
+    browser. Returns None if none of them showed any PDF links.
+    """
+    download_dir = tempfile.mkdtemp(prefix="mirror_login_")
+    driver = webdriver.Chrome(options=chrome_options(download_dir))
+    try:
+        for course_code in course_codes:
+            course_url = f"{BASE_URL}{course_code}"
+            print(f"[+] Opening {course_url} for login")
+            driver.get(course_url)
+            try:
+                wait_for_login(driver, timeout=timeout)
+            except TimeoutException:
+                print(f"[!] No past papers appeared on {course_code} within {timeout}s")
+                continue
+            print("[✓] Login detected.")
+            return driver.get_cookies()
+        return None
+    finally:
+        driver.quit()
+        shutil.rmtree(download_dir, ignore_errors=True)
+
+
+class SessionExpired(Exception):
+    pass
+
+
+def scrape_pdf_urls(driver, course_code, timeout):
+    """PDF links on a course page, or None if none appeared within `timeout`."""
+    driver.get(f"{BASE_URL}{course_code}")
+    try:
+        elements = WebDriverWait(driver, timeout).until(
+            EC.presence_of_all_elements_located((By.CSS_SELECTOR, "a[href$='.pdf']"))
+        )
+    except TimeoutException:
+        # The login button only shows when the session cookies are no longer accepted
+        if driver.find_elements(By.TAG_NAME, "auth-button"):
+            raise SessionExpired(f"login required on {course_code}")
+        return None
+    urls = []
+    for el in elements:
+        try:
+            urls.append(el.get_attribute("href"))
+        except Exception:
+            pass  # stale element; the rest of the page is still usable
+    return urls
+
+
+def run_worker(worker_id, queue, course_codes, cookies, page_timeout, delay):
+    """Process a slice of the queue with one headless browser and one S3 client.
+
+    Stops early if the session expires; the remaining courses stay runnable.
+    """
+    download_dir = tempfile.mkdtemp(prefix=f"mirror_worker{worker_id}_")
+    driver = headless_driver_with_cookies(cookies, download_dir, BASE_URL)
+    s3 = s3_client()
+    try:
+        for course_code in course_codes:
+            print(f"[w{worker_id}] {course_code}: scraping")
+            try:
+                pdf_urls = scrape_pdf_urls(driver, course_code, page_timeout)
+                if not pdf_urls:
+                    if queue.attempts(course_code) + 1 >= queue.max_attempts:
+                        print(f"[w{worker_id}] {course_code}: no past papers")
+                        queue.mark(course_code, NO_PAPERS, found=0, error=None)
+                    else:
+                        print(f"[w{worker_id}] {course_code}: no PDF links within {page_timeout}s, will retry")
+                        queue.mark(course_code, FAILED, found=0, error=f"no PDF links within {page_timeout}s")
+                    continue
+                existing = list_s3_objects(s3, course_code)
+                missing = missing_pdf_urls(course_code, pdf_urls, existing)
+                uploaded = mirror_urls(driver, s3, course_code, missing, existing, download_dir)
+                print(f"[w{worker_id}] {course_code}: {uploaded}/{len(missing)} uploaded, {len(pdf_urls)} found")
+                if uploaded < len(missing):
+                    # Downloads that never landed (slow or expired session) are retried next run
+                    queue.mark(course_code, FAILED, found=len(pdf_urls), uploaded=uploaded,
+                               error=f"{len(missing) - uploaded} of {len(missing)} PDFs not mirrored")
+                else:
+                    queue.mark(course_code, DONE, found=len(pdf_urls), uploaded=uploaded, error=None)
+            except SessionExpired as e:
+                print(f"[w{worker_id}] Session expired ({e}); stopping. Re-run to log in again.")
+                return
+            except Exception as e:
+                print(f"[w{worker_id}] {course_code}: failed: {e}")
+                queue.mark(course_code, FAILED, error=str(e)[:500])
+            time.sleep(delay)
+    finally:
+        driver.quit()
+        shutil.rmtree(download_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mirror UQ past papers for many courses into S3.")
+    parser.add_argument("courses", nargs="*", help="Course codes to mirror (e.g. CSSE2310)")
+    parser.add_argument("--all", action="store_true", help="Mirror every course in the Supabase courses table")
+    parser.add_argument("--state", default=DEFAULT_STATE_PATH, help="Checkpoint file for the work queue")
+    parser.add_argument("--workers", type=int, default=2, help="Courses processed concurrently (one headless browser each)")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Retries per course before giving up")
+    parser.add_argument("--refresh", action="store_true", help="Re-check courses already marked done")
+    parser.add_argument("--page-timeout", type=int, default=15, help="Seconds to wait for PDF links on a course page")
+    parser.add_argument("--delay", type=float, default=1.0, help="Pause between courses per worker (seconds)")
+    parser.add_argument("--login-course", default=None, help="Course page to log in on (must have past papers)")
+    args = parser.parse_args()
+
+    course_codes = [c.strip().upper() for c in args.courses if c.strip()]
+    if args.all:
+        course_codes.extend(fetch_all_course_codes())
+    course_codes = list(dict.fromkeys(course_codes))
+
+    queue = MirrorQueue(args.state, max_attempts=args.max_attempts)
+    queue.add(course_codes, refresh=args.refresh)
+    todo = queue.runnable()
+    if not todo:
+        print(f"[i] Nothing to do. Queue summary: {queue.summary()}")
+        return
+
+    print(f"[+] {len(todo)} courses queued ({queue.summary()})")
+    login_courses = [args.login_course] if args.login_course else todo[:LOGIN_ATTEMPTS]
+    cookies = interactive_login(login_courses)
+    if cookies is None:
+        print("[!] Login not detected. Pass --login-course with a course that has past papers (e.g. CSSE2310).")
+        sys.exit(1)
+
+    workers = max(1, min(args.workers, len(todo)))
+    slices = [todo[i::workers] for i in range(workers)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(run_worker, i, queue, chunk, cookies, args.page_timeout, args.delay)
+            for i, chunk in enumerate(slices)
+        ]
+        for future in futures:
+            future.result()
+
+    print(f"[+] Mirror run complete. Queue summary: {queue.summary()}")
+
+
+if __name__ == "__main__":
+    main()
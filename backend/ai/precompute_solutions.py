@@ -0,0 +1,114 @@
+"""
+Precompute /ai/solve-paper answers for past-paper pages.
+
+Usage:
+    python ai/precompute_solutions.py                      # every PDF in the pdfs bucket
+    python ai/precompute_solutions.py CSSE2310 DECO2500    # only these courses
+    python ai/precompute_solutions.py --requests-per-min 6 --max-pages 500
+
+Walks every page of every past paper, generates a solution with
+SOLUTION_STORE_MODEL and stores it under
+_cache/solutions/{course}/{file}/{page}/{model}.json. solve_paper answers
+straight from that store and only generates live on a miss.
+
+Each page is exactly one OpenRouter request to that one model (no retries,
+round-robin or fallback models), so the stored answer really comes from the
+model in its key and --requests-per-min counts upstream calls. The job paces
+itself well below the API's own budget so it never competes with students
+for the free-tier rate limit.
+"""
+import os
+import sys
+import time
+import argparse
+
+from dotenv import load_dotenv
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+load_dotenv(os.path.join(PROJECT_ROOT, ".env"))
+
+from routers import ai  # noqa: E402  (needs env loaded first)
+
+
+def iter_past_papers(s3, course_codes=None):
+    """Yield (course_code, filename) for every PDF in the bucket (or the given courses)."""
+    prefixes = [f"{code}/" for code in course_codes] if course_codes else [""]
+    paginator = s3.get_paginator("list_objects_v2")
+    for prefix in prefixes:
+        for page in paginator.paginate(Bucket=ai.S3_BUCKET, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                key = obj["Key"]
+                if key.startswith("_cache/") or not key.endswith(".pdf") or "/" not in key:
+                    continue
+                course_code, filename = key.split("/", 1)
+                yield course_code, filename
+
+
+def stored_pages(s3, course_code, filename):
+    """List the pages that already have a stored solution for the configured model (one request)."""
+    prefix = f"{ai.SOLUTION_STORE_PREFIX}/{course_code}/{filename}/"
+    suffix = os.path.basename(ai.solution_store_key(course_code, filename, 1))
+    pages = set()
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=ai.S3_BUCKET, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            rel = obj["Key"][len(prefix):]
+            page_part, _, name = rel.partition("/")
+            if name == suffix and page_part.isdigit():
+                pages.add(int(page_part))
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute solve-paper answers into the solution store.")
+    parser.add_argument("courses", nargs="*", help="Limit to these course codes")
+    parser.add_argument("--requests-per-min", type=float, default=6.0, help="OpenRouter request budget for this job (one per page)")
+    parser.add_argument("--max-pages", type=int, default=0, help="Stop after generating this many pages (0 = no limit)")
+    parser.add_argument("--backoff", type=float, default=120.0, help="Pause (seconds) after a failed request (e.g. 429)")
+    args = parser.parse_args()
+
+    model = ai.SOLUTION_STORE_MODEL
+    print(f"[i] Generating with {model}")
+    interval = 60.0 / args.requests_per_min if args.requests_per_min > 0 else 0.0
+    s3 = ai.s3_client()
+    generated = skipped = failed = 0
+    course_codes = [c.strip().upper() for c in args.courses if c.strip()]
+
+    for course_code, filename in iter_past_papers(s3, course_codes or None):
+        try:
+            pages = ai.get_page_texts(course_code, filename)
+        except Exception as e:
+            print(f"[!] {course_code}/{filename}: text extraction failed: {e}")
+            failed += 1
+            continue
+        done = stored_pages(s3, course_code, filename)
+        print(f"[+] {course_code}/{filename}: {len(pages)} pages, {len(done)} already stored")
+
+        for page_number, text in enumerate(pages, start=1):
+            if page_number in done or not text.strip():
+                skipped += 1
+                continue
+            started = time.time()
+            user_prompt = ai.build_solve_paper_prompt(text, model)
+            answer, error = ai.openrouter_chat_once(ai.SOLVE_PAPER_SYSTEM_PROMPT, user_prompt, model)
+            if not answer:
+                print(f"[!] {course_code}/{filename} p{page_number}: {error}; backing off {args.backoff:.0f}s")
+                failed += 1
+                time.sleep(args.backoff)
+                continue
+            ai.put_stored_solution(course_code, filename, page_number, answer, s3=s3, model=model)
+            generated += 1
+            print(f"[✓] {course_code}/{filename} p{page_number} stored ({time.time() - started:.1f}s)")
+            if args.max_pages and generated >= args.max_pages:
+                print(f"[i] Reached --max-pages={args.max_pages}")
+                print(f"[+] Done: {generated} generated, {skipped} skipped, {failed} failed")
+                return
+            # Keep to the low-priority budget regardless of how fast the model answered
+            time.sleep(max(0.0, interval - (time.time() - started)))
+
+    print(f"[+] Done: {generated} generated, {skipped} skipped, {failed} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Read-through TTL cache for course rows, keyed by id and by code (`name`).
+
+Courses change rarely but are looked up on most request paths (quiz creation,
+quiz details, enrollment checks, code -> id resolution). Hits are served from
+memory. Misses fetch the full row from Supabase and cache it under both keys.
+Lookups that find nothing are cached for a shorter time (negative caching) so
+repeated bad ids/codes don't reach the database either. The course mutation
+endpoints call put()/invalidate(), and the TTL bounds staleness for writes made
+elsewhere (other workers, sync_uq_catalog.py).
+"""
+import os
+import time
+from collections import OrderedDict
+
+import httpx
+
+from config import get_supabase_headers, SUPABASE_REST_URL, logger
+
+COURSE_CACHE_TTL_SECONDS = float(os.environ.get("COURSE_CACHE_TTL_SECONDS", "300"))
+COURSE_CACHE_NEGATIVE_TTL_SECONDS = float(os.environ.get("COURSE_CACHE_NEGATIVE_TTL_SECONDS", "30"))
+COURSE_CACHE_MAX = int(os.environ.get("COURSE_CACHE_MAX", "5000"))
+
+_MISSING = object()
+
+
+class CourseCache:
+    def __init__(self, ttl=COURSE_CACHE_TTL_SECONDS, negative_ttl=COURSE_CACHE_NEGATIVE_TTL_SECONDS,
+                 max_entries=COURSE_CACHE_MAX):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        # key -> (expires_at, row or None); keys are ("id", id) and ("code", name)
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, row = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return _MISSING
+        return row
+
+    def _set(self, key, row, ttl):
+        self._entries[key] = (time.monotonic() + ttl, row)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def put(self, course: dict):
+        """Cache a course row under its id and code (e.g. after creating or updating it)."""
+        if not course or not course.get("id"):
+            return
+        self._set(("id", str(course["id"])), course, self.ttl)
+        if course.get("name"):
+            self._set(("code", course["name"]), course, self.ttl)
+
+    def invalidate(self, course_id=None, code: str | None = None):
+        """Drop a course by id and/or code, including the other key of its cached row."""
+        for key in [("id", str(course_id)) if course_id else None, ("code", code) if code else None]:
+            if key is None:
+                continue
+            entry = self._entries.pop(key, None)
+            row = entry[1] if entry else None
+            if row:
+                self._entries.pop(("id", str(row["id"])), None)
+                self._entries.pop(("code", row.get("name")), None)
+
+    def clear(self):
+        self._entries.clear()
+
+    async def _lookup(self, client: httpx.AsyncClient, key, params):
+        row = self._get(key)
+        if row is not _MISSING:
+            self.hits += 1
+            return dict(row) if row else None
+        self.misses += 1
+        response = await client.get(
+            f"{SUPABASE_REST_URL}/courses",
+            headers=get_supabase_headers(),
+            params={**params, "select": "*"}
+        )
+        if response.status_code != 200:
+            # Don't cache failures; the caller treats this like "not found" as before
+            logger.warning(f"Course lookup {key} failed: {response.text}")
+            return None
+        rows = response.json()
+        if not rows:
+            self._set(key, None, self.negative_ttl)
+            return None
+        self.put(rows[0])
+        return dict(rows[0])
+
+    async def get_by_id(self, client: httpx.AsyncClient, course_id) -> dict | None:
+        return await self._lookup(client, ("id", str(course_id)), {"id": f"eq.{course_id}"})
+
+    async def get_by_code(self, client: httpx.AsyncClient, code: str) -> dict | None:
+        return await self._lookup(client, ("code", code), {"name": f"eq.{code}"})
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+cache = CourseCache()
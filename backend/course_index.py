@@ -0,0 +1,294 @@
+"""
+In-process search index for course autocomplete.
+
+Holds every row of `courses` in memory and answers code/title lookups without a
+database round trip:
+- prefix matches come from a sorted array of (term, course id) pairs searched
+  with bisect, where the terms are the course code and each word of its title
+- if nothing matches by prefix (typos), fuzzy matches come from a trigram
+  inverted index over the same terms (Jaccard similarity, so "cse2310" and
+  "prinicples" still find CSSE2310)
+
+The index is loaded from Supabase at startup, kept current by the course
+endpoints (upsert/remove on create, update, delete and sync) and fully reloaded
+every COURSE_INDEX_REFRESH_SECONDS to pick up rows written elsewhere
+(e.g. sync_uq_catalog.py).
+"""
+import os
+import re
+import time
+import heapq
+import asyncio
+import threading
+from bisect import bisect_left, insort
+
+import httpx
+
+from config import get_supabase_headers, SUPABASE_REST_URL, logger
+
+COURSE_INDEX_REFRESH_SECONDS = int(os.environ.get("COURSE_INDEX_REFRESH_SECONDS", "900"))
+# Minimum per-word trigram similarity for a fuzzy match
+COURSE_INDEX_FUZZY_THRESHOLD = float(os.environ.get("COURSE_INDEX_FUZZY_THRESHOLD", "0.3"))
+
+_WORD = re.compile(r"[0-9a-z]+")
+
+
+def normalize(text: str) -> str:
+    return " ".join(_WORD.findall((text or "").casefold()))
+
+
+def trigrams(term: str) -> set[str]:
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def course_terms(course: dict) -> set[str]:
+    """Searchable terms of a course: its code and the words of its title."""
+    code = normalize(course.get("name", "")).replace(" ", "")
+    terms = {code} if code else set()
+    terms.update(normalize(course.get("course_title", "")).split())
+    return terms
+
+
+class CourseIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._courses: dict[str, dict] = {}
+        self._terms: dict[str, set[str]] = {}      # course id -> terms
+        self._term_text: dict[str, str] = {}       # course id -> "\0term\0term..." for prefix checks
+        self._keys: dict[str, tuple[str, str]] = {}  # course id -> (normalized code, title)
+        self._sorted: list[tuple[str, str]] = []   # (term, course id), sorted
+        self._codes: list[tuple[str, str]] = []    # (normalized code, course id), sorted: ranking order
+        self._titles: list[tuple[str, str]] = []   # (normalized title, course id), sorted
+        self._term_ids: dict[str, set[str]] = {}   # term -> course ids
+        self._trigrams: dict[str, set[str]] = {}   # trigram -> terms
+        self._gram_counts: dict[str, int] = {}     # term -> number of trigrams
+        self.loaded_at: float | None = None
+
+    def __len__(self):
+        return len(self._courses)
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at is not None
+
+    def load(self, courses: list[dict]):
+        """Replace the index contents with `courses`.
+
+        The sorted arrays are built with one sort each (not an insort per term),
+        outside the lock; searches only wait for the final swap.
+        """
+        fresh = CourseIndex()
+        for course in courses:
+            fresh._add(course, sort=False)
+        fresh._sorted.sort()
+        fresh._codes.sort()
+        fresh._titles.sort()
+        with self._lock:
+            self._courses, self._terms, self._keys = fresh._courses, fresh._terms, fresh._keys
+            self._term_text = fresh._term_text
+            self._sorted, self._codes, self._titles = fresh._sorted, fresh._codes, fresh._titles
+            self._term_ids, self._trigrams = fresh._term_ids, fresh._trigrams
+            self._gram_counts = fresh._gram_counts
+            self.loaded_at = time.time()
+
+    def upsert(self, course: dict):
+        if not course or not course.get("id"):
+            return
+        with self._lock:
+            self._remove(str(course["id"]))
+            self._add(course)
+
+    def remove(self, course_id):
+        with self._lock:
+            self._remove(str(course_id))
+
+    def _add(self, course: dict, sort: bool = True):
+        # sort=False appends to the sorted arrays; the caller sorts them once afterwards
+        place = insort if sort else list.append
+        course_id = str(course["id"])
+        terms = course_terms(course)
+        code = normalize(course.get("name", "")).replace(" ", "")
+        title = normalize(course.get("course_title", ""))
+        self._courses[course_id] = course
+        self._terms[course_id] = terms
+        self._term_text[course_id] = "".join("\0" + term for term in terms)
+        self._keys[course_id] = (code, title)
+        place(self._codes, (code, course_id))
+        place(self._titles, (title, course_id))
+        for term in terms:
+            place(self._sorted, (term, course_id))
+            if term not in self._term_ids:
+                self._term_ids[term] = set()
+                grams = trigrams(term)
+                self._gram_counts[term] = len(grams)
+                for gram in grams:
+                    self._trigrams.setdefault(gram, set()).add(term)
+            self._term_ids[term].add(course_id)
+
+    @staticmethod
+    def _discard(array: list, item: tuple):
+        pos = bisect_left(array, item)
+        if pos < len(array) and array[pos] == item:
+            del array[pos]
+
+    def _remove(self, course_id: str):
+        if course_id not in self._courses:
+            return
+        del self._courses[course_id]
+        code, title = self._keys.pop(course_id)
+        del self._term_text[course_id]
+        self._discard(self._codes, (code, course_id))
+        self._discard(self._titles, (title, course_id))
+        for term in self._terms.pop(course_id):
+            self._discard(self._sorted, (term, course_id))
+            ids = self._term_ids[term]
+            ids.discard(course_id)
+            if not ids:
+                del self._term_ids[term]
+                del self._gram_counts[term]
+                for gram in trigrams(term):
+                    self._trigrams[gram].discard(term)
+
+    @staticmethod
+    def _prefix_range(array: list, prefix: str) -> tuple[int, int]:
+        """[start, end) of the entries of a sorted (key, id) array whose key starts with `prefix`."""
+        return bisect_left(array, (prefix, "")), bisect_left(array, (prefix + "\uffff", ""))
+
+    def _matches(self, course_id: str, markers: list[str]) -> bool:
+        """Every query word (as "\0word") is a prefix of some term of the course."""
+        text = self._term_text[course_id]
+        return all(marker in text for marker in markers)
+
+    def _fuzzy_scores(self, word: str) -> dict[str, float]:
+        """Best trigram similarity of `word` to any term of each course."""
+        grams = trigrams(word)
+        shared: dict[str, int] = {}
+        for gram in grams:
+            for term in self._trigrams.get(gram, ()):
+                shared[term] = shared.get(term, 0) + 1
+        scores: dict[str, float] = {}
+        for term, count in shared.items():
+            similarity = count / (len(grams) + self._gram_counts[term] - count)
+            if similarity < COURSE_INDEX_FUZZY_THRESHOLD:
+                continue
+            for course_id in self._term_ids[term]:
+                if similarity > scores.get(course_id, 0):
+                    scores[course_id] = similarity
+        return scores
+
+    def _prefix_search(self, words: list[str], limit: int) -> list[str]:
+        """Ids of prefix matches in rank order, stopping as soon as `limit` are found.
+
+        Ranks: exact code, code prefix, title starting with the query, then any
+        course where every word prefixes one of its terms; ties by code.
+        """
+        code, phrase = "".join(words), " ".join(words)
+        # Exact code and code-prefix matches come out of the code array already in rank order
+        start, end = self._prefix_range(self._codes, code)
+        found = [course_id for _, course_id in self._codes[start:min(end, start + limit)]]
+        if len(found) >= limit:
+            return found
+        seen = set(found)
+
+        start, end = self._prefix_range(self._titles, phrase)
+        title_ids = (course_id for _, course_id in self._titles[start:end] if course_id not in seen)
+        found += heapq.nsmallest(limit - len(found), title_ids, key=lambda i: self._keys[i][0])
+        if len(found) >= limit:
+            return found
+        seen.update(found)
+
+        # Remaining matches, by code. When the narrowest word's prefix range covers
+        # a large share of the catalogue, matches are dense and walking courses in
+        # code order finds enough within a few entries. Otherwise (or if the walk
+        # doesn't pan out) the range's ids are intersected with the other words'
+        # ranges and ranked. Either way the work is bounded by that range.
+        ranges = sorted(((self._prefix_range(self._sorted, word), "\0" + word) for word in words),
+                        key=lambda r: r[0][1] - r[0][0])
+        size = ranges[0][0][1] - ranges[0][0][0]
+        if not size:
+            return found
+        wanted = limit - len(found)
+        markers = [marker for _, marker in ranges]
+        if size * size > 10 * wanted * len(self._codes):
+            walked = []
+            for _, course_id in self._codes[:size // 10]:
+                if course_id not in seen and self._matches(course_id, markers):
+                    walked.append(course_id)
+                    if len(walked) >= wanted:
+                        return found + walked
+
+        (start, end), _ = ranges[0]
+        candidates = {course_id for _, course_id in self._sorted[start:end]} - seen
+        for (start, end), marker in ranges[1:]:
+            if end - start <= 8 * len(candidates):
+                candidates &= {course_id for _, course_id in self._sorted[start:end]}
+            else:
+                candidates = {i for i in candidates if marker in self._term_text[i]}
+        found += heapq.nsmallest(wanted, candidates, key=lambda i: self._keys[i][0])
+        return found
+
+    def search(self, query: str, limit: int = 10, fuzzy: bool = True) -> list[dict]:
+        """Courses matching `query`: code matches, then title-word prefix matches; fuzzy matches if there are none."""
+        words = normalize(query).split()
+        if not words or limit <= 0:
+            return []
+        with self._lock:
+            found = self._prefix_search(words, limit)
+            if found or not fuzzy:
+                return [self._courses[i] for i in found]
+
+            code = "".join(words)
+            totals: dict[str, float] = {}
+            for word in words:
+                for course_id, score in self._fuzzy_scores(word).items():
+                    totals[course_id] = totals.get(course_id, 0) + score / len(words)
+            if len(words) > 1:  # a code typed with a space, e.g. "csse 231"
+                for course_id, score in self._fuzzy_scores(code).items():
+                    totals[course_id] = max(totals.get(course_id, 0), score)
+            fuzzy_ids = heapq.nsmallest(
+                limit,
+                (i for i, score in totals.items() if score >= COURSE_INDEX_FUZZY_THRESHOLD),
+                key=lambda i: (-totals[i], self._courses[i].get("name", ""))
+            )
+            return [self._courses[i] for i in fuzzy_ids]
+
+
+index = CourseIndex()
+
+
+async def fetch_all_courses(client: httpx.AsyncClient, page_size: int = 1000) -> list[dict]:
+    courses, offset = [], 0
+    while True:
+        response = await client.get(
+            f"{SUPABASE_REST_URL}/courses",
+            headers=get_supabase_headers(),
+            params={"select": "*", "order": "id.asc", "limit": str(page_size), "offset": str(offset)}
+        )
+        response.raise_for_status()
+        page = response.json()
+        courses.extend(page)
+        if len(page) < page_size:
+            return courses
+        offset += page_size
+
+
+async def reload():
+    started = time.time()
+    async with httpx.AsyncClient(timeout=60) as client:
+        courses = await fetch_all_courses(client)
+    # Building the arrays is CPU-bound; keep it off the event loop
+    await asyncio.to_thread(index.load, courses)
+    logger.info(f"Course index loaded: {len(courses)} courses in {time.time() - started:.2f}s")
+
+
+async def keep_fresh():
+    """Load the index, then reload it every COURSE_INDEX_REFRESH_SECONDS (run as a background task)."""
+    while True:
+        try:
+            await reload()
+        except Exception as e:
+            logger.error(f"Course index reload failed: {e}")
+        if COURSE_INDEX_REFRESH_SECONDS <= 0:
+            return
+        await asyncio.sleep(COURSE_INDEX_REFRESH_SECONDS)
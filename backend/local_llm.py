@@ -0,0 +1,824 @@
+"""
+Local Hugging Face fallback model, served from a dedicated worker process.
+
+The API process never imports torch. Generation requests are put on a
+multiprocessing queue read by one worker process that owns the model; replies
+come back on a second queue and a dispatcher thread hands them to the waiting
+future (or stream) by request id. The model is loaded by the worker as soon as
+it starts, so neither the event loop nor the API process's GIL is held while
+the model loads or runs generate().
+
+Non-streaming requests that arrive together (within LLM_LOCAL_BATCH_WINDOW_MS,
+or while the previous batch was running) are left-padded into one batched
+generate() call; each row stops at its own max_new_tokens / stop strings.
+
+Usage from the API:
+    local_llm.service.start()                        # at startup, returns immediately
+    text = local_llm.generate(system, user)          # sync (threadpool / scripts)
+    text = await local_llm.agenerate(system, user)   # async endpoints
+    for chunk in local_llm.stream(system, user): ...
+"""
+import os
+import copy
+import hashlib
+import time
+import uuid
+import queue
+import asyncio
+import threading
+import multiprocessing as mp
+from collections import OrderedDict
+from concurrent.futures import Future, InvalidStateError, TimeoutError as FutureTimeout
+from datetime import datetime, timezone
+
+LLM_LOCAL_MODEL = os.environ.get("LLM_LOCAL_MODEL", "TinyLlama/TinyLlama-1.1B-Chat-v1.0")
+LLM_LOCAL_MAX_NEW_TOKENS = int(os.environ.get("LLM_LOCAL_MAX_NEW_TOKENS", "256"))
+# Start the worker (and load the model) when the API starts
+LLM_LOCAL_ENABLED = os.environ.get("LLM_LOCAL_ENABLED", "true").lower() == "true"
+# Seconds a caller waits for a local answer before falling through
+LLM_LOCAL_TIMEOUT = float(os.environ.get("LLM_LOCAL_TIMEOUT", "300"))
+# Requests waiting on the worker before new ones are refused (they fall through to the degraded answer)
+LLM_LOCAL_QUEUE_MAX = int(os.environ.get("LLM_LOCAL_QUEUE_MAX", "32"))
+# Micro-batching: after the first request arrives, wait this long for more and run them as one generate()
+LLM_LOCAL_BATCH_WINDOW_MS = int(os.environ.get("LLM_LOCAL_BATCH_WINDOW_MS", "30"))
+LLM_LOCAL_MAX_BATCH = int(os.environ.get("LLM_LOCAL_MAX_BATCH", "8"))
+# CPU inference tuning (see ai/benchmark_local_model.py to pick values for a host):
+#   LLM_LOCAL_QUANTIZE: none | int8 (dynamic int8 quantization of Linear layers, CPU only)
+#   LLM_LOCAL_DTYPE: auto (float16 on GPU, float32 on CPU) | stored (checkpoint dtype,
+#                    weights stay memory-mapped) | float32 | bfloat16 | float16
+#   LLM_LOCAL_THREADS / LLM_LOCAL_INTEROP_THREADS: torch thread pools (0 = torch default)
+LLM_LOCAL_QUANTIZE = os.environ.get("LLM_LOCAL_QUANTIZE", "none").lower()
+LLM_LOCAL_DTYPE = os.environ.get("LLM_LOCAL_DTYPE", "auto").lower()
+LLM_LOCAL_THREADS = int(os.environ.get("LLM_LOCAL_THREADS", "0"))
+LLM_LOCAL_INTEROP_THREADS = int(os.environ.get("LLM_LOCAL_INTEROP_THREADS", "0"))
+# Speculative decoding: a small draft model proposes LLM_LOCAL_DRAFT_TOKENS tokens per step and the
+# local model verifies them in one forward pass (single requests only; batches decode normally).
+# Empty = off. Use a draft sharing the local model's tokenizer (e.g. a 68M Llama for TinyLlama).
+LLM_LOCAL_DRAFT_MODEL = os.environ.get("LLM_LOCAL_DRAFT_MODEL", "").strip()
+LLM_LOCAL_DRAFT_TOKENS = int(os.environ.get("LLM_LOCAL_DRAFT_TOKENS", "5"))
+# Static prompt prefixes (system turn, fixed instructions) whose KV cache is kept for reuse (0 = off)
+LLM_LOCAL_PREFIX_CACHE_MAX = int(os.environ.get("LLM_LOCAL_PREFIX_CACHE_MAX", "4"))
+# Stop the worker process after this many idle seconds (0 = keep it running); the next request respawns it
+LLM_LOCAL_IDLE_UNLOAD_SECONDS = float(os.environ.get("LLM_LOCAL_IDLE_UNLOAD_SECONDS", "1800"))
+
+# The chat template's turn markers: TinyLlama tends to carry on with an invented next turn
+DEFAULT_STOP = ("<|user|>", "<|system|>", "</s>")
+
+_STREAM_END = object()
+
+
+def split_prompt(system_prompt: str, user_prompt: str, static_prefix: str = "") -> tuple[str, str]:
+    """Chat prompt split into (static prefix, per-request rest).
+
+    The prefix is the system turn plus `static_prefix` when the user prompt starts
+    with it (e.g. fixed instructions ahead of the page text).
+    """
+    if not static_prefix or not user_prompt.startswith(static_prefix):
+        static_prefix = ""
+    prefix = f"<|system|>\n{system_prompt}\n<|user|>\n{static_prefix}"
+    return prefix, f"{user_prompt[len(static_prefix):]}\n<|assistant|>\n"
+
+
+def format_prompt(system_prompt: str, user_prompt: str) -> str:
+    return "".join(split_prompt(system_prompt, user_prompt))
+
+
+def load_options(**overrides) -> dict:
+    options = {
+        "quantize": LLM_LOCAL_QUANTIZE,
+        "dtype": LLM_LOCAL_DTYPE,
+        "threads": LLM_LOCAL_THREADS,
+        "interop_threads": LLM_LOCAL_INTEROP_THREADS,
+    }
+    options.update({k: v for k, v in overrides.items() if v is not None})
+    return options
+
+
+def rss_mb(pid: int | None = None) -> float | None:
+    """Resident memory in MB of this process (or `pid`; None if it can't be read)."""
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError, IndexError):
+        if pid:
+            return None
+        import resource
+        # No /proc (macOS): fall back to the peak, reported in bytes there
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**20, 1)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+# ---------------- Worker process ----------------
+def _load_model(model_name: str, options: dict | None = None):
+    """Load model + tokenizer per `options` (see load_options). Returns (model, tokenizer, info)."""
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    import torch
+
+    options = options or load_options()
+    started = time.time()
+    if options["threads"]:
+        torch.set_num_threads(options["threads"])
+    if options["interop_threads"]:
+        torch.set_num_interop_threads(options["interop_threads"])
+    cuda = torch.cuda.is_available()
+    quantize = options["quantize"] if options["quantize"] in ("int8",) and not cuda else "none"
+
+    if options["dtype"] == "stored":
+        torch_dtype = "auto"
+    elif options["dtype"] == "auto":
+        torch_dtype = torch.float16 if cuda else torch.float32
+    else:
+        torch_dtype = getattr(torch, options["dtype"])
+    if quantize == "int8":
+        torch_dtype = torch.float32  # dynamic quantization works from float32 Linear weights
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    # low_cpu_mem_usage loads safetensors checkpoints through mmap instead of
+    # materialising a second copy of the state dict
+    model = AutoModelForCausalLM.from_pretrained(
+        model_name,
+        torch_dtype=torch_dtype,
+        low_cpu_mem_usage=True,
+        device_map="auto" if cuda else None,
+    )
+    model.eval()
+    if quantize == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    # Batched generate needs a pad token and left padding so every prompt ends at the same position
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"
+    info = {
+        "load_seconds": round(time.time() - started, 2),
+        "rss_mb": rss_mb(),
+        "quantize": quantize,
+        "dtype": str(next(model.parameters()).dtype).replace("torch.", ""),
+        "threads": torch.get_num_threads(),
+        "device": "cuda" if cuda else "cpu",
+    }
+    return model, tokenizer, info
+
+
+def _load_draft(draft_name: str, options: dict, tokenizer) -> dict:
+    """generate() kwargs for assisted decoding with `draft_name` as the draft model."""
+    draft, draft_tokenizer, _ = _load_model(draft_name, options)
+    draft.generation_config.num_assistant_tokens = LLM_LOCAL_DRAFT_TOKENS
+    kwargs = {"assistant_model": draft}
+    if draft_tokenizer.get_vocab() != tokenizer.get_vocab():
+        # Universal assisted decoding: proposals are re-tokenized between the two vocabularies
+        kwargs.update(tokenizer=tokenizer, assistant_tokenizer=draft_tokenizer)
+    return kwargs
+
+
+def _generation_kwargs(tokenizer, max_new_tokens: int) -> dict:
+    return dict(
+        max_new_tokens=max_new_tokens,
+        temperature=0.7,
+        do_sample=True,
+        top_p=0.9,
+        pad_token_id=tokenizer.eos_token_id,
+    )
+
+
+def _stop_index(text: str, stop) -> int:
+    return min((i for i in (text.find(marker) for marker in stop) if i != -1), default=-1)
+
+
+def _cut_at_stop(text: str, stop) -> str:
+    cut = _stop_index(text, stop)
+    return (text[:cut] if cut != -1 else text).strip()
+
+
+def _batch_stopping(tokenizer, prompt_len: int, limits: list[int], stops: list[tuple]):
+    """Per-row stopping: each request ends at its own max_new_tokens or stop string."""
+    import torch
+    from transformers import StoppingCriteria
+
+    class BatchStopping(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            generated = input_ids.shape[1] - prompt_len
+            done = []
+            for row, limit, stop in zip(input_ids, limits, stops):
+                if generated >= limit:
+                    done.append(True)
+                    continue
+                # Only the tail can contain a stop string that just completed
+                tail = tokenizer.decode(row[max(prompt_len, input_ids.shape[1] - 16):])
+                done.append(any(marker in tail for marker in stop))
+            return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+    return BatchStopping()
+
+
+class PrefixCache:
+    """KV caches of static prompt prefixes, keyed by prefix hash (LRU).
+
+    Only the per-request remainder of a prompt is then prefilled: generate()
+    receives the full input ids plus a copy of the prefix's cache and skips the
+    positions the cache already covers. Single-sequence only: with left padding
+    a shared prefix would sit at different positions in each batch row.
+    """
+
+    def __init__(self, max_entries: int = LLM_LOCAL_PREFIX_CACHE_MAX):
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+
+    def inputs(self, model, tokenizer, prefix: str, rest: str) -> dict:
+        """generate() kwargs for prefix + rest, with the prefix's KV cache attached."""
+        import torch
+        from transformers import DynamicCache
+
+        key = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            prefix_ids = tokenizer(prefix, return_tensors="pt")["input_ids"].to(model.device)
+            with torch.no_grad():
+                cache = model(input_ids=prefix_ids, past_key_values=DynamicCache(), use_cache=True).past_key_values
+            entry = self.entries[key] = (prefix_ids, cache)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            self.reused_tokens += entry[0].shape[1]
+        prefix_ids, cache = entry
+        # The rest is tokenized on its own (no BOS) so the ids line up with the cached prefix
+        rest_ids = tokenizer(rest, return_tensors="pt", add_special_tokens=False)["input_ids"].to(model.device)
+        input_ids = torch.cat([prefix_ids, rest_ids], dim=1)
+        return {
+            "input_ids": input_ids,
+            "attention_mask": torch.ones_like(input_ids),
+            # generate() extends the cache in place; keep the stored one pristine
+            "past_key_values": copy.deepcopy(cache),
+        }
+
+    def stats(self) -> dict:
+        return {
+            "prefix_cache_entries": len(self.entries),
+            "prefix_cache_hits": self.hits,
+            "prefix_cache_misses": self.misses,
+            "prefix_tokens_reused": self.reused_tokens,
+        }
+
+
+def _generate_batch(
+    model,
+    tokenizer,
+    prompts: list[str],
+    limits: list[int],
+    stops: list[tuple],
+    inputs: dict | None = None,
+    extra: dict | None = None,
+) -> tuple[list[str], int]:
+    """One padded generate() for several prompts (or prebuilt `inputs`, e.g. from PrefixCache).
+
+    `extra` is passed through to generate() (e.g. the draft model kwargs).
+
+    Returns each answer cut to its own limit/stop, and the number of tokens generated.
+    """
+    import torch
+    from transformers import StoppingCriteriaList
+
+    if inputs is None:
+        inputs = tokenizer(prompts, return_tensors="pt", padding=True, return_token_type_ids=False).to(model.device)
+    prompt_len = inputs["input_ids"].shape[1]
+    with torch.no_grad():
+        out = model.generate(
+            **inputs,
+            **_generation_kwargs(tokenizer, max(limits)),
+            **(extra or {}),
+            stopping_criteria=StoppingCriteriaList([_batch_stopping(tokenizer, prompt_len, limits, stops)]),
+        )
+    answers = []
+    generated = 0
+    for row, limit, stop in zip(out, limits, stops):
+        # Decode only the new tokens (the prompt is echoed back by generate)
+        new_tokens = row[prompt_len:prompt_len + limit]
+        generated += int((new_tokens != tokenizer.pad_token_id).sum())
+        text = tokenizer.decode(new_tokens, skip_special_tokens=True)
+        answers.append(_cut_at_stop(text, stop))
+    return answers, generated
+
+
+def _generate_stream(
+    model,
+    tokenizer,
+    prompt: str,
+    max_new_tokens: int,
+    emit,
+    stop=DEFAULT_STOP,
+    inputs: dict | None = None,
+    extra: dict | None = None,
+):
+    from transformers import StoppingCriteriaList, TextIteratorStreamer
+
+    if inputs is None:
+        inputs = tokenizer(prompt, return_tensors="pt", return_token_type_ids=False).to(model.device)
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    stopping = _batch_stopping(tokenizer, inputs["input_ids"].shape[1], [max_new_tokens], [tuple(stop)])
+    thread = threading.Thread(
+        target=model.generate,
+        kwargs=dict(
+            **inputs,
+            streamer=streamer,
+            stopping_criteria=StoppingCriteriaList([stopping]),
+            **_generation_kwargs(tokenizer, max_new_tokens),
+            **(extra or {}),
+        ),
+        daemon=True,
+    )
+    thread.start()
+    # Hold back enough text to catch a stop string split across chunks
+    holdback = max((len(marker) for marker in stop), default=0)
+    pending = ""
+    stopped = False
+    for text in streamer:
+        if stopped or not text:
+            continue
+        pending += text
+        cut = _stop_index(pending, stop)
+        if cut != -1:
+            if pending[:cut].rstrip():
+                emit(pending[:cut].rstrip())
+            pending, stopped = "", True
+        elif len(pending) > holdback:
+            emit(pending[:-holdback] if holdback else pending)
+            pending = pending[-holdback:] if holdback else ""
+    if pending and not stopped:
+        emit(pending)
+    thread.join()
+
+
+def _collect_batch(requests, first, window: float, max_batch: int) -> list:
+    """Gather requests arriving within `window` seconds of `first` (up to max_batch)."""
+    batch = [first]
+    deadline = time.time() + window
+    while len(batch) < max_batch:
+        try:
+            # Requests queued while the previous batch ran are taken without waiting
+            msg = requests.get(timeout=max(0.0, deadline - time.time())) if window else requests.get_nowait()
+        except queue.Empty:
+            break
+        batch.append(msg)
+        if msg is None:
+            break
+    return batch
+
+
+def _worker_main(model_name: str, options: dict, requests, replies):
+    """Entry point of the worker process: load the model, then serve requests until None.
+
+    Idle unloading is done by the service stopping this process (see
+    LocalModelService._stop_if_idle): the torch/transformers runtime stays
+    resident even after the model is dropped, so only exiting frees it.
+    """
+    try:
+        model, tokenizer, info = _load_model(model_name, options)
+        assist = {}
+        if LLM_LOCAL_DRAFT_MODEL:
+            try:
+                assist = _load_draft(LLM_LOCAL_DRAFT_MODEL, options, tokenizer)
+                info["draft_model"] = LLM_LOCAL_DRAFT_MODEL
+            except Exception as e:
+                # The draft is only an accelerator; serve without it
+                info["draft_error"] = f"{type(e).__name__}: {e}"
+                print(f"Draft model {LLM_LOCAL_DRAFT_MODEL} failed to load: {e}")
+            info["rss_mb"] = rss_mb()
+    except Exception as e:
+        replies.put(("failed", None, f"{type(e).__name__}: {e}"))
+        return
+    replies.put(("ready", None, info))
+    prefix_cache = PrefixCache()
+
+    def prefixed_inputs(prefix: str, rest: str):
+        if not LLM_LOCAL_PREFIX_CACHE_MAX:
+            return None
+        try:
+            return prefix_cache.inputs(model, tokenizer, prefix, rest)
+        except Exception as e:
+            print(f"Prefix cache unavailable, prefilling the full prompt: {e}")
+            return None
+
+    stats = {
+        "batches": 0,
+        "batched_requests": 0,
+        "max_batch_seen": 0,
+        "generated_tokens": 0,
+        "generate_seconds": 0.0,
+        "assisted_requests": 0,
+    }
+    window = LLM_LOCAL_BATCH_WINDOW_MS / 1000.0
+    running = True
+    while running:
+        batch = _collect_batch(requests, requests.get(), window, LLM_LOCAL_MAX_BATCH)
+        if batch[-1] is None:
+            running = False
+            batch.pop()
+        plain = []
+        for req_id, system_prompt, user_prompt, static_prefix, max_new_tokens, stream, stop in batch:
+            prefix, rest = split_prompt(system_prompt, user_prompt, static_prefix)
+            if not stream:
+                plain.append((req_id, prefix + rest, max_new_tokens, tuple(stop), prefix, rest))
+                continue
+            # Streams need their own generate() to emit tokens as they come
+            try:
+                _generate_stream(
+                    model, tokenizer, prefix + rest, max_new_tokens,
+                    lambda text, req_id=req_id: replies.put(("token", req_id, text)),
+                    stop,
+                    prefixed_inputs(prefix, rest),
+                    assist,
+                )
+                stats["assisted_requests"] += bool(assist)
+                replies.put(("result", req_id, None))
+            except Exception as e:
+                replies.put(("error", req_id, f"{type(e).__name__}: {e}"))
+        if plain:
+            started = time.time()
+            try:
+                # A lone request reuses its prefix's KV cache and the draft model;
+                # a padded batch prefills in full and decodes normally
+                single = len(plain) == 1
+                answers, generated = _generate_batch(
+                    model,
+                    tokenizer,
+                    [p[1] for p in plain],
+                    [p[2] for p in plain],
+                    [p[3] for p in plain],
+                    prefixed_inputs(plain[0][4], plain[0][5]) if single else None,
+                    assist if single else None,
+                )
+                stats["assisted_requests"] += bool(single and assist)
+                for (req_id, *_), answer in zip(plain, answers):
+                    replies.put(("result", req_id, answer))
+            except Exception as e:
+                generated = 0
+                for req_id, *_ in plain:
+                    replies.put(("error", req_id, f"{type(e).__name__}: {e}"))
+            stats["batches"] += 1
+            stats["batched_requests"] += len(plain)
+            stats["max_batch_seen"] = max(stats["max_batch_seen"], len(plain))
+            stats["generated_tokens"] += generated
+            stats["generate_seconds"] += time.time() - started
+        if not batch:
+            continue
+        replies.put(("stats", None, {
+            **stats,
+            "generate_seconds": round(stats["generate_seconds"], 2),
+            "tokens_per_sec": round(stats["generated_tokens"] / max(stats["generate_seconds"], 1e-6), 2),
+            **prefix_cache.stats(),
+            "rss_mb": rss_mb(),
+        }))
+
+
+# ---------------- API side ----------------
+class LocalModelService:
+    """Owns the worker process and routes replies back to callers."""
+
+    def __init__(self, model_name: str, max_new_tokens: int, options: dict | None = None):
+        self.model_name = model_name
+        self.max_new_tokens = max_new_tokens
+        self.options = options or load_options()
+        self._lock = threading.Lock()
+        self._pending: dict[str, Future | queue.Queue] = {}
+        self._process = None
+        self._requests = None
+        self._replies = None
+        self._ready = threading.Event()
+        self._loaded = False
+        self._idle_stopped = False  # worker exited after idling; the next request respawns it
+        self._last_activity = time.time()
+        self._error: str | None = None
+        self._info: dict = {}
+        self._lifecycle = {"loads": 0, "unloads": 0, "last_load_at": None, "last_unload_at": None}
+
+    # -- lifecycle --
+    def start(self):
+        """Spawn the worker (idempotent). The model loads in the background."""
+        with self._lock:
+            if self._process is not None and self._process.is_alive():
+                return
+            self._ready.clear()
+            self._error = None
+            self._info = {}
+            self._spawn()
+
+    def _spawn(self):
+        # Called with self._lock held
+        ctx = mp.get_context("spawn")  # never fork a process that may hold threads/sockets
+        self._requests = ctx.Queue()
+        self._replies = ctx.Queue()
+        self._idle_stopped = False
+        self._last_activity = time.time()
+        self._process = ctx.Process(
+            target=_worker_main,
+            args=(self.model_name, self.options, self._requests, self._replies),
+            name="local-llm-worker",
+            daemon=True,
+        )
+        self._process.start()
+        threading.Thread(target=self._dispatch, args=(self._process, self._replies), daemon=True).start()
+
+    def _respawn(self):
+        # Called with self._lock held, after an idle stop
+        print(f"Local model {self.model_name}: respawning the worker after idle stop")
+        self._spawn()
+
+    def wake(self):
+        """Respawn an idle-stopped worker ahead of the next request (no-op otherwise)."""
+        with self._lock:
+            if self._idle_stopped:
+                self._respawn()
+
+    def _stop_if_idle(self, process) -> bool:
+        """Stop the worker once it has been idle for LLM_LOCAL_IDLE_UNLOAD_SECONDS.
+
+        The whole process exits, so the model and the torch/transformers
+        runtime are returned to the OS. The service stays available: the next
+        request respawns the worker and waits while it reloads.
+        """
+        with self._lock:
+            if (
+                not LLM_LOCAL_IDLE_UNLOAD_SECONDS
+                or self._process is not process
+                or not self._loaded
+                or self._pending
+                or time.time() - self._last_activity < LLM_LOCAL_IDLE_UNLOAD_SECONDS
+            ):
+                return False
+            freed_mb = rss_mb(process.pid)
+            self._process = None
+            self._loaded = False
+            self._idle_stopped = True
+            self._lifecycle["unloads"] += 1
+            self._lifecycle["last_unload_at"] = _now()
+            self._info["last_unload_rss_mb"] = freed_mb
+            # Under the lock, so no request can be queued to this worker after its stop message
+            self._requests.put(None)
+        process.join(10)
+        if process.is_alive():
+            process.terminate()
+        print(f"Local model {self.model_name} idle for {LLM_LOCAL_IDLE_UNLOAD_SECONDS:.0f}s: "
+              f"worker stopped ({freed_mb} MB freed)")
+        return True
+
+    def shutdown(self, timeout: float = 5.0):
+        with self._lock:
+            process, self._process = self._process, None
+            self._idle_stopped = False
+            self._ready.clear()
+            self._loaded = False
+            if process is None:
+                return
+            self._requests.put(None)
+        process.join(timeout)
+        if process.is_alive():
+            process.terminate()
+        self._fail_pending("Local model worker stopped")
+
+    def wait_ready(self, timeout: float | None = None) -> bool:
+        return self._ready.wait(timeout) and self._error is None
+
+    def available(self) -> bool:
+        return self._ready.is_set() and self._error is None
+
+    def warm(self) -> bool:
+        """Model loaded and serving now (not unloaded, loading or failed)."""
+        return self.available() and self._loaded
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def status(self) -> dict:
+        """State, queue depth, worker memory and load/unload/generation metrics."""
+        if self._error:
+            state = "failed"
+        elif self._loaded:
+            state = "ready"
+        elif self._idle_stopped:
+            state = "unloaded"  # worker stopped after idling; respawned by the next request
+        elif self._process is not None:
+            state = "loading"
+        else:
+            state = "stopped"
+        with self._lock:
+            pending = len(self._pending)
+        process = self._process
+        return {
+            "model": self.model_name,
+            "state": state,
+            "error": self._error,
+            "pending": pending,
+            "idle_unload_seconds": LLM_LOCAL_IDLE_UNLOAD_SECONDS,
+            **self._info,
+            **self._lifecycle,
+            # Live figure, unlike the rss_mb snapshot reported with the last event
+            "worker_rss_mb": rss_mb(process.pid) if process is not None and process.is_alive() else None,
+        }
+
+    # -- reply routing --
+    def _dispatch(self, process, replies):
+        while True:
+            try:
+                kind, req_id, payload = replies.get(timeout=1.0)
+            except queue.Empty:
+                if self._stop_if_idle(process):
+                    return
+                if not process.is_alive():
+                    if self._process is process:  # crashed (e.g. OOM-killed) rather than shut down
+                        self._error = self._error or f"Local model worker exited (code {process.exitcode})"
+                        self._ready.set()
+                    self._fail_pending(self._error or "Local model worker stopped")
+                    return
+                continue
+            except (EOFError, OSError):
+                return
+            self._last_activity = time.time()
+            if kind == "ready":
+                self._info.update(payload)
+                self._loaded = True
+                self._lifecycle["loads"] += 1
+                self._lifecycle["last_load_at"] = _now()
+                self._ready.set()
+                print(f"Local model {self.model_name} ready in {payload.get('load_seconds')}s")
+                continue
+            if kind == "stats":
+                self._info.update(payload)
+                continue
+            if kind == "failed":
+                self._error = payload
+                self._ready.set()
+                print(f"Local model {self.model_name} failed to load: {payload}")
+                continue
+            with self._lock:
+                waiter = self._pending.get(req_id) if kind == "token" else self._pending.pop(req_id, None)
+            if waiter is None:
+                continue  # caller timed out and went away
+            if isinstance(waiter, queue.Queue):
+                if kind == "token":
+                    waiter.put(payload)
+                elif kind == "error":
+                    waiter.put(RuntimeError(payload))
+                else:
+                    waiter.put(_STREAM_END)
+                continue
+            try:
+                if kind == "error":
+                    waiter.set_exception(RuntimeError(payload))
+                else:
+                    waiter.set_result(payload or "")
+            except InvalidStateError:
+                pass  # cancelled by an agenerate() timeout just before the reply arrived
+
+    def _fail_pending(self, reason: str):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for waiter in pending.values():
+            if isinstance(waiter, queue.Queue):
+                waiter.put(RuntimeError(reason))
+            elif not waiter.done():
+                waiter.set_exception(RuntimeError(reason))
+
+    def _submit(
+        self,
+        waiter,
+        system_prompt: str,
+        user_prompt: str,
+        max_new_tokens: int | None,
+        stream: bool,
+        stop=None,
+        static_prefix: str = "",
+    ):
+        """Queue a request for the worker; returns its id, or None if the model isn't ready or the queue is full.
+
+        Concurrent requests are batched by the worker; each keeps its own
+        max_new_tokens and stop strings (default: the chat turn markers).
+        `static_prefix` marks the start of `user_prompt` that is the same across
+        requests, so its KV cache is reused along with the system prompt's.
+        """
+        if not self.available():
+            return None
+        req_id = uuid.uuid4().hex
+        with self._lock:
+            if len(self._pending) >= LLM_LOCAL_QUEUE_MAX:
+                return None
+            if self._idle_stopped:
+                self._respawn()
+            elif self._process is None:
+                return None  # shut down
+            self._pending[req_id] = waiter
+            self._last_activity = time.time()
+            # Queued under the lock so an idle stop can't slip in between
+            self._requests.put((
+                req_id,
+                system_prompt,
+                user_prompt,
+                static_prefix,
+                max_new_tokens or self.max_new_tokens,
+                stream,
+                tuple(stop or DEFAULT_STOP),
+            ))
+        return req_id
+
+    def _forget(self, req_id: str):
+        with self._lock:
+            self._pending.pop(req_id, None)
+
+    # -- public API --
+    def generate(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        max_new_tokens: int | None = None,
+        timeout: float = LLM_LOCAL_TIMEOUT,
+        stop=None,
+        static_prefix: str = "",
+    ) -> str:
+        """Blocking generate; returns "" when the local model can't answer in time."""
+        future = Future()
+        req_id = self._submit(
+            future, system_prompt, user_prompt, max_new_tokens, stream=False, stop=stop, static_prefix=static_prefix
+        )
+        if req_id is None:
+            return ""
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            print(f"Local model timed out after {timeout}s")
+        except Exception as e:
+            print(f"Local model generation failed: {e}")
+        finally:
+            self._forget(req_id)  # a timed-out request no longer counts against the queue
+        return ""
+
+    async def agenerate(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        max_new_tokens: int | None = None,
+        timeout: float = LLM_LOCAL_TIMEOUT,
+        stop=None,
+        static_prefix: str = "",
+    ) -> str:
+        """Async generate for the endpoints: awaits the reply without blocking a thread."""
+        future = Future()
+        req_id = self._submit(
+            future, system_prompt, user_prompt, max_new_tokens, stream=False, stop=stop, static_prefix=static_prefix
+        )
+        if req_id is None:
+            return ""
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            print(f"Local model timed out after {timeout}s")
+        except Exception as e:
+            print(f"Local model generation failed: {e}")
+        finally:
+            self._forget(req_id)
+        return ""
+
+    def stream(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        max_new_tokens: int | None = None,
+        timeout: float = LLM_LOCAL_TIMEOUT,
+        stop=None,
+        static_prefix: str = "",
+    ):
+        """Yield text chunks as the worker generates them (nothing if the model isn't available)."""
+        chunks: queue.Queue = queue.Queue()
+        req_id = self._submit(
+            chunks, system_prompt, user_prompt, max_new_tokens, stream=True, stop=stop, static_prefix=static_prefix
+        )
+        if req_id is None:
+            return
+        deadline = time.time() + timeout
+        try:
+            while True:
+                try:
+                    item = chunks.get(timeout=max(0.1, deadline - time.time()))
+                except queue.Empty:
+                    raise RuntimeError(f"Local model timed out after {timeout}s")
+                if item is _STREAM_END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self._forget(req_id)
+
+
+service = LocalModelService(LLM_LOCAL_MODEL, LLM_LOCAL_MAX_NEW_TOKENS)
+generate = service.generate
+agenerate = service.agenerate
+stream = service.stream
@@ -1,4 +1,7 @@
 from fastapi import FastAPI
+import asyncio
+import local_llm
+import course_index
 from routers import users, courses, ai, questions, enrollments, quiz, answers, quiz_stats
 
 # Initialize FastAPI app
@@ -27,8 +30,34 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*", "Range"],  # Explicitly allow Range header for PDF streaming
+    expose_headers=["X-Next-Cursor", "X-Total-Count"],  # keyset pagination of list endpoints
 )
 
+# Local fallback model: load it in its worker process in the background so the
+# first degraded-mode request doesn't pay for the load
+@app.on_event("startup")
+async def start_local_model():
+    if local_llm.LLM_LOCAL_ENABLED:
+        local_llm.service.start()
+
+
+@app.on_event("shutdown")
+async def stop_local_model():
+    local_llm.service.shutdown()
+
+
+# Course autocomplete index: load it from Supabase in the background and keep it
+# refreshed (the course endpoints also update it as they write)
+@app.on_event("startup")
+async def start_course_index():
+    app.state.course_index_task = asyncio.create_task(course_index.keep_fresh())
+
+
+@app.on_event("shutdown")
+async def stop_course_index():
+    app.state.course_index_task.cancel()
+
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -0,0 +1,158 @@
+"""
+Token-based prompt budgeting for LLM calls.
+
+Counts tokens with the target model's own tokenizer (HF `tokenizers`) where one
+is known, falls back to a character heuristic otherwise, and trims long page
+text at question boundaries instead of slicing mid-sentence.
+"""
+import os
+import re
+from functools import lru_cache
+
+from tokenizers import Tokenizer
+
+# Tokens kept free for the model's answer when budgeting the prompt
+LLM_OUTPUT_RESERVE_TOKENS = int(os.environ.get("LLM_OUTPUT_RESERVE_TOKENS", "1024"))
+LLM_DEFAULT_CONTEXT_WINDOW = int(os.environ.get("LLM_DEFAULT_CONTEXT_WINDOW", "8192"))
+# Average characters per token used when no tokenizer is available (conservative for English)
+CHARS_PER_TOKEN = 3.5
+
+# Context windows (tokens) of the models we route to, keyed by base model id
+# (lower-case, without :free/:latest). Override/extend with
+# LLM_CONTEXT_WINDOWS="model=tokens, other/model=tokens".
+_CONTEXT_WINDOWS = {
+    "qwen/qwen2.5-7b-instruct": 32768,
+    "qwen/qwen2.5-vl-7b-instruct": 32768,
+    "qwen/qwen2.5-3b-instruct": 32768,
+    "qwen/qwen2.5-1.5b-instruct": 32768,
+    "meta-llama/llama-3.2-3b-instruct": 131072,
+    "deepseek/deepseek-r1-distill-qwen-1.5b": 131072,
+    "tinyllama/tinyllama-1.1b-chat-v1.0": 2048,
+    "gpt-3.5-turbo": 16385,
+}
+
+# Hugging Face tokenizer repo per model-id prefix. Override/extend with
+# LLM_TOKENIZER_MAP="model-or-prefix=hf/repo, ...".
+_TOKENIZER_REPOS = {
+    "qwen/": "Qwen/Qwen2.5-7B-Instruct",
+    "deepseek/deepseek-r1-distill-qwen": "Qwen/Qwen2.5-7B-Instruct",
+    "tinyllama/": "TinyLlama/TinyLlama-1.1B-Chat-v1.0",
+}
+
+
+def _parse_mapping(raw: str) -> dict[str, str]:
+    mapping = {}
+    for item in raw.split(","):
+        if "=" in item:
+            key, value = item.split("=", 1)
+            if key.strip() and value.strip():
+                mapping[key.strip().lower()] = value.strip()
+    return mapping
+
+
+_CONTEXT_WINDOWS.update(
+    {k: int(v) for k, v in _parse_mapping(os.environ.get("LLM_CONTEXT_WINDOWS", "")).items()}
+)
+_TOKENIZER_REPOS.update(_parse_mapping(os.environ.get("LLM_TOKENIZER_MAP", "")))
+
+# Lines that start a new question / sub-part: "Question 3", "Q3.", "3.", "3)", "(b)"
+_QUESTION_START = re.compile(
+    r"^\s*(?:question\s+\d+|q\.?\s*\d+|\d{1,2}\s*[.)]|\([a-z]{1,3}\))",
+    re.IGNORECASE,
+)
+
+
+def base_model(model: str) -> str:
+    model = model.strip().lower()
+    for suffix in (":free", ":latest"):
+        if model.endswith(suffix):
+            model = model[: -len(suffix)]
+    return model
+
+
+def context_window(model: str) -> int:
+    return _CONTEXT_WINDOWS.get(base_model(model), LLM_DEFAULT_CONTEXT_WINDOW)
+
+
+@lru_cache(maxsize=8)
+def _load_tokenizer(repo: str):
+    try:
+        return Tokenizer.from_pretrained(repo)
+    except Exception as e:
+        print(f"Tokenizer {repo} unavailable, using character estimate: {e}")
+        return None
+
+
+def get_tokenizer(model: str):
+    name = base_model(model)
+    for prefix in sorted(_TOKENIZER_REPOS, key=len, reverse=True):
+        if name.startswith(prefix):
+            return _load_tokenizer(_TOKENIZER_REPOS[prefix])
+    return None
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Token count of `text` for `model` (estimated from length if no tokenizer is known)."""
+    if not text:
+        return 0
+    tokenizer = get_tokenizer(model)
+    if tokenizer is None:
+        return int(len(text) / CHARS_PER_TOKEN) + 1
+    return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def split_questions(text: str) -> list[str]:
+    """Split page text into blocks that each start at a question/sub-part heading."""
+    blocks: list[list[str]] = [[]]
+    for line in text.splitlines():
+        if _QUESTION_START.match(line) and blocks[-1]:
+            blocks.append([])
+        blocks[-1].append(line)
+    return ["\n".join(block) for block in blocks if block]
+
+
+def _truncate_tokens(text: str, model: str, max_tokens: int) -> str:
+    tokenizer = get_tokenizer(model)
+    if tokenizer is None:
+        return text[: int(max_tokens * CHARS_PER_TOKEN)]
+    encoding = tokenizer.encode(text, add_special_tokens=False)
+    if len(encoding.ids) <= max_tokens:
+        return text
+    # Cut on the character offset of the last kept token so no partial token is decoded
+    return text[: encoding.offsets[max_tokens - 1][1]]
+
+
+def fit_text(text: str, model: str, max_tokens: int) -> tuple[str, int, bool]:
+    """Trim `text` to at most `max_tokens` for `model`, keeping whole questions.
+
+    Returns (text, token_count, truncated). Leading questions are kept in order
+    until the next one would not fit; if even the first block is too long it is
+    cut at a token boundary.
+    """
+    total = count_tokens(text, model)
+    if total <= max_tokens:
+        return text, total, False
+    if max_tokens <= 0:
+        return "", 0, True
+
+    kept: list[str] = []
+    used = 0
+    for block in split_questions(text):
+        block_tokens = count_tokens(block, model) + 1  # +1 for the joining newline
+        if used + block_tokens > max_tokens:
+            break
+        kept.append(block)
+        used += block_tokens
+    if not kept:
+        fitted = _truncate_tokens(text, model, max_tokens)
+        return fitted, count_tokens(fitted, model), True
+    fitted = "\n".join(kept)
+    return fitted, count_tokens(fitted, model), True
+
+
+def prompt_budget(model: str, *fixed_parts: str, reserve_output: int | None = None) -> int:
+    """Tokens left for variable content once the fixed prompt parts and the answer are accounted for."""
+    reserve = LLM_OUTPUT_RESERVE_TOKENS if reserve_output is None else reserve_output
+    fixed = sum(count_tokens(part, model) for part in fixed_parts)
+    # Small allowance for chat-template control tokens around each message
+    return context_window(model) - reserve - fixed - 16
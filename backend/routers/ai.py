@@ -1,5 +1,5 @@
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form
 from fastapi.responses import FileResponse, StreamingResponse
 import json
 import sys
@@ -13,8 +13,19 @@ import os
 import subprocess
 import boto3
 from botocore.client import Config
+from PyPDF2 import PdfReader
+from PyPDF2.errors import PdfReadError
+from PIL import Image, ImageOps
+import base64
+import binascii
+from fastapi.concurrency import run_in_threadpool
 import sys
 import io
+
+import local_llm
+from local_llm import LLM_LOCAL_MODEL, LLM_LOCAL_MAX_NEW_TOKENS
+from prompt_budget import context_window, count_tokens, fit_text, prompt_budget, split_questions
+from collections import deque
 sys.stdout.reconfigure(encoding="utf-8")
 
 router = APIRouter()
@@ -177,6 +188,23 @@ S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL")
 S3_ACCESS_KEY_ID = os.environ.get("S3_ACCESS_KEY_ID")
 S3_SECRET_ACCESS_KEY = os.environ.get("S3_SECRET_ACCESS_KEY")
 S3_BUCKET = "pdfs"
+# Extracted per-page text is stored next to the PDFs so it is computed once per PDF
+PAGE_TEXT_PREFIX = "_cache/page_text"
+PAGE_TEXT_CACHE_MAX = int(os.environ.get("PAGE_TEXT_CACHE_MAX", "100"))  # PDFs kept in memory
+# Precomputed solutions (see ai/precompute_solutions.py), keyed by course/file/page/model
+SOLUTION_STORE_PREFIX = "_cache/solutions"
+
+
+def s3_client():
+    session = boto3.session.Session()
+    return session.client(
+        service_name="s3",
+        aws_access_key_id=S3_ACCESS_KEY_ID,
+        aws_secret_access_key=S3_SECRET_ACCESS_KEY,
+        endpoint_url=S3_ENDPOINT_URL,
+        config=Config(signature_version="s3v4"),
+        region_name="us-east-1",
+    )
 
 # OpenRouter (LLM) configuration
 OPENROUTER_KEY = os.environ.get("OPENROUTER_KEY")
@@ -192,14 +220,33 @@ LLM_FALLBACK_MODEL = os.environ.get(
 LLM_CACHE_MAX = int(os.environ.get("LLM_CACHE_MAX", "50"))
 LLM_REQUESTS_PER_MIN = int(os.environ.get("LLM_REQUESTS_PER_MIN", "40"))
 LLM_ADAPTIVE_RETRY = os.environ.get("LLM_ADAPTIVE_RETRY", "true").lower() == "true"
+# Prompts at or below this many tokens are not shrunk on an adaptive 429 retry
+LLM_ADAPTIVE_RETRY_MIN_TOKENS = int(os.environ.get("LLM_ADAPTIVE_RETRY_MIN_TOKENS", "1000"))
 LLM_ROUND_ROBIN = os.environ.get(
     "LLM_ROUND_ROBIN",
     "qwen/qwen2.5-1.5b-instruct:free, qwen/qwen2.5-3b-instruct, deepseek/deepseek-r1-distill-qwen-1.5b:free",
 )
-LLM_LOCAL_MODEL = os.environ.get("LLM_LOCAL_MODEL", "TinyLlama/TinyLlama-1.1B-Chat-v1.0")
-LLM_LOCAL_MAX_NEW_TOKENS = int(os.environ.get("LLM_LOCAL_MAX_NEW_TOKENS", "256"))
 LLM_USE_LOCAL_FIRST = os.environ.get("LLM_USE_LOCAL_FIRST", "false").lower() == "true"
+# Routing between the local model and remote models:
+#   remote - remote first, local only as a fallback (default)
+#   local  - local first (same as LLM_USE_LOCAL_FIRST=true)
+#   size   - short text prompts with short expected answers go to the warm local model,
+#            long or vision prompts (or a cold/busy local model) go remote; a short
+#            prompt that finds the model idle-stopped respawns its worker for later ones
+LLM_ROUTING = os.environ.get("LLM_ROUTING", "local" if LLM_USE_LOCAL_FIRST else "remote").lower()
+LLM_ROUTE_LOCAL_MAX_PROMPT_TOKENS = int(os.environ.get("LLM_ROUTE_LOCAL_MAX_PROMPT_TOKENS", "600"))
+LLM_ROUTE_TOKENS_PER_QUESTION = int(os.environ.get("LLM_ROUTE_TOKENS_PER_QUESTION", "120"))
+LLM_ROUTE_LOCAL_MAX_PENDING = int(os.environ.get("LLM_ROUTE_LOCAL_MAX_PENDING", "4"))
+LLM_ROUTE_LOG_MAX = int(os.environ.get("LLM_ROUTE_LOG_MAX", "1000"))
 LLM_DISABLE_FALLBACKS = os.environ.get("LLM_DISABLE_FALLBACKS", "false").lower() == "true"
+SOLUTION_STORE_MODEL = os.environ.get("SOLUTION_STORE_MODEL", LLM_MODEL)
+# Image requests: answers cached by perceptual hash (+ page identifiers when given)
+LLM_IMAGE_CACHE_MAX = int(os.environ.get("LLM_IMAGE_CACHE_MAX", "200"))
+LLM_IMAGE_HASH_MAX_DISTANCE = int(os.environ.get("LLM_IMAGE_HASH_MAX_DISTANCE", "6"))  # of 64 bits
+# Vision uploads are downscaled server-side before being forwarded
+LLM_VISION_MAX_SIDE = int(os.environ.get("LLM_VISION_MAX_SIDE", "1280"))
+LLM_VISION_JPEG_QUALITY = int(os.environ.get("LLM_VISION_JPEG_QUALITY", "80"))
+LLM_VISION_MAX_UPLOAD_BYTES = int(os.environ.get("LLM_VISION_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
 # OpenAI (preferred for this endpoint if available)
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 OPENAI_MODEL = os.environ.get("OPENAI_MODEL", "gpt-3.5-turbo")
@@ -235,58 +282,131 @@ def _apply_cooldown(model: str, attempt: int):
     _LLM_COOLDOWN[model] = time.time() + delay
 
 
-def openrouter_chat(system_prompt: str, user_prompt: str, image_base64: str | None = None):
+def _llm_cache_digest(system_prompt, user_prompt, image_base64=None, cache_key=None) -> str:
+    # Cache key uses hash of combined inputs. The model part is the configured
+    # chain, not the round-robin primary, which rotates on every request.
+    models = LLM_VISION_MODEL if image_base64 else f"{LLM_ROUND_ROBIN}|{LLM_FALLBACK_MODEL}"
+    if cache_key:
+        key_material = "key=" + cache_key + "|models=" + models + "|sys=" + system_prompt
+    else:
+        key_material = (
+            models
+            + "|img="
+            + ("1" if image_base64 else "0")
+            + "|sys="
+            + system_prompt
+            + "|usr="
+            + user_prompt
+        )
+    return hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+
+def _llm_cache_put(digest: str, content: str):
+    _LLM_CACHE[digest] = content
+    _LLM_CACHE_KEYS.append(digest)
+    if len(_LLM_CACHE_KEYS) > LLM_CACHE_MAX:
+        # FIFO trim
+        old_key = _LLM_CACHE_KEYS.pop(0)
+        _LLM_CACHE.pop(old_key, None)
+
+
+def _model_chain(image_base64: str | None = None) -> list[str]:
+    """Primary model (round-robin for text, vision model for images) followed by fallbacks."""
+    global _LLM_RR_INDEX
+    if image_base64:
+        primary = LLM_VISION_MODEL
+    else:
+        rr_list = [m.strip() for m in LLM_ROUND_ROBIN.split(',') if m.strip()] or [LLM_MODEL]
+        primary = rr_list[_LLM_RR_INDEX % len(rr_list)]
+        _LLM_RR_INDEX += 1
+    fallbacks = [m.strip() for m in LLM_FALLBACK_MODEL.split(',') if m.strip()]
+    if LLM_DISABLE_FALLBACKS:
+        return [primary]
+    return [primary] + [m for m in fallbacks if m != primary]
+
+
+def fit_user_prompt(
+    model: str,
+    system_prompt: str,
+    user_prompt: str,
+    max_tokens: int | None = None,
+    note: str = "[Truncated to fit the model context]",
+    reserve_output: int | None = None,
+) -> str:
+    """Trim `user_prompt` to the model's context budget (or `max_tokens`), keeping whole questions."""
+    budget = prompt_budget(model, system_prompt, note, reserve_output=reserve_output)
+    if max_tokens is not None:
+        budget = min(budget, max_tokens)
+    fitted, _, truncated = fit_text(user_prompt, model, budget)
+    return f"{fitted}\n\n{note}" if truncated else fitted
+
+
+def budget_model(image: bool = False) -> str:
+    """Remote model with the smallest context window; a prompt sized for it fits the whole chain."""
+    if image:
+        return LLM_VISION_MODEL
+    models = [
+        m.strip()
+        for m in f"{LLM_MODEL},{LLM_ROUND_ROBIN},{LLM_FALLBACK_MODEL}".split(",")
+        if m.strip()
+    ]
+    return min(models, key=context_window)
+
+
+def openrouter_chat(
+    system_prompt: str,
+    user_prompt: str,
+    image_base64: str | None = None,
+    cache_key: str | None = None,
+    image_mime: str = "image/png",
+):
     """Send chat (optionally multi‑modal) to OpenRouter with retry, fallback & cache.
 
     Strategy:
       1. Cache: Return cached answer if prompt (incl image flag + model) repeated.
+         When `cache_key` is given (e.g. course/file/page) it replaces the model
+         and prompt in the key, so round-robin model rotation doesn't split the cache.
       2. Try primary model (vision variant if image).
       3. On 429: exponential backoff (up to 3 attempts), then iterate fallback models.
       4. On non-429 HTTP errors: attempt next fallback immediately.
+
+    The user prompt is fitted to each model's context window (token-counted) before
+    sending; an adaptive 429 retry halves its token count at a question boundary.
+    Returns None if every model fails; llm_chat runs the remaining fallbacks.
     """
     if not OPENROUTER_KEY:
         raise HTTPException(status_code=500, detail="OPENROUTER_KEY not configured on server")
 
     # Prepare model list (primary + fallbacks)
     # Round-robin primary model selection (text only). Vision requests stick to vision model.
-    global _LLM_RR_INDEX
-    if image_base64:
-        primary = LLM_VISION_MODEL
-    else:
-        rr_list = [m.strip() for m in LLM_ROUND_ROBIN.split(',') if m.strip()] or [LLM_MODEL]
-        primary = rr_list[_LLM_RR_INDEX % len(rr_list)]
-        _LLM_RR_INDEX += 1
-    fallbacks = [m.strip() for m in LLM_FALLBACK_MODEL.split(',') if m.strip()]
-    model_chain = [primary] + [m for m in fallbacks if m != primary]
-    if LLM_DISABLE_FALLBACKS:
-        model_chain = [primary]
-
-    # Cache key uses hash of combined inputs
-    key_material = (
-        primary
-        + "|img="
-        + ("1" if image_base64 else "0")
-        + "|sys="
-        + system_prompt
-        + "|usr="
-        + user_prompt
-    )
-    digest = hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+    model_chain = _model_chain(image_base64)
+    primary = model_chain[0]
+
+    digest = _llm_cache_digest(system_prompt, user_prompt, image_base64, cache_key)
     if digest in _LLM_CACHE:
         return _LLM_CACHE[digest]
 
+    # Per-model user prompt, fitted to that model's context (and shrunk on adaptive retry)
+    user_prompts: dict[str, str] = {}
+
+    def prompt_for(model_name: str) -> str:
+        if model_name not in user_prompts:
+            user_prompts[model_name] = fit_user_prompt(model_name, system_prompt, user_prompt)
+        return user_prompts[model_name]
+
     # Construct messages payload factory
     def build_messages(model_name: str):
+        text = prompt_for(model_name)
         if image_base64 and model_name == primary:  # Only send image to first (vision) model
             return [
                 {"role": "system", "content": system_prompt},
                 {
                     "role": "user",
                     "content": [
-                        {"type": "text", "text": user_prompt},
+                        {"type": "text", "text": text},
                         {
                             "type": "image_url",
-                            "image_url": {"url": f"data:image/png;base64,{image_base64}"},
+                            "image_url": {"url": f"data:{image_mime};base64,{image_base64}"},
                         },
                     ],
                 },
@@ -294,7 +414,7 @@ def openrouter_chat(system_prompt: str, user_prompt: str, image_base64: str | No
         else:
             return [
                 {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
+                {"role": "user", "content": text},
             ]
 
     headers = {
@@ -321,18 +441,18 @@ def openrouter_chat(system_prompt: str, user_prompt: str, image_base64: str | No
                 if resp.status_code == 429:
                     last_error = f"429 from model {model} (attempt {attempt})"
                     _apply_cooldown(model, attempt)
-                    # Adaptive strategy: after first 429 on this model, optionally reduce prompt length
+                    # Adaptive strategy: after first 429 on this model, halve a long prompt
+                    # (by tokens, at a question boundary); the next attempt rebuilds the payload
                     if LLM_ADAPTIVE_RETRY and attempt == 1:
-                        # Trim user text content to half if very long (>4k chars) and rebuild payload
-                        # Locate user text in messages
-                        for m in payload["messages"]:
-                            if m.get("role") == "user":
-                                if isinstance(m.get("content"), str) and len(m["content"]) > 4000:
-                                    m["content"] = m["content"][:2000] + "\n\n[Truncated due to rate limit retry]"
-                                elif isinstance(m.get("content"), list):
-                                    for part in m["content"]:
-                                        if part.get("type") == "text" and len(part.get("text","")) > 4000:
-                                            part["text"] = part["text"][:2000] + "\n\n[Truncated due to rate limit retry]"
+                        prompt_tokens = count_tokens(prompt_for(model), model)
+                        if prompt_tokens > LLM_ADAPTIVE_RETRY_MIN_TOKENS:
+                            user_prompts[model] = fit_user_prompt(
+                                model,
+                                system_prompt,
+                                user_prompt,
+                                max_tokens=prompt_tokens // 2,
+                                note="[Truncated due to rate limit retry]",
+                            )
                     if attempt < 3:
                         # Jittered exponential backoff
                         jitter = 0.25 * backoff * (0.5 + (hash(f"{model}{attempt}{time.time()}") % 100) / 100.0)
@@ -357,6 +477,7 @@ def openrouter_chat(system_prompt: str, user_prompt: str, image_base64: str | No
                             variants.append(short)
                         # Iterate variants immediately
                         for vm in variants:
+                            user_prompts.setdefault(vm, prompt_for(model))
                             payload_variant = {"model": vm, "messages": build_messages(vm)}
                             try:
                                 vr = requests.post(
@@ -368,11 +489,7 @@ def openrouter_chat(system_prompt: str, user_prompt: str, image_base64: str | No
                                 if vr.ok:
                                     data = vr.json()
                                     content = data.get("choices", [{}])[0].get("message", {}).get("content", "")
-                                    _LLM_CACHE[digest] = content
-                                    _LLM_CACHE_KEYS.append(digest)
-                                    if len(_LLM_CACHE_KEYS) > LLM_CACHE_MAX:
-                                        old_key = _LLM_CACHE_KEYS.pop(0)
-                                        _LLM_CACHE.pop(old_key, None)
+                                    _llm_cache_put(digest, content)
                                     return content
                             except requests.RequestException:
                                 pass
@@ -383,12 +500,7 @@ def openrouter_chat(system_prompt: str, user_prompt: str, image_base64: str | No
                 data = resp.json()
                 content = data.get("choices", [{}])[0].get("message", {}).get("content", "")
                 # Store in cache
-                _LLM_CACHE[digest] = content
-                _LLM_CACHE_KEYS.append(digest)
-                if len(_LLM_CACHE_KEYS) > LLM_CACHE_MAX:
-                    # FIFO trim
-                    old_key = _LLM_CACHE_KEYS.pop(0)
-                    _LLM_CACHE.pop(old_key, None)
+                _llm_cache_put(digest, content)
                 return content
             except HTTPException:
                 raise
@@ -401,17 +513,41 @@ def openrouter_chat(system_prompt: str, user_prompt: str, image_base64: str | No
                 else:
                     break  # Next model
 
-    # Final degraded fallback: simple heuristic summary of user_prompt (no external call)
-    # Try local HF model before heuristic if available/allowed
-    local_answer = _local_generate(system_prompt, user_prompt)
-    if local_answer:
-        degraded_content = f"{local_answer}"
-    else:
-        degraded_content = _degraded_local_answer(user_prompt)
-    # Cache degraded answer to avoid hammering
-    _LLM_CACHE[digest] = degraded_content
-    _LLM_CACHE_KEYS.append(digest)
-    return degraded_content
+    print(f"OpenRouter models exhausted: {last_error}")
+    return None
+
+
+def openrouter_chat_once(system_prompt: str, user_prompt: str, model: str) -> tuple[str | None, str | None]:
+    """One OpenRouter request to exactly `model`: no retries, fallbacks or cache.
+
+    Returns (content, error). For jobs that must know which model produced an
+    answer and that count every upstream call against their own budget.
+    """
+    if not OPENROUTER_KEY:
+        return None, "OPENROUTER_KEY not configured"
+    payload = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": fit_user_prompt(model, system_prompt, user_prompt)},
+        ],
+    }
+    try:
+        resp = requests.post(
+            f"{OPENROUTER_BASE}/chat/completions",
+            json=payload,
+            timeout=90,
+            headers={"Authorization": f"Bearer {OPENROUTER_KEY}", "Content-Type": "application/json"},
+        )
+    except requests.RequestException as e:
+        return None, f"Request error model {model}: {e}"
+    if not resp.ok:
+        return None, f"HTTP {resp.status_code} from model {model}: {resp.text[:200]}"
+    content = resp.json().get("choices", [{}])[0].get("message", {}).get("content", "")
+    return (content or None), (None if content else f"Empty answer from model {model}")
+
+
+DEGRADED_PREFIX = "[DEGRADED MODE"
 
 
 def _degraded_local_answer(prompt: str) -> str:
@@ -425,59 +561,33 @@ def _degraded_local_answer(prompt: str) -> str:
         focus = sample
     summary = '\n'.join(focus[:10])
     return (
-        "[DEGRADED MODE: All remote free models rate-limited. Returning heuristic summary.]\n\n"
+        f"{DEGRADED_PREFIX}: All remote free models rate-limited. Returning heuristic summary.]\n\n"
         "Potential questions / key lines:\n" + summary + "\n\n"
         "Try again in ~30-60s for full AI solution."
     )
 
 # ---------------- Local HF model fallback ----------------
-_LOCAL_MODEL = None
-_LOCAL_TOKENIZER = None
-_LOCAL_FAILED = False
+# Inference runs in local_llm's worker process; these wrappers only fit the prompt.
+def _local_user_prompt(system_prompt: str, user_prompt: str) -> str:
+    # TinyLlama's 2k context is easily overrun by a full exam page; leave room for the answer
+    return fit_user_prompt(
+        LLM_LOCAL_MODEL, system_prompt, user_prompt, reserve_output=LLM_LOCAL_MAX_NEW_TOKENS
+    )
 
-def _ensure_local_model():
-    global _LOCAL_MODEL, _LOCAL_TOKENIZER, _LOCAL_FAILED
-    if _LOCAL_FAILED:
-        return False
-    if _LOCAL_MODEL is not None and _LOCAL_TOKENIZER is not None:
-        return True
-    try:
-        from transformers import AutoModelForCausalLM, AutoTokenizer
-        import torch
-        _LOCAL_TOKENIZER = AutoTokenizer.from_pretrained(LLM_LOCAL_MODEL)
-        _LOCAL_MODEL = AutoModelForCausalLM.from_pretrained(
-            LLM_LOCAL_MODEL,
-            torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-            low_cpu_mem_usage=True,
-            device_map="auto" if torch.cuda.is_available() else None,
-        )
-        return True
-    except Exception:
-        _LOCAL_FAILED = True
-        return False
+def _local_static_prefix(user_prompt: str) -> str:
+    # Solve-paper prompts open with fixed instructions; the worker reuses their KV cache
+    return SOLVE_PAPER_INSTRUCTIONS if user_prompt.startswith(SOLVE_PAPER_INSTRUCTIONS) else ""
+
+async def _local_agenerate(system_prompt: str, user_prompt: str) -> str:
+    # Awaits the worker's reply without holding a threadpool thread for up to LLM_LOCAL_TIMEOUT
+    user_prompt = await run_in_threadpool(_local_user_prompt, system_prompt, user_prompt)
+    return await local_llm.agenerate(system_prompt, user_prompt, static_prefix=_local_static_prefix(user_prompt))
 
-def _local_generate(system_prompt: str, user_prompt: str) -> str:
-    if not _ensure_local_model():
-        return ""
-    import torch
-    prompt = f"<|system|>\n{system_prompt}\n<|user|>\n{user_prompt}\n<|assistant|>\n"
-    inputs = _LOCAL_TOKENIZER(prompt, return_tensors="pt")
-    for k in inputs:
-        inputs[k] = inputs[k].to(_LOCAL_MODEL.device)
-    with torch.no_grad():
-        out = _LOCAL_MODEL.generate(
-            **inputs,
-            max_new_tokens=LLM_LOCAL_MAX_NEW_TOKENS,
-            temperature=0.7,
-            do_sample=True,
-            top_p=0.9,
-            pad_token_id=_LOCAL_TOKENIZER.eos_token_id,
-        )
-    text = _LOCAL_TOKENIZER.decode(out[0], skip_special_tokens=True)
-    # Extract assistant part after last user marker if present
-    if "<|assistant|>" in text:
-        text = text.split("<|assistant|>")[-1].strip()
-    return text.strip()
+
+@router.get("/ai/local-model/status")
+async def local_model_status():
+    """State of the local fallback model worker (stopped/loading/ready/failed) and its queue."""
+    return local_llm.service.status()
 
 
 @router.post("/ai/check-answers-from-file")
@@ -619,15 +729,7 @@ async def list_past_papers(course_code: str):
     """
     List all available past paper PDFs for a course from S3.
     """
-    session = boto3.session.Session()
-    s3 = session.client(
-        service_name="s3",
-        aws_access_key_id=S3_ACCESS_KEY_ID,
-        aws_secret_access_key=S3_SECRET_ACCESS_KEY,
-        endpoint_url=S3_ENDPOINT_URL,
-        config=Config(signature_version="s3v4"),
-        region_name="us-east-1",
-    )
+    s3 = s3_client()
     response = s3.list_objects_v2(Bucket=S3_BUCKET, Prefix=f"{course_code}/")
     pdfs = []
     for obj in response.get("Contents", []):
@@ -639,15 +741,7 @@ async def list_past_papers(course_code: str):
 
 @router.get("/ai/past-papers/{course_code}/{filename}")
 async def get_past_paper_pdf(course_code: str, filename: str):
-    session = boto3.session.Session()
-    s3 = session.client(
-        service_name="s3",
-        aws_access_key_id=S3_ACCESS_KEY_ID,
-        aws_secret_access_key=S3_SECRET_ACCESS_KEY,
-        endpoint_url=S3_ENDPOINT_URL,
-        config=Config(signature_version="s3v4"),
-        region_name="us-east-1",
-    )
+    s3 = s3_client()
     s3_key = f"{course_code}/{filename}"
     try:
         s3_obj = s3.get_object(Bucket=S3_BUCKET, Key=s3_key)
@@ -660,6 +754,92 @@ async def get_past_paper_pdf(course_code: str, filename: str):
         raise HTTPException(status_code=404, detail=f"File not found in S3: {e}")
 
 
+# In-memory page text cache (FIFO trim), keyed by "{course_code}/{filename}"
+_PAGE_TEXT_CACHE: dict[str, list[str]] = {}
+_PAGE_TEXT_CACHE_KEYS: list[str] = []
+
+
+def _path_segment(value: str, field: str) -> str:
+    """Reject identifiers that would reach outside `{course_code}/{filename}` in the bucket."""
+    if not isinstance(value, str) or value in ("", ".", "..") or "/" in value or "\\" in value:
+        raise HTTPException(status_code=400, detail=f"Invalid '{field}'")
+    return value
+
+
+def get_page_texts(course_code: str, filename: str) -> list[str]:
+    """Return the extracted text of every page of a past paper.
+
+    Lookup order: process memory -> JSON sidecar in S3 -> extract from the PDF
+    with PyPDF2 (and write the sidecar so other workers/servers reuse it).
+    """
+    pdf_key = f"{_path_segment(course_code, 'course_code')}/{_path_segment(filename, 'filename')}"
+    if pdf_key in _PAGE_TEXT_CACHE:
+        return _PAGE_TEXT_CACHE[pdf_key]
+
+    s3 = s3_client()
+    sidecar_key = f"{PAGE_TEXT_PREFIX}/{pdf_key}.json"
+    pages = None
+    try:
+        obj = s3.get_object(Bucket=S3_BUCKET, Key=sidecar_key)
+        pages = json.loads(obj["Body"].read().decode("utf-8")).get("pages")
+    except Exception:
+        pages = None
+
+    if pages is None:
+        try:
+            pdf_bytes = s3.get_object(Bucket=S3_BUCKET, Key=pdf_key)["Body"].read()
+        except Exception as e:
+            raise HTTPException(status_code=404, detail=f"File not found in S3: {e}")
+        try:
+            reader = PdfReader(io.BytesIO(pdf_bytes))
+            pages = [(page.extract_text() or "").strip() for page in reader.pages]
+        except PdfReadError as e:
+            raise HTTPException(status_code=422, detail=f"Not a readable PDF: {e}")
+        try:
+            s3.put_object(
+                Bucket=S3_BUCKET,
+                Key=sidecar_key,
+                Body=json.dumps({"pages": pages}, ensure_ascii=False).encode("utf-8"),
+                ContentType="application/json",
+            )
+        except Exception as e:
+            print(f"Warning: could not store page text for {pdf_key}: {e}")
+
+    _PAGE_TEXT_CACHE[pdf_key] = pages
+    _PAGE_TEXT_CACHE_KEYS.append(pdf_key)
+    if len(_PAGE_TEXT_CACHE_KEYS) > PAGE_TEXT_CACHE_MAX:
+        old_key = _PAGE_TEXT_CACHE_KEYS.pop(0)
+        _PAGE_TEXT_CACHE.pop(old_key, None)
+    return pages
+
+
+def get_page_text(course_code: str, filename: str, page_number: int) -> tuple[str, int]:
+    """Return (text, page_count) for a 1-based page number."""
+    pages = get_page_texts(course_code, filename)
+    if page_number < 1 or page_number > len(pages):
+        raise HTTPException(
+            status_code=404,
+            detail=f"Page {page_number} out of range (1-{len(pages)})",
+        )
+    return pages[page_number - 1], len(pages)
+
+
+@router.get("/ai/past-papers/{course_code}/{filename}/pages/{page_number}/text")
+async def get_past_paper_page_text(course_code: str, filename: str, page_number: int):
+    """
+    Return server-side extracted text for one page of a past paper.
+    Text is extracted once per PDF and cached in memory and in S3.
+    """
+    text, page_count = await run_in_threadpool(get_page_text, course_code, filename, page_number)
+    return {
+        "course_code": course_code,
+        "filename": filename,
+        "page_number": page_number,
+        "page_count": page_count,
+        "text": text,
+    }
+
+
 @router.post("/ai/generate-questions-json/{course_code}")
 async def generate_questions_json(course_code: str):
     """
@@ -791,99 +971,630 @@ async def create_quiz_and_upload_questions(
     return {"success": ok, "quiz": quiz, "message": msg}
 
 
+# ---------------- Perceptual-hash cache for image requests ----------------
+# scope (page key, or page text hash when unknown) -> [(dhash, answer)]
+_IMAGE_SOLUTION_CACHE: dict[str, list[tuple[int, str]]] = {}
+_IMAGE_SOLUTION_CACHE_KEYS: list[tuple[str, int]] = []
+
+
+def image_dhash(img: Image.Image) -> int:
+    """64-bit difference hash of an image.
+
+    The image is converted to grayscale, contrast-normalised and shrunk to 9x8,
+    so the same page region rendered at a different zoom level or PNG encoder
+    hashes to the same (or a very close) value.
+    """
+    gray = ImageOps.autocontrast(img.convert("L"))
+    pixels = list(gray.resize((9, 8), Image.Resampling.LANCZOS).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+def prepare_vision_image(image_bytes: bytes) -> tuple[str, str, int]:
+    """Downscale/recompress an uploaded page image for the vision model.
+
+    Returns (base64 payload, mime type, dhash). The longest side is capped at
+    LLM_VISION_MAX_SIDE and the result re-encoded as JPEG, which is typically a
+    fraction of the size of a full-resolution PNG screenshot.
+    """
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            img.load()
+            dhash = image_dhash(img)
+            img = img.convert("RGB")
+            img.thumbnail((LLM_VISION_MAX_SIDE, LLM_VISION_MAX_SIDE), Image.Resampling.LANCZOS)
+            out = io.BytesIO()
+            img.save(out, format="JPEG", quality=LLM_VISION_JPEG_QUALITY, optimize=True)
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+    return base64.b64encode(out.getvalue()).decode("ascii"), "image/jpeg", dhash
+
+
+def get_image_solution(scope: str, dhash: int) -> str | None:
+    best = None
+    best_distance = LLM_IMAGE_HASH_MAX_DISTANCE + 1
+    for cached_hash, answer in _IMAGE_SOLUTION_CACHE.get(scope, []):
+        distance = bin(cached_hash ^ dhash).count("1")
+        if distance < best_distance:
+            best, best_distance = answer, distance
+    return best
+
+
+def put_image_solution(scope: str, dhash: int, answer: str):
+    _IMAGE_SOLUTION_CACHE.setdefault(scope, []).append((dhash, answer))
+    _IMAGE_SOLUTION_CACHE_KEYS.append((scope, dhash))
+    if len(_IMAGE_SOLUTION_CACHE_KEYS) > LLM_IMAGE_CACHE_MAX:
+        # FIFO trim
+        old_scope, old_hash = _IMAGE_SOLUTION_CACHE_KEYS.pop(0)
+        entries = _IMAGE_SOLUTION_CACHE.get(old_scope, [])
+        for i, (cached_hash, _) in enumerate(entries):
+            if cached_hash == old_hash:
+                entries.pop(i)
+                break
+        if not entries:
+            _IMAGE_SOLUTION_CACHE.pop(old_scope, None)
+
+
+def _openai_chat(system_prompt: str, user_prompt: str) -> str | None:
+    """Single OpenAI chat completion; None if not configured or the call failed."""
+    if not OPENAI_API_KEY:
+        return None
+    try:
+        headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+        payload = {
+            "model": OPENAI_MODEL,
+            "messages": messages,
+            "temperature": 0.2,
+            "max_tokens": 900,
+        }
+        resp = requests.post("https://api.openai.com/v1/chat/completions", json=payload, headers=headers, timeout=30)
+        resp.raise_for_status()
+        data = resp.json()
+        return data.get("choices", [{}])[0].get("message", {}).get("content", "")
+    except requests.RequestException as e:
+        print(f"OpenAI call failed: {e}")
+        return None
+
+
+# ---------------- Routing ----------------
+_ROUTE_LOG: deque = deque(maxlen=LLM_ROUTE_LOG_MAX)
+
+
+def estimate_output_tokens(user_prompt: str) -> int:
+    """Expected answer length: a fixed budget per question found in the page text."""
+    text = user_prompt
+    if text.startswith(SOLVE_PAPER_INSTRUCTIONS):
+        text = text[len(SOLVE_PAPER_INSTRUCTIONS):]  # its numbered "Return:" list isn't questions
+    return max(1, len(split_questions(text))) * LLM_ROUTE_TOKENS_PER_QUESTION
+
+
+def route_request(system_prompt: str, user_prompt: str, image_b64: str | None = None) -> tuple[str, dict]:
+    """Pick "local" or "remote" for a request; returns (route, decision details)."""
+    if LLM_ROUTING != "size":
+        return ("local" if LLM_ROUTING == "local" else "remote"), {"reason": LLM_ROUTING}
+    features = {
+        "prompt_tokens": count_tokens(f"{system_prompt}\n{user_prompt}", LLM_LOCAL_MODEL),
+        "expected_output_tokens": estimate_output_tokens(user_prompt),
+    }
+    if image_b64:
+        reason = "vision"
+    elif features["prompt_tokens"] > LLM_ROUTE_LOCAL_MAX_PROMPT_TOKENS:
+        reason = "long_prompt"
+    elif features["expected_output_tokens"] > LLM_LOCAL_MAX_NEW_TOKENS:
+        reason = "long_output"
+    elif not local_llm.service.warm():
+        # Nothing else reloads a model stopped after idling while traffic goes
+        # remote; start it now so later short prompts can stay local
+        local_llm.service.wake()
+        reason = "local_cold"
+    elif local_llm.service.pending() >= LLM_ROUTE_LOCAL_MAX_PENDING:
+        reason = "local_busy"
+    else:
+        return "local", {**features, "reason": "short"}
+    return "remote", {**features, "reason": reason}
+
+
+def _route_order(route: str) -> list[str]:
+    if route == "remote":
+        return ["remote", "openai", "local"]
+    if LLM_ROUTING == "local":
+        return ["local", "openai"]  # LLM_USE_LOCAL_FIRST's original order
+    return ["local", "remote", "openai"]
+
+
+def record_route(route: str, details: dict, served_by: str, started: float):
+    _ROUTE_LOG.append({
+        "route": route,
+        "served_by": served_by,
+        "latency_ms": round((time.time() - started) * 1000),
+        "at": round(started, 3),
+        **details,
+    })
+
+
+def _percentile(values: list[float], pct: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _latency_summary(entries: list[dict]) -> dict:
+    latencies = [e["latency_ms"] for e in entries]
+    return {"count": len(entries), "p50_ms": _percentile(latencies, 50), "p95_ms": _percentile(latencies, 95)}
+
+
+@router.get("/ai/routing/stats")
+async def routing_stats(recent: int = Query(20, ge=0, le=200)):
+    """Recent local/remote routing decisions with latency percentiles."""
+    entries = list(_ROUTE_LOG)
+    by_route, by_backend, reasons = {}, {}, {}
+    for e in entries:
+        by_route.setdefault(e["route"], []).append(e)
+        by_backend.setdefault(e["served_by"], []).append(e)
+        reasons[e["reason"]] = reasons.get(e["reason"], 0) + 1
+    return {
+        "mode": LLM_ROUTING,
+        "thresholds": {
+            "local_max_prompt_tokens": LLM_ROUTE_LOCAL_MAX_PROMPT_TOKENS,
+            "local_max_output_tokens": LLM_LOCAL_MAX_NEW_TOKENS,
+            "tokens_per_question": LLM_ROUTE_TOKENS_PER_QUESTION,
+            "local_max_pending": LLM_ROUTE_LOCAL_MAX_PENDING,
+        },
+        "overall": _latency_summary(entries),
+        "routes": {k: _latency_summary(v) for k, v in by_route.items()},
+        "served_by": {k: _latency_summary(v) for k, v in by_backend.items()},
+        "reasons": reasons,
+        # Requests answered locally that never touched the remote rate budget
+        "remote_calls_saved": sum(1 for e in entries if e["route"] == "local" and e["served_by"] == "local"),
+        "recent": entries[-recent:] if recent else [],
+    }
+
+
+async def llm_chat(
+    system_prompt: str,
+    user_prompt: str,
+    image_b64: str | None = None,
+    cache_key: str | None = None,
+    image_mime: str = "image/png",
+):
+    """Answer with the first backend that succeeds, in the order chosen by route_request.
+
+    Remote (OpenRouter, with its own model fallbacks), OpenAI and the local
+    model are tried in route order; the degraded summary is the last resort.
+    The blocking HTTP calls run in the threadpool; the local model is awaited
+    through the worker's async queue. The decision and its latency are
+    recorded for /ai/routing/stats.
+    """
+    route, details = await run_in_threadpool(route_request, system_prompt, user_prompt, image_b64)
+    started = time.time()
+
+    def remote():
+        try:
+            return openrouter_chat(
+                system_prompt, user_prompt, image_b64,
+                cache_key=cache_key, image_mime=image_mime,
+            )
+        except Exception as e:
+            print(f"OpenRouter call failed: {e}")
+            return None
+
+    async def local():
+        return await _local_agenerate(system_prompt, user_prompt) or None
+
+    def openai():
+        return _openai_chat(system_prompt, user_prompt)
+
+    steps = {"remote": remote, "openai": openai}
+    for name in _route_order(route):
+        answer = await local() if name == "local" else await run_in_threadpool(steps[name])
+        if answer is not None:
+            served_by = "degraded" if answer.startswith(DEGRADED_PREFIX) else name
+            record_route(route, details, served_by, started)
+            return answer
+
+    # Final degraded fallback if everything else fails
+    record_route(route, details, "degraded", started)
+    return _degraded_local_answer(user_prompt)
+
+
+# ---------------- Streaming (SSE) ----------------
+def openrouter_chat_stream(
+    system_prompt: str,
+    user_prompt: str,
+    image_base64: str | None = None,
+    image_mime: str = "image/png",
+    model_chain: list[str] | None = None,
+):
+    """Yield content deltas from OpenRouter's streaming API.
+
+    Walks the same model chain as openrouter_chat, but without per-model retries:
+    a 429/HTTP error before the first token moves on to the next model, an error
+    after tokens were sent is raised (the client already has a partial answer).
+    """
+    if not OPENROUTER_KEY:
+        raise HTTPException(status_code=500, detail="OPENROUTER_KEY not configured on server")
+    model_chain = model_chain or _model_chain(image_base64)
+    headers = {
+        "Authorization": f"Bearer {OPENROUTER_KEY}",
+        "Content-Type": "application/json",
+    }
+    last_error = None
+    for model in model_chain:
+        if not _model_available(model):
+            continue
+        if not _rate_limit_ok():
+            raise HTTPException(status_code=429, detail="Local rate limit exceeded; please wait a few seconds and retry.")
+        text = fit_user_prompt(model, system_prompt, user_prompt)
+        if image_base64 and model == model_chain[0]:
+            user_content = [
+                {"type": "text", "text": text},
+                {"type": "image_url", "image_url": {"url": f"data:{image_mime};base64,{image_base64}"}},
+            ]
+        else:
+            user_content = text
+        payload = {
+            "model": model,
+            "stream": True,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_content},
+            ],
+        }
+        yielded = False
+        try:
+            with requests.post(
+                f"{OPENROUTER_BASE}/chat/completions",
+                json=payload,
+                timeout=90,
+                headers=headers,
+                stream=True,
+            ) as resp:
+                if resp.status_code == 429:
+                    _apply_cooldown(model, 1)
+                    last_error = f"429 from model {model}"
+                    continue
+                if not resp.ok:
+                    last_error = f"HTTP {resp.status_code} from model {model}: {resp.text[:200]}"
+                    continue
+                for line in resp.iter_lines(decode_unicode=True):
+                    # Skip keep-alive comments (": OPENROUTER PROCESSING") and blank lines
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        chunk = json.loads(data)
+                    except ValueError:
+                        continue
+                    delta = chunk.get("choices", [{}])[0].get("delta", {}).get("content")
+                    if delta:
+                        yielded = True
+                        yield delta
+                if yielded:
+                    return
+                last_error = f"Empty stream from model {model}"
+        except requests.RequestException as e:
+            if yielded:
+                raise
+            last_error = f"Request error model {model}: {e}"
+    raise RuntimeError(last_error or "No OpenRouter model available")
+
+
+def _local_generate_stream(system_prompt: str, user_prompt: str):
+    """Yield text from the local HF model as the worker generates it."""
+    user_prompt = _local_user_prompt(system_prompt, user_prompt)
+    return local_llm.stream(system_prompt, user_prompt, static_prefix=_local_static_prefix(user_prompt))
+
+
+def llm_chat_stream(
+    system_prompt: str,
+    user_prompt: str,
+    image_b64: str | None = None,
+    cache_key: str | None = None,
+    image_mime: str = "image/png",
+):
+    """Streaming counterpart of llm_chat (same routing and fallback order).
+
+    Yields text chunks. An answer streamed from OpenRouter is written to the
+    LLM cache at the end, under the same digest openrouter_chat uses, so a later
+    non-streaming request for the same prompt is a cache hit. Local and OpenAI
+    answers are not cached, as in llm_chat.
+    """
+    digest = _llm_cache_digest(system_prompt, user_prompt, image_b64, cache_key)
+    if digest in _LLM_CACHE:
+        yield _LLM_CACHE[digest]
+        return
+
+    def remote():
+        return openrouter_chat_stream(system_prompt, user_prompt, image_b64, image_mime)
+
+    def local():
+        return _local_generate_stream(system_prompt, user_prompt)
+
+    def openai():
+        answer = _openai_chat(system_prompt, user_prompt)
+        return [answer] if answer else []
+
+    route, details = route_request(system_prompt, user_prompt, image_b64)
+    started = time.time()
+    steps = {"remote": remote, "local": local, "openai": openai}
+    parts: list[str] = []
+    for name in _route_order(route):
+        try:
+            for chunk in steps[name]():
+                parts.append(chunk)
+                yield chunk
+        except Exception as e:
+            if parts:
+                raise
+            print(f"{name} stream failed: {e}")
+        if parts:
+            answer = "".join(parts)
+            record_route(route, details, "degraded" if answer.startswith(DEGRADED_PREFIX) else name, started)
+            if name == "remote":
+                _llm_cache_put(digest, answer)
+            return
+
+    # Final degraded fallback if everything else fails
+    record_route(route, details, "degraded", started)
+    yield _degraded_local_answer(user_prompt)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def sse_response(chunks, source: str, on_complete=None, extra: dict | None = None) -> StreamingResponse:
+    """Wrap an iterator of text chunks as a text/event-stream response.
+
+    Events: `token` ({"text": ...}) per chunk, then `done` ({"source": ..., **extra}),
+    or `error` ({"detail": ...}) if generation fails part way.
+    """
+    def events():
+        parts = []
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                yield _sse("token", {"text": chunk})
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+            return
+        if on_complete:
+            on_complete("".join(parts))
+        yield _sse("done", {"source": source, **(extra or {})})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+SOLVE_PAPER_SYSTEM_PROMPT = (
+    "You are an academic assistant that provides concise, structured solutions to exam questions. "
+    "Explain reasoning, show working for calculations, and if multiple distinct questions appear, number answers. "
+    "If an image is provided, use it to infer any formulas, diagrams or figures referenced."
+    "Do not ask for more information."
+)
+
+
+SOLVE_PAPER_INSTRUCTIONS = textwrap.dedent(
+    """
+    Provide solutions / guidance for the following exam page excerpt. If multiple questions or sub‑parts appear, address each separately.
+
+    Return:
+    1. List of identified question numbers (if discernible). Do not provide the question text.
+    2. Step-by-step reasoning / working
+    3. Final answer(s). Multiple-choice questions must have only 1 answer.
+    4. Key concepts involved
+    """
+).strip()
+
+
+def build_solve_paper_prompt(raw_text: str, model: str | None = None, image: bool = False) -> str:
+    """Instructions followed by as much of the page text as fits the model's context.
+
+    The page text goes last and is trimmed at question boundaries, so any later
+    per-model trim (context fit, 429 retry) drops whole trailing questions and
+    never the instructions.
+    """
+    model = model or budget_model(image)
+    note = "(Note: text truncated for length; later questions omitted.)"
+    budget = prompt_budget(model, SOLVE_PAPER_SYSTEM_PROMPT, SOLVE_PAPER_INSTRUCTIONS, note, "Text:")
+    text, _, truncated = fit_text(raw_text, model, budget)
+    prompt = f"{SOLVE_PAPER_INSTRUCTIONS}\n\nText:\n{text if text else '(no text provided)'}"
+    return f"{prompt}\n\n{note}" if truncated else prompt
+
+
+def estimate_prompt_tokens(system_prompt: str, user_prompt: str, image: bool = False) -> int:
+    model = budget_model(image)
+    return count_tokens(system_prompt, model) + count_tokens(user_prompt, model)
+
+
+def page_cache_key(course_code: str, filename: str, page_number: int) -> str:
+    return f"page|{course_code}/{filename}|{page_number}"
+
+
+def solution_store_key(course_code: str, filename: str, page_number: int, model: str = SOLUTION_STORE_MODEL) -> str:
+    safe_model = model.replace("/", "__").replace(":", "_")
+    return f"{SOLUTION_STORE_PREFIX}/{course_code}/{filename}/{page_number}/{safe_model}.json"
+
+
+def get_stored_solution(course_code: str, filename: str, page_number: int, s3=None) -> str | None:
+    """Return a precomputed answer for the page, or None on a miss."""
+    s3 = s3 or s3_client()
+    try:
+        obj = s3.get_object(Bucket=S3_BUCKET, Key=solution_store_key(course_code, filename, page_number))
+        return json.loads(obj["Body"].read().decode("utf-8")).get("answer") or None
+    except Exception:
+        return None
+
+
+def put_stored_solution(
+    course_code: str, filename: str, page_number: int, answer: str, s3=None, model: str = SOLUTION_STORE_MODEL
+):
+    """Store an answer under the key of the model that actually generated it."""
+    s3 = s3 or s3_client()
+    record = {
+        "course_code": course_code,
+        "filename": filename,
+        "page_number": page_number,
+        "model": model,
+        "answer": answer,
+        "generated_at": time.time(),
+    }
+    s3.put_object(
+        Bucket=S3_BUCKET,
+        Key=solution_store_key(course_code, filename, page_number, model),
+        Body=json.dumps(record, ensure_ascii=False).encode("utf-8"),
+        ContentType="application/json",
+    )
+
+
+async def _solve_paper(
+    raw_text: str,
+    image_bytes: bytes | None,
+    course_code: str | None,
+    filename: str | None,
+    page_number,
+    stream: bool = False,
+):
+    """Shared body of the JSON and multipart solve-paper endpoints."""
+    def respond(answer: str, source: str):
+        if stream:
+            return sse_response([answer], source)
+        return {"answer": answer, "source": source}
+
+    page_mode = not raw_text and bool(course_code and filename and page_number)
+
+    cache_key = None
+    if page_mode:
+        try:
+            page_number = int(page_number)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="'page_number' must be an integer")
+        if not image_bytes:
+            # A page answered before is served from memory, before any PDF or S3 read
+            cache_key = page_cache_key(course_code, filename, page_number)
+            cached = _LLM_CACHE.get(_llm_cache_digest(SOLVE_PAPER_SYSTEM_PROMPT, "", None, cache_key))
+            if cached:
+                return respond(cached, "cache")
+        raw_text, _ = await run_in_threadpool(get_page_text, course_code, filename, page_number)
+        if not raw_text and not image_bytes:
+            # Scanned page with no text layer: the client has to send an image instead
+            raise HTTPException(status_code=422, detail="No extractable text on this page; send an image")
+        if not image_bytes:
+            stored = await run_in_threadpool(get_stored_solution, course_code, filename, page_number)
+            if stored:
+                _llm_cache_put(_llm_cache_digest(SOLVE_PAPER_SYSTEM_PROMPT, "", None, cache_key), stored)
+                return respond(stored, "store")
+    if not raw_text and not image_bytes:
+        raise HTTPException(status_code=400, detail="Provide 'text', an image or course_code/filename/page_number")
+
+    image_b64 = image_mime = image_scope = image_hash = None
+    if image_bytes:
+        image_b64, image_mime, image_hash = await run_in_threadpool(prepare_vision_image, image_bytes)
+        # The hash alone can't tell apart two pages with a similar layout, so the
+        # cache is only used within a scope that identifies the page: its
+        # identifiers, or else its text. An image with neither is never cached.
+        if course_code and filename and page_number:
+            image_scope = page_cache_key(course_code, filename, page_number)
+        elif raw_text:
+            image_scope = "text|" + hashlib.sha256(raw_text.encode("utf-8")).hexdigest()
+        if image_scope:
+            cached = get_image_solution(image_scope, image_hash)
+            if cached:
+                return respond(cached, "image-cache")
+
+    def remember(answer: str):
+        if image_scope and answer and not answer.startswith(DEGRADED_PREFIX):
+            put_image_solution(image_scope, image_hash, answer)
+
+    user_prompt = await run_in_threadpool(build_solve_paper_prompt, raw_text, None, bool(image_b64))
+    usage = {
+        "prompt_tokens": estimate_prompt_tokens(SOLVE_PAPER_SYSTEM_PROMPT, user_prompt, bool(image_b64))
+    }
+    if stream:
+        chunks = llm_chat_stream(
+            SOLVE_PAPER_SYSTEM_PROMPT, user_prompt, image_b64, cache_key, image_mime or "image/png"
+        )
+        return sse_response(chunks, "live", on_complete=remember, extra=usage)
+    answer = await llm_chat(
+        SOLVE_PAPER_SYSTEM_PROMPT, user_prompt, image_b64, cache_key, image_mime or "image/png"
+    )
+    remember(answer)
+    return {"answer": answer, "source": "live", **usage}
+
+
 # --- AI assistance for a page/viewport of a past paper ---
 @router.post("/ai/solve-paper")
-async def solve_paper(payload: dict):
+async def solve_paper(
+    payload: dict,
+    stream: bool = Query(False, description="Stream the answer as Server-Sent Events"),
+):
     """Generate an AI solution / explanation for the supplied past paper viewport.
 
     Accepts JSON with:
-      - text: (string) extracted text of current page/viewport (required if no image)
+      - text: (string) extracted text of current page/viewport (required if no image or page identifiers)
       - image_base64: (optional) PNG image (base64, no data URL header) of the page/viewport
-      - course_code / filename / page_number: optional metadata
+      - course_code / filename / page_number: page identifiers. When given without
+        `text`, the answer comes from the per-page cache or else the precomputed
+        solution store if present; otherwise the page text is extracted
+        server-side and the answer is cached per page.
+
+    Prefer /ai/solve-paper/upload for images: it avoids the base64 overhead.
+    With ?stream=true the answer is sent as text/event-stream `token` events
+    followed by a `done` event. Live answers include `prompt_tokens`, the
+    token-counted size of the prompt sent to the model.
     """
     if not isinstance(payload, dict):
         raise HTTPException(status_code=400, detail="Invalid JSON body")
-    raw_text = (payload.get("text") or "").strip()
-    image_b64 = payload.get("image_base64")
-    if not raw_text and not image_b64:
-        raise HTTPException(status_code=400, detail="Provide at least 'text' or 'image_base64'")
-
-    max_chars = 12000
-    truncated = raw_text[:max_chars]
-    truncated_note = "" if len(raw_text) <= max_chars else "\n\n(Note: text truncated for length.)"
-
-    # meta_bits = []
-    # for key in ("course_code", "filename", "page_number"):
-    #     if key in payload and payload[key] not in (None, ""):
-    #         meta_bits.append(f"{key}={payload[key]}")
-    # meta_line = ("Context: " + ", ".join(meta_bits)) if meta_bits else "Context: (not provided)"
-
-    system_prompt = (
-        "You are an academic assistant that provides concise, structured solutions to exam questions. "
-        "Explain reasoning, show working for calculations, and if multiple distinct questions appear, number answers. "
-        "If an image is provided, use it to infer any formulas, diagrams or figures referenced."
-        "Do not ask for more information."
+    image_bytes = None
+    if payload.get("image_base64"):
+        try:
+            image_bytes = base64.b64decode(payload["image_base64"], validate=False)
+        except (binascii.Error, ValueError):
+            raise HTTPException(status_code=400, detail="'image_base64' is not valid base64")
+    return await _solve_paper(
+        (payload.get("text") or "").strip(),
+        image_bytes,
+        payload.get("course_code"),
+        payload.get("filename"),
+        payload.get("page_number"),
+        stream=stream,
     )
-    user_prompt = textwrap.dedent(
-        f"""
-
-        Provide solutions / guidance for the following exam page excerpt. If multiple questions or sub‑parts appear, address each separately.
-        Text (may be truncated):\n{truncated if truncated else '(no text provided)'}
-
-        Return:
-        1. List of identified question numbers (if discernible). Do not provide the question text.
-        2. Step-by-step reasoning / working
-        3. Final answer(s). Multiple-choice questions must have only 1 answer.
-        4. Key concepts involved
-        {truncated_note}
-        """
-    ).strip()
-
-    # Use OpenRouter by default, fallback to OpenAI if configured, then local model as last resort
-    def llm_chat(system_prompt: str, user_prompt: str, image_b64: str | None = None):
-        # Try OpenRouter first (unless configured to use local first)
-        if not LLM_USE_LOCAL_FIRST:
-            try:
-                return openrouter_chat(system_prompt, user_prompt, image_b64)
-            except Exception as e:
-                print(f"OpenRouter call failed: {e}")
-        
-        # If OpenRouter fails or LLM_USE_LOCAL_FIRST=true, try local model
-        if LLM_USE_LOCAL_FIRST:
-            local_answer = _local_generate(system_prompt, user_prompt)
-            if local_answer:
-                return local_answer
-        
-        # If local failed/skipped and OpenAI configured, try that
-        if OPENAI_API_KEY:
-            try:
-                headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
-                messages = [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ]
-                payload = {
-                    "model": OPENAI_MODEL,
-                    "messages": messages,
-                    "temperature": 0.2,
-                    "max_tokens": 900,
-                }
-                resp = requests.post("https://api.openai.com/v1/chat/completions", json=payload, headers=headers, timeout=30)
-                resp.raise_for_status()
-                data = resp.json()
-                return data.get("choices", [{}])[0].get("message", {}).get("content", "")
-            except requests.RequestException as e:
-                print(f"OpenAI call failed: {e}")
-        
-        # If we haven't tried local yet, try it now
-        if not LLM_USE_LOCAL_FIRST:
-            local_answer = _local_generate(system_prompt, user_prompt)
-            if local_answer:
-                return local_answer
-        
-        # Final degraded fallback if everything else fails
-        return _degraded_local_answer(user_prompt)
 
-    # Call with correct keyword matching llm_chat parameter (image_b64)
-    answer = llm_chat(system_prompt, user_prompt, image_b64=image_b64)
-    return {"answer": answer}
+
+@router.post("/ai/solve-paper/upload")
+async def solve_paper_upload(
+    image: UploadFile | None = File(None),
+    text: str = Form(""),
+    course_code: str | None = Form(None),
+    filename: str | None = Form(None),
+    page_number: int | None = Form(None),
+    stream: bool = Query(False, description="Stream the answer as Server-Sent Events"),
+):
+    """Multipart variant of /ai/solve-paper: the page image is sent as a binary file part.
+
+    The image is downscaled and recompressed server-side (LLM_VISION_MAX_SIDE,
+    LLM_VISION_JPEG_QUALITY) before it is forwarded to the vision model.
+    """
+    image_bytes = None
+    if image is not None:
+        image_bytes = await image.read(LLM_VISION_MAX_UPLOAD_BYTES + 1)
+        if len(image_bytes) > LLM_VISION_MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail="Image too large")
+    return await _solve_paper(
+        text.strip(), image_bytes or None, course_code, filename, page_number, stream=stream
+    )
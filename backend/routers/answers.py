@@ -3,6 +3,7 @@ from pydantic import BaseModel
 import os
 import httpx
 import json
+from supabase_utils import keyset_params, next_cursor, count_headers, content_range_total
 
 # Supabase config
 SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -63,25 +64,42 @@ async def add_answers_bulk(request: BulkAnswersRequest):
 from fastapi import Query
 
 
+# Keyset sort column for answer listings
+ANSWER_SORT_KEYS = ("id",)
+
+
 @router.get("/all/answers")
-async def get_answers(user_id: str = Query(None), quiz_id: str = Query(None)):
+async def get_answers(
+    user_id: str = Query(None),
+    quiz_id: str = Query(None),
+    limit: int = Query(None, ge=1, le=1000, description="Page size (all answers if omitted)"),
+    cursor: str = Query(None, description="next_cursor from the previous page"),
+    include_total: bool = Query(False, description="Include an estimated total count"),
+):
     """Get all answers from Supabase, optionally filtered by user_id and quiz_id"""
+    # Pagination is opt-in (limit or cursor) so existing callers still get every answer
+    query_params = keyset_params(ANSWER_SORT_KEYS, cursor, limit or 100) if limit or cursor else {}
     try:
-        # Build query string for Supabase
-        query_params = []
+        # Build query params for Supabase
         if user_id:
-            query_params.append(f"user_id=eq.{user_id}")
+            query_params["user_id"] = f"eq.{user_id}"
         if quiz_id:
-            query_params.append(f"quiz_id=eq.{quiz_id}")
-        query_string = "&".join(query_params)
-        url = f"{SUPABASE_REST_URL}/answers"
-        if query_string:
-            url += f"?{query_string}"
+            query_params["quiz_id"] = f"eq.{quiz_id}"
         async with httpx.AsyncClient() as client:
-            resp = await client.get(url, headers=get_supabase_headers())
-            if resp.status_code != 200:
+            resp = await client.get(
+                f"{SUPABASE_REST_URL}/answers",
+                headers=count_headers(include_total),
+                params=query_params,
+            )
+            if resp.status_code not in [200, 206]:
                 raise HTTPException(status_code=resp.status_code, detail=resp.text)
-            return {"answers": resp.json()}
+            answers = resp.json()
+            result = {"answers": answers}
+            if limit or cursor:
+                result["next_cursor"] = next_cursor(answers, ANSWER_SORT_KEYS, limit or 100)
+            if include_total:
+                result["total"] = content_range_total(resp)
+            return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
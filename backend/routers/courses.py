@@ -1,4 +1,5 @@
 from fastapi import APIRouter, HTTPException, status, Query
+import asyncio
 import httpx
 from typing import Optional, List
 import urllib.parse
@@ -10,9 +11,18 @@ from models import (
 
 from uuid import UUID
 from config import get_supabase_headers, SUPABASE_REST_URL, logger
+from supabase_utils import (
+    fetch_by_ids, content_range_total, chunked, run_checks,
+    keyset_params, next_cursor, count_headers
+)
+import course_index
+from course_cache import cache as course_cache
 
 router = APIRouter()
 
+# Keyset sort columns for course listings
+COURSE_SORT_KEYS = ("name", "id")
+
 # Course Management Endpoints
 @router.get("/courses")
 async def get_courses(
@@ -22,18 +32,17 @@ async def get_courses(
     type: Optional[str] = Query(None, description="Filter courses by type"),
     limit: Optional[int] = Query(100, description="Limit number of results"),
     offset: Optional[int] = Query(0, description="Offset for pagination"),
-    include_enrollment_count: bool = Query(False, description="Include enrollment count for each course")
+    include_enrollment_count: bool = Query(False, description="Include enrollment count for each course"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page (replaces offset)"),
+    include_total: bool = Query(False, description="Include an estimated total count")
 ):
     """Get all courses with optional filtering"""
     try:
         async with httpx.AsyncClient() as client:
-            # Build query parameters
-            params = {
-                "select": "*",
-                "limit": str(limit),
-                "offset": str(offset),
-                "order": "name.asc"
-            }
+            # Build query parameters (ordered by name, id so pages can continue from a cursor)
+            params = {"select": "*", **keyset_params(COURSE_SORT_KEYS, cursor, limit)}
+            if not cursor:
+                params["offset"] = str(offset)
             
             # Add filters if provided
             if name:
@@ -44,14 +53,18 @@ async def get_courses(
                 params["period"] = f"eq.{period}"
             if type:
                 params["type"] = f"eq.{type}"
+            # Count enrollments in the same query (PostgREST aggregate over the
+            # enrollments.course_id relationship) instead of fetching rows per course
+            if include_enrollment_count:
+                params["select"] = "*,enrollments(count)"
             
             response = await client.get(
                 f"{SUPABASE_REST_URL}/courses",
-                headers=get_supabase_headers(),
+                headers=count_headers(include_total),
                 params=params
             )
             
-            if response.status_code != 200:
+            if response.status_code not in [200, 206]:
                 raise HTTPException(
                     status_code=response.status_code,
                     detail=f"Supabase API error: {response.text}"
@@ -62,32 +75,24 @@ async def get_courses(
             # Optionally include enrollment count
             if include_enrollment_count:
                 for course in courses:
-                    try:
-                        enrollment_response = await client.get(
-                            f"{SUPABASE_REST_URL}/enrollments",
-                            headers=get_supabase_headers(),
-                            params={
-                                "course_id": f"eq.{course['id']}",
-                                "select": "id"
-                            }
-                        )
-                        if enrollment_response.status_code == 200:
-                            enrollments = enrollment_response.json()
-                            course['enrollment_count'] = len(enrollments)
-                        else:
-                            course['enrollment_count'] = 0
-                    except Exception:
-                        course['enrollment_count'] = 0
+                    counts = course.pop('enrollments', None) or [{}]
+                    course['enrollment_count'] = counts[0].get('count', 0)
             
             logger.info(f"Retrieved {len(courses)} courses")
             
-            return {
+            result = {
                 "courses": courses,
                 "count": len(courses),
                 "limit": limit,
-                "offset": offset
+                "offset": offset,
+                "next_cursor": next_cursor(courses, COURSE_SORT_KEYS, limit)
             }
+            if include_total:
+                result["total"] = content_range_total(response)
+            return result
             
+    except HTTPException:
+        raise
     except httpx.RequestError as e:
         logger.error(f"Request error: {str(e)}")
         raise HTTPException(
@@ -101,18 +106,23 @@ async def get_courses(
             detail=f"Failed to retrieve courses: {str(e)}"
         )
     
-@router.get("/courses/search-by-code")
-async def search_course_by_code(code: str = Query(..., description="Course code, e.g. DECO2500")):
-    """Search for a course by code and return its id."""
+@router.get("/courses/autocomplete")
+async def autocomplete_courses(
+    q: str = Query(..., min_length=1, description="Partial course code or title, e.g. csse23"),
+    limit: int = Query(6, ge=1, le=50, description="Maximum number of suggestions")
+):
+    """Course suggestions for the course picker, served from the in-memory course index"""
+    if course_index.index.ready:
+        courses = course_index.index.search(q, limit)
+        return {"courses": courses, "count": len(courses), "source": "index"}
+
+    # Index not loaded yet (startup, or Supabase was unreachable): search the table directly
     try:
         async with httpx.AsyncClient() as client:
             response = await client.get(
                 f"{SUPABASE_REST_URL}/courses",
                 headers=get_supabase_headers(),
-                params={
-                    "name": f"eq.{code}",
-                    "select": "id,name"
-                }
+                params={"select": "*", "name": f"ilike.%{q}%", "order": "name.asc", "limit": str(limit)}
             )
             if response.status_code != 200:
                 raise HTTPException(
@@ -120,12 +130,28 @@ async def search_course_by_code(code: str = Query(..., description="Course code,
                     detail=f"Supabase API error: {response.text}"
                 )
             courses = response.json()
-            if not courses:
+            return {"courses": courses, "count": len(courses), "source": "database"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error autocompleting courses: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to search courses: {str(e)}"
+        )
+
+@router.get("/courses/search-by-code")
+async def search_course_by_code(code: str = Query(..., description="Course code, e.g. DECO2500")):
+    """Search for a course by code and return its id."""
+    try:
+        async with httpx.AsyncClient() as client:
+            course = await course_cache.get_by_code(client, code)
+            if not course:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="Course not found"
                 )
-            return {"id": courses[0]["id"], "name": courses[0]["name"]}
+            return {"id": course["id"], "name": course["name"]}
     except Exception as e:
         logger.error(f"Error searching course by code: {str(e)}")
         raise HTTPException(
@@ -134,72 +160,60 @@ async def search_course_by_code(code: str = Query(..., description="Course code,
         )
 
 @router.get("/courses/{course_id}")
-async def get_course(course_id: UUID, include_enrollments: bool = Query(False, description="Include enrolled users")):
+async def get_course(
+    course_id: UUID,
+    include_enrollments: bool = Query(False, description="Include enrolled users"),
+    enrollments_limit: int = Query(100, ge=1, le=1000, description="Enrollments per page"),
+    enrollments_offset: int = Query(0, ge=0, description="Offset into the enrollment list")
+):
     """Get a specific course by ID"""
     try:
         async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{SUPABASE_REST_URL}/courses",
-                headers=get_supabase_headers(),
-                params={
-                    "id": f"eq.{course_id}",
-                    "select": "*"
-                }
-            )
-            
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Supabase API error: {response.text}"
-                )
-            
-            courses = response.json()
-            if not courses:
+            course = await course_cache.get_by_id(client, course_id)
+            if not course:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="Course not found"
                 )
             
-            course = courses[0]
-            
             # Optionally include enrolled users
             if include_enrollments:
                 try:
+                    # One page of enrollments; the total comes back in Content-Range
                     enrollment_response = await client.get(
                         f"{SUPABASE_REST_URL}/enrollments",
-                        headers=get_supabase_headers(),
+                        headers={**get_supabase_headers(), "Prefer": "count=exact"},
                         params={
                             "course_id": f"eq.{course_id}",
-                            "select": "id,user_id,enrolled_at,semester,year,grade"
+                            "select": "id,user_id,enrolled_at,semester,year,grade",
+                            "order": "enrolled_at.asc,id.asc",
+                            "limit": str(enrollments_limit),
+                            "offset": str(enrollments_offset)
                         }
                     )
                     
-                    if enrollment_response.status_code == 200:
+                    if enrollment_response.status_code in [200, 206]:
                         enrollments = enrollment_response.json()
                         
-                        # Get user details for each enrollment
+                        # Get user details for the page in bulk (chunked in.() lookups, run concurrently)
+                        users = await fetch_by_ids(
+                            client, "users", (e['user_id'] for e in enrollments), "id,email"
+                        )
                         for enrollment in enrollments:
-                            user_response = await client.get(
-                                f"{SUPABASE_REST_URL}/users",
-                                headers=get_supabase_headers(),
-                                params={
-                                    "id": f"eq.{enrollment['user_id']}",
-                                    "select": "id,email"
-                                }
-                            )
-                            if user_response.status_code == 200:
-                                users = user_response.json()
-                                if users:
-                                    enrollment['user'] = users[0]
+                            if enrollment['user_id'] in users:
+                                enrollment['user'] = users[enrollment['user_id']]
                         
                         course['enrollments'] = enrollments
-                        course['enrollment_count'] = len(enrollments)
+                        total = content_range_total(enrollment_response)
+                        course['enrollment_count'] = total if total is not None else len(enrollments)
                     else:
                         course['enrollments'] = []
                         course['enrollment_count'] = 0
                 except Exception:
                     course['enrollments'] = []
                     course['enrollment_count'] = 0
+                course['enrollments_limit'] = enrollments_limit
+                course['enrollments_offset'] = enrollments_offset
             
             return {"course": course}
             
@@ -264,6 +278,8 @@ async def create_course(course: CourseCreate):
                 )
             
             created_course = created_courses[0] if isinstance(created_courses, list) else created_courses
+            course_index.index.upsert(created_course)
+            course_cache.put(created_course)
             
             logger.info(f"Course created: {created_course.get('name', 'unknown')}")
             
@@ -296,20 +312,23 @@ async def update_course(course_id: UUID, course_update: CourseUpdate):
         
         async with httpx.AsyncClient() as client:
             # Check if course exists
-            check_response = await client.get(
-                f"{SUPABASE_REST_URL}/courses",
-                headers=get_supabase_headers(),
-                params={"id": f"eq.{course_id}", "select": "*"}
-            )
-            
-            if check_response.status_code != 200 or not check_response.json():
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Course not found"
+            async def check_exists():
+                check_response = await client.get(
+                    f"{SUPABASE_REST_URL}/courses",
+                    headers=get_supabase_headers(),
+                    params={"id": f"eq.{course_id}", "select": "*"}
                 )
+                
+                if check_response.status_code != 200 or not check_response.json():
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND,
+                        detail="Course not found"
+                    )
+                
+                return check_response.json()[0]
             
             # If updating name, check for duplicates
-            if 'name' in update_data:
+            async def check_name_free():
                 duplicate_check = await client.get(
                     f"{SUPABASE_REST_URL}/courses",
                     headers=get_supabase_headers(),
@@ -327,6 +346,11 @@ async def update_course(course_id: UUID, course_update: CourseUpdate):
                             detail="Course with this name already exists"
                         )
             
+            checks = [check_exists()]
+            if 'name' in update_data:
+                checks.append(check_name_free())
+            old_course = (await run_checks(*checks))[0]
+            
             # Update the course
             response = await client.patch(
                 f"{SUPABASE_REST_URL}/courses",
@@ -349,6 +373,11 @@ async def update_course(course_id: UUID, course_update: CourseUpdate):
                 )
             
             updated_course = updated_courses[0] if isinstance(updated_courses, list) else updated_courses
+            # Upserting by id replaces the old code's terms in the index; the cache
+            # also drops the entry under the old code in case only that key was cached
+            course_index.index.upsert(updated_course)
+            course_cache.invalidate(course_id, old_course.get("name"))
+            course_cache.put(updated_course)
             
             logger.info(f"Course {course_id} updated successfully")
             
@@ -372,25 +401,29 @@ async def delete_course(course_id: UUID, force: bool = Query(False, description=
     try:
         async with httpx.AsyncClient() as client:
             # Check if course exists
-            check_response = await client.get(
-                f"{SUPABASE_REST_URL}/courses",
-                headers=get_supabase_headers(),
-                params={"id": f"eq.{course_id}", "select": "id,name"}
-            )
-            
-            if check_response.status_code != 200 or not check_response.json():
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Course not found"
+            async def check_exists():
+                check_response = await client.get(
+                    f"{SUPABASE_REST_URL}/courses",
+                    headers=get_supabase_headers(),
+                    params={"id": f"eq.{course_id}", "select": "id,name"}
                 )
+                
+                if check_response.status_code != 200 or not check_response.json():
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND,
+                        detail="Course not found"
+                    )
+                
+                return check_response.json()[0]
             
-            course_info = check_response.json()[0]
-            
-            # Check for existing enrollments
-            enrollments_response = await client.get(
-                f"{SUPABASE_REST_URL}/enrollments",
-                headers=get_supabase_headers(),
-                params={"course_id": f"eq.{course_id}", "select": "id"}
+            # Check for existing enrollments (read alongside the existence check)
+            course_info, enrollments_response = await run_checks(
+                check_exists(),
+                client.get(
+                    f"{SUPABASE_REST_URL}/enrollments",
+                    headers=get_supabase_headers(),
+                    params={"course_id": f"eq.{course_id}", "select": "id"}
+                )
             )
             
             if enrollments_response.status_code == 200:
@@ -421,6 +454,8 @@ async def delete_course(course_id: UUID, force: bool = Query(False, description=
                     status_code=delete_response.status_code,
                     detail=f"Supabase API error: {delete_response.text}"
                 )
+            course_index.index.remove(course_id)
+            course_cache.invalidate(course_id, course_info['name'])
             
             logger.info(f"Course {course_id} ({course_info['name']}) deleted successfully")
             
@@ -441,6 +476,77 @@ async def delete_course(course_id: UUID, force: bool = Query(False, description=
             detail=f"Failed to delete course: {str(e)}"
         )
 
+# Rows per bulk insert request when creating courses from UQ Library results
+COURSE_INSERT_CHUNK_SIZE = 200
+# Concurrent single-row inserts when a failed chunk is retried row by row
+COURSE_INSERT_CONCURRENCY = 8
+
+
+async def _bulk_create_courses(client: httpx.AsyncClient, courses: list[dict], skip_reason: str):
+    """Create courses that don't exist yet: one chunked name=in.() pre-check, then chunked bulk inserts.
+
+    `courses` are validated course_data dicts. Returns (synced, skipped, errors) in the
+    shape the sync endpoints report.
+    """
+    synced, skipped, errors = [], [], []
+
+    existing = await fetch_by_ids(client, "courses", (c["name"] for c in courses), "id,name", column="name")
+    pending, seen = [], set(existing)
+    for course_data in courses:
+        if course_data["name"] in seen:
+            skipped.append({"name": course_data["name"], "reason": skip_reason})
+            continue
+        seen.add(course_data["name"])
+        pending.append(course_data)
+
+    semaphore = asyncio.Semaphore(COURSE_INSERT_CONCURRENCY)
+
+    async def insert(rows):
+        """Returns ({name: created row}, None), or (None, error text) if the insert failed."""
+        async with semaphore:
+            try:
+                response = await client.post(
+                    f"{SUPABASE_REST_URL}/courses",
+                    headers=get_supabase_headers(),
+                    json=rows
+                )
+            except httpx.HTTPError as e:
+                return None, f"request error: {e}"
+        if response.status_code not in [200, 201]:
+            return None, response.text
+        return {row["name"]: row for row in response.json()}, None
+
+    for chunk in chunked(pending, COURSE_INSERT_CHUNK_SIZE):
+        created, error = await insert(chunk)
+        if created is None and len(chunk) > 1:
+            # One bad row fails the whole request; retry the chunk row by row to isolate it
+            created = {}
+            results = await asyncio.gather(*(insert([row]) for row in chunk))
+            for row, (single, single_error) in zip(chunk, results):
+                if single:
+                    created.update(single)
+                else:
+                    errors.append(f"Failed to create {row['name']}: {single_error}")
+        elif created is None:
+            errors.append(f"Failed to create {chunk[0]['name']}: {error}")
+            continue
+        for row in chunk:
+            if row["name"] in created:
+                course_index.index.upsert(created[row["name"]])
+                course_cache.put(created[row["name"]])
+                synced.append({
+                    "name": row["name"],
+                    "course_title": row["course_title"],
+                    "campus": row["campus"],
+                    "period": row["period"],
+                    "id": created[row["name"]].get("id")
+                })
+
+    if synced:
+        logger.info(f"Created {len(synced)} courses from UQ Library data")
+    return synced, skipped, errors
+
+
 # UQ Library Integration Endpoints
 @router.post("/sync-uq-courses", status_code=status.HTTP_201_CREATED)
 async def sync_uq_courses(hint: Optional[str] = Query(default=None)):
@@ -475,80 +581,38 @@ async def sync_uq_courses(hint: Optional[str] = Query(default=None)):
                     "errors": []
                 }
             
-            synced_courses = []
-            skipped_courses = []
             errors = []
+            candidates = []
             
-            # Process each course from UQ API
+            # Validate each course from UQ API
             for uq_course in uq_courses:
                 try:
-                    name = uq_course.get("name", "")
-                    url = uq_course.get("url", "")
-                    course_type = uq_course.get("type", "")
-                    course_title = uq_course.get("course_title", "")
-                    campus = uq_course.get("campus", "")
-                    period = uq_course.get("period", "")
-                    
-                    # Skip if essential data is missing
-                    if not all([name, url, course_type, course_title, campus, period]):
-                        errors.append(f"Skipping course - missing essential data: {uq_course}")
-                        continue
-                    
-                    # Check if course already exists
-                    existing_course = await client.get(
-                        f"{SUPABASE_REST_URL}/courses",
-                        headers=get_supabase_headers(),
-                        params={
-                            "name": f"eq.{name}",
-                            "select": "id,name"
-                        }
-                    )
-                    
-                    if existing_course.status_code == 200 and existing_course.json():
-                        skipped_courses.append({
-                            "name": name,
-                            "reason": "Course already exists"
-                        })
-                        continue
-                    
                     # Prepare course data - exact match to UQ API structure
                     course_data = {
-                        "name": name,
-                        "url": url,
-                        "type": course_type,
-                        "course_title": course_title,
-                        "campus": campus,
-                        "period": period
+                        "name": uq_course.get("name", ""),
+                        "url": uq_course.get("url", ""),
+                        "type": uq_course.get("type", ""),
+                        "course_title": uq_course.get("course_title", ""),
+                        "campus": uq_course.get("campus", ""),
+                        "period": uq_course.get("period", "")
                     }
                     
-                    # Create the course in Supabase
-                    create_response = await client.post(
-                        f"{SUPABASE_REST_URL}/courses",
-                        headers=get_supabase_headers(),
-                        json=course_data
-                    )
-                    
-                    if create_response.status_code not in [200, 201]:
-                        errors.append(f"Failed to create {name}: {create_response.text}")
+                    # Skip if essential data is missing
+                    if not all(course_data.values()):
+                        errors.append(f"Skipping course - missing essential data: {uq_course}")
                         continue
                     
-                    created_course_data = create_response.json()
-                    created_course = created_course_data[0] if isinstance(created_course_data, list) else created_course_data
-                    
-                    synced_courses.append({
-                        "name": name,
-                        "course_title": course_title,
-                        "campus": campus,
-                        "period": period,
-                        "id": created_course.get("id")
-                    })
-                    
-                    logger.info(f"Synced course from UQ Library: {name}")
+                    candidates.append(course_data)
                     
                 except Exception as course_error:
                     errors.append(f"Error processing course {uq_course.get('name', 'unknown')}: {str(course_error)}")
                     continue
             
+            synced_courses, skipped_courses, create_errors = await _bulk_create_courses(
+                client, candidates, "Course already exists"
+            )
+            errors.extend(create_errors)
+            
             return {
                 "message": f"Sync completed. {len(synced_courses)} courses added, {len(skipped_courses)} skipped, {len(errors)} errors",
                 "synced_courses": synced_courses,
@@ -570,73 +634,31 @@ async def sync_uq_courses(hint: Optional[str] = Query(default=None)):
 async def batch_create_courses(uq_courses: List[UQCourse]):
     """Create multiple courses from UQ Library API results"""
     try:
-        synced_courses = []
-        skipped_courses = []
         errors = []
+        candidates = []
+        
+        for uq_course in uq_courses:
+            # Create course data - exact match to UQ API
+            course_data = {
+                "name": uq_course.name,
+                "url": uq_course.url,
+                "type": uq_course.type,
+                "course_title": uq_course.course_title,
+                "campus": uq_course.campus,
+                "period": uq_course.period
+            }
+            
+            if not all(course_data.values()):
+                errors.append(f"Skipping course - missing essential data: {uq_course.name}")
+                continue
+            
+            candidates.append(course_data)
         
         async with httpx.AsyncClient() as client:
-            for uq_course in uq_courses:
-                try:
-                    name = uq_course.name
-                    url = uq_course.url
-                    course_type = uq_course.type
-                    course_title = uq_course.course_title
-                    campus = uq_course.campus
-                    period = uq_course.period
-                    
-                    if not all([name, url, course_type, course_title, campus, period]):
-                        errors.append(f"Skipping course - missing essential data: {name}")
-                        continue
-                    
-                    # Check if course already exists
-                    existing_course = await client.get(
-                        f"{SUPABASE_REST_URL}/courses",
-                        headers=get_supabase_headers(),
-                        params={
-                            "name": f"eq.{name}",
-                            "select": "id"
-                        }
-                    )
-                    
-                    if existing_course.status_code == 200 and existing_course.json():
-                        skipped_courses.append({
-                            "name": name,
-                            "reason": "Already exists"
-                        })
-                        continue
-                    
-                    # Create course data - exact match to UQ API
-                    course_data = {
-                        "name": name,
-                        "url": url,
-                        "type": course_type,
-                        "course_title": course_title,
-                        "campus": campus,
-                        "period": period
-                    }
-                    
-                    # Create in Supabase
-                    create_response = await client.post(
-                        f"{SUPABASE_REST_URL}/courses",
-                        headers=get_supabase_headers(),
-                        json=course_data
-                    )
-                    
-                    if create_response.status_code in [200, 201]:
-                        created_course_data = create_response.json()
-                        created_course = created_course_data[0] if isinstance(created_course_data, list) else created_course_data
-                        synced_courses.append({
-                            "name": name,
-                            "course_title": course_title,
-                            "campus": campus,
-                            "period": period,
-                            "id": created_course.get("id")
-                        })
-                    else:
-                        errors.append(f"Failed to create {name}: {create_response.text}")
-                        
-                except Exception as course_error:
-                    errors.append(f"Error processing {name}: {str(course_error)}")
+            synced_courses, skipped_courses, create_errors = await _bulk_create_courses(
+                client, candidates, "Already exists"
+            )
+        errors.extend(create_errors)
         
         return {
             "message": f"Batch processing completed. {len(synced_courses)} created, {len(skipped_courses)} skipped, {len(errors)} errors",
@@ -1,14 +1,60 @@
 from fastapi import APIRouter, HTTPException, status, Query, Body
+import asyncio
 import httpx
 from typing import Optional
 from models import (
     EnrollmentCreate
 )
 from config import get_supabase_headers, SUPABASE_REST_URL, logger
+from supabase_utils import (
+    fetch_by_ids, run_checks, keyset_params, next_cursor, count_headers, content_range_total
+)
+from course_cache import cache as course_cache
 from uuid import UUID
+from datetime import date, time
 
 router = APIRouter()
 
+# Keyset sort columns for enrollment listings
+ENROLLMENT_SORT_KEYS = ("enrolled_at", "id")
+
+
+def _normalize_value(value):
+    return None if value in (None, "") else value
+
+
+def _normalize_date(value):
+    # "2025-06-01", "2025-06-01T00:00:00" -> "2025-06-01"
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(str(value).strip()[:10]).isoformat()
+    except ValueError:
+        return str(value).strip()
+
+
+def _normalize_time(value):
+    # The client sends "HH:MM"; Postgres `time` columns come back as "HH:MM:SS"
+    if not value:
+        return None
+    try:
+        return time.fromisoformat(str(value).strip()).replace(tzinfo=None).isoformat(timespec="seconds")
+    except ValueError:
+        return str(value).strip()
+
+
+_ENROLLMENT_NORMALIZERS = {"exam_date": _normalize_date, "exam_time": _normalize_time}
+
+
+def enrollment_changed(row: dict, data: dict) -> bool:
+    """Whether writing `data` would change the stored enrollment `row` (ignoring formatting)."""
+    for key, value in data.items():
+        normalize = _ENROLLMENT_NORMALIZERS.get(key, _normalize_value)
+        if normalize(row.get(key)) != normalize(value):
+            return True
+    return False
+
+
 # Enrollment Management Endpoints (Many-to-Many relationship)
 @router.post("/enrollments", status_code=status.HTTP_201_CREATED)
 async def create_enrollment(enrollment: EnrollmentCreate):
@@ -16,48 +62,50 @@ async def create_enrollment(enrollment: EnrollmentCreate):
     try:
         async with httpx.AsyncClient() as client:
             # Check if user exists
-            user_response = await client.get(
-                f"{SUPABASE_REST_URL}/users",
-                headers=get_supabase_headers(),
-                params={"id": f"eq.{enrollment.user_id}", "select": "id"}
-            )
-            
-            if user_response.status_code != 200 or not user_response.json():
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="User not found"
+            async def check_user():
+                user_response = await client.get(
+                    f"{SUPABASE_REST_URL}/users",
+                    headers=get_supabase_headers(),
+                    params={"id": f"eq.{enrollment.user_id}", "select": "id"}
                 )
+                
+                if user_response.status_code != 200 or not user_response.json():
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND,
+                        detail="User not found"
+                    )
             
             # Check if course exists
-            course_response = await client.get(
-                f"{SUPABASE_REST_URL}/courses",
-                headers=get_supabase_headers(),
-                params={"id": f"eq.{enrollment.course_id}", "select": "id,name,course_title"}
-            )
-            
-            if course_response.status_code != 200 or not course_response.json():
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Course not found"
-                )
-            
-            course_info = course_response.json()[0]
+            async def check_course():
+                course = await course_cache.get_by_id(client, enrollment.course_id)
+                
+                if not course:
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND,
+                        detail="Course not found"
+                    )
+                return course
             
             # Check if user is already enrolled in this course
-            existing_enrollment = await client.get(
-                f"{SUPABASE_REST_URL}/enrollments",
-                headers=get_supabase_headers(),
-                params={
-                    "user_id": f"eq.{enrollment.user_id}",
-                    "course_id": f"eq.{enrollment.course_id}"
-                }
-            )
-            
-            if existing_enrollment.status_code == 200 and existing_enrollment.json():
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="User is already enrolled in this course"
+            async def check_not_enrolled():
+                existing_enrollment = await client.get(
+                    f"{SUPABASE_REST_URL}/enrollments",
+                    headers=get_supabase_headers(),
+                    params={
+                        "user_id": f"eq.{enrollment.user_id}",
+                        "course_id": f"eq.{enrollment.course_id}"
+                    }
                 )
+                
+                if existing_enrollment.status_code == 200 and existing_enrollment.json():
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="User is already enrolled in this course"
+                    )
+            
+            # The checks are independent: run them concurrently, stop at the first failure
+            _, course, _ = await run_checks(check_user(), check_course(), check_not_enrolled())
+            course_info = {k: course.get(k) for k in ("id", "name", "course_title")}
             
             # Create enrollment
             enrollment_data = {
@@ -117,16 +165,16 @@ async def get_enrollments(
     semester: Optional[str] = Query(None, description="Filter by semester"),
     year: Optional[int] = Query(None, description="Filter by year"),
     limit: Optional[int] = Query(100, description="Limit number of results"),
-    offset: Optional[int] = Query(0, description="Offset for pagination")
+    offset: Optional[int] = Query(0, description="Offset for pagination"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page (replaces offset)"),
+    include_total: bool = Query(False, description="Include an estimated total count")
 ):
     """Get enrollments with optional filtering"""
     try:
         async with httpx.AsyncClient() as client:
-            params = {
-                "select": "*",
-                "limit": str(limit),
-                "offset": str(offset)
-            }
+            params = {"select": "*", **keyset_params(ENROLLMENT_SORT_KEYS, cursor, limit)}
+            if not cursor:
+                params["offset"] = str(offset)
             
             # Add filters if provided
             if user_id:
@@ -140,11 +188,11 @@ async def get_enrollments(
             
             response = await client.get(
                 f"{SUPABASE_REST_URL}/enrollments",
-                headers=get_supabase_headers(),
+                headers=count_headers(include_total),
                 params=params
             )
             
-            if response.status_code != 200:
+            if response.status_code not in [200, 206]:
                 raise HTTPException(
                     status_code=response.status_code,
                     detail=f"Supabase API error: {response.text}"
@@ -152,36 +200,27 @@ async def get_enrollments(
             
             enrollments = response.json()
             
-            # Enrich with user and course data
+            # Enrich with user and course data: one batched lookup per table, run concurrently
+            users, courses = await asyncio.gather(
+                fetch_by_ids(client, "users", (e['user_id'] for e in enrollments), "id,email"),
+                fetch_by_ids(client, "courses", (e['course_id'] for e in enrollments), "id,name,course_title")
+            )
             for enrollment in enrollments:
-                # Get user info
-                user_response = await client.get(
-                    f"{SUPABASE_REST_URL}/users",
-                    headers=get_supabase_headers(),
-                    params={"id": f"eq.{enrollment['user_id']}", "select": "id,email"}
-                )
-                if user_response.status_code == 200:
-                    users = user_response.json()
-                    if users:
-                        enrollment['user'] = users[0]
-                
-                # Get course info
-                course_response = await client.get(
-                    f"{SUPABASE_REST_URL}/courses",
-                    headers=get_supabase_headers(),
-                    params={"id": f"eq.{enrollment['course_id']}", "select": "id,name,course_title"}
-                )
-                if course_response.status_code == 200:
-                    courses = course_response.json()
-                    if courses:
-                        enrollment['course'] = courses[0]
+                if enrollment['user_id'] in users:
+                    enrollment['user'] = users[enrollment['user_id']]
+                if enrollment['course_id'] in courses:
+                    enrollment['course'] = courses[enrollment['course_id']]
             
-            return {
+            result = {
                 "enrollments": enrollments,
                 "count": len(enrollments),
                 "limit": limit,
-                "offset": offset
+                "offset": offset,
+                "next_cursor": next_cursor(enrollments, ENROLLMENT_SORT_KEYS, limit)
             }
+            if include_total:
+                result["total"] = content_range_total(response)
+            return result
             
     except HTTPException:
         raise
@@ -252,25 +291,31 @@ async def update_enrollments(
 ):
     """
     Replace all enrollments for a user with the provided list.
+
+    Applies only the difference against the current enrollments: new courses are
+    bulk-inserted, changed ones bulk-upserted by id, and dropped ones deleted in
+    one request. Writes happen before the delete, so a failure part way never
+    leaves the user with fewer enrollments than they asked to keep. Dates and
+    times are compared normalised ("14:00" equals the stored "14:00:00"), so
+    resaving an unchanged list writes nothing.
     """
     try:
         async with httpx.AsyncClient() as client:
-            # Delete all existing enrollments for the user
-            del_response = await client.delete(
+            current_response = await client.get(
                 f"{SUPABASE_REST_URL}/enrollments",
                 headers=get_supabase_headers(),
-                params={"user_id": f"eq.{user_id}"}
+                params={"user_id": f"eq.{user_id}", "select": "*"}
             )
-            if del_response.status_code not in [200, 204]:
+            if current_response.status_code != 200:
                 raise HTTPException(
-                    status_code=del_response.status_code,
-                    detail=f"Failed to delete existing enrollments: {del_response.text}"
+                    status_code=current_response.status_code,
+                    detail=f"Failed to read existing enrollments: {current_response.text}"
                 )
 
-            # Add new enrollments
-            created = []
+            # Desired state, one row per course (last entry wins)
+            desired = {}
             for enrollment in enrollments:
-                enrollment_data = {
+                desired[str(enrollment.course_id)] = {
                     "user_id": str(user_id),
                     "course_id": str(enrollment.course_id),
                     "semester": enrollment.semester,
@@ -279,18 +324,85 @@ async def update_enrollments(
                     "exam_date": enrollment.exam_date,
                     "exam_time": enrollment.exam_time
                 }
-                create_response = await client.post(
+
+            current = {}
+            stale_ids = []
+            for row in current_response.json():
+                if row["course_id"] in desired and row["course_id"] not in current:
+                    current[row["course_id"]] = row
+                else:
+                    stale_ids.append(row["id"])  # dropped course, or a duplicate row for one
+
+            to_insert = [data for course_id, data in desired.items() if course_id not in current]
+            to_update = [
+                {"id": current[course_id]["id"], **data}
+                for course_id, data in desired.items()
+                if course_id in current and enrollment_changed(current[course_id], data)
+            ]
+
+            async def insert_rows():
+                if not to_insert:
+                    return []
+                response = await client.post(
+                    f"{SUPABASE_REST_URL}/enrollments",
+                    headers=get_supabase_headers(),
+                    json=to_insert
+                )
+                if response.status_code not in [200, 201]:
+                    raise HTTPException(
+                        status_code=response.status_code,
+                        detail=f"Failed to create enrollments: {response.text}"
+                    )
+                return response.json()
+
+            async def update_rows():
+                if not to_update:
+                    return []
+                response = await client.post(
+                    f"{SUPABASE_REST_URL}/enrollments",
+                    headers={
+                        **get_supabase_headers(),
+                        "Prefer": "return=representation,resolution=merge-duplicates"
+                    },
+                    params={"on_conflict": "id"},
+                    json=to_update
+                )
+                if response.status_code not in [200, 201]:
+                    raise HTTPException(
+                        status_code=response.status_code,
+                        detail=f"Failed to update enrollments: {response.text}"
+                    )
+                return response.json()
+
+            created, updated = await asyncio.gather(insert_rows(), update_rows())
+
+            if stale_ids:
+                del_response = await client.delete(
                     f"{SUPABASE_REST_URL}/enrollments",
                     headers=get_supabase_headers(),
-                    json=enrollment_data
+                    params={"id": f"in.({','.join(stale_ids)})"}
                 )
-                if create_response.status_code not in [200, 201]:
+                if del_response.status_code not in [200, 204]:
                     raise HTTPException(
-                        status_code=create_response.status_code,
-                        detail=f"Failed to create enrollment: {create_response.text}"
+                        status_code=del_response.status_code,
+                        detail=f"Failed to delete existing enrollments: {del_response.text}"
                     )
-                created.append(create_response.json())
-            return {"message": "Enrollments updated", "created": created}
+
+            changed = {row["course_id"]: row for row in [*created, *updated]}
+            merged = [changed.get(course_id) or current[course_id] for course_id in desired]
+            logger.info(
+                f"Enrollments for user {user_id}: {len(created)} added, "
+                f"{len(updated)} updated, {len(stale_ids)} removed"
+            )
+            return {
+                "message": "Enrollments updated",
+                # Same shape as before the diff: one single-row list per resulting enrollment
+                "created": [[row] for row in merged],
+                "inserted": created,
+                "updated": updated,
+                "deleted": stale_ids,
+                "enrollments": merged
+            }
     except HTTPException:
         raise
     except Exception as e:
@@ -306,17 +418,12 @@ async def get_enrollment_details(user_id: UUID = Query(...), course_name: str =
     try:
         async with httpx.AsyncClient() as client:
             # Get course info by name
-            course_response = await client.get(
-                f"{SUPABASE_REST_URL}/courses",
-                headers=get_supabase_headers(),
-                params={"name": f"eq.{course_name}", "select": "id,name,course_title"}
-            )
-            if course_response.status_code != 200 or not course_response.json():
+            course = await course_cache.get_by_code(client, course_name)
+            if not course:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="Course not found"
                 )
-            course = course_response.json()[0]
             course_id = course["id"]
 
             # Get enrollment for user and course
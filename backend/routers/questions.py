@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, status, Query
+from fastapi import APIRouter, HTTPException, status, Query, Response
 from typing import List, Optional, Dict, Any
 import os
 import httpx
@@ -13,6 +13,7 @@ from models import (
     QuestionSearchParams, QuestionStats,
     APIResponse
 )
+from supabase_utils import keyset_params, next_cursor, count_headers, content_range_total
 
 # Supabase config
 SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -29,6 +30,9 @@ def get_supabase_headers():
 
 router = APIRouter()
 
+# Keyset sort columns for question listings
+QUESTION_SORT_KEYS = ("created_at", "id")
+
 # Helper function to parse multiple choice options
 def parse_choices(options: List[str], correct_answer: str = None) -> List[ChoiceCreate]:
     choices = []
@@ -204,42 +208,55 @@ async def bulk_import_questions(import_data: BulkImportRequest):
 # GET /questions: Get all questions with choices and search/filter support
 @router.get("/", response_model=List[QuestionWithChoices])
 async def get_questions(
+    response: Response,
     topic: Optional[str] = Query(None, description="Filter by topic"),
     question_type: Optional[str] = Query(None, description="Filter by question type"),
     search: Optional[str] = Query(None, description="Search in question text"),
     page: int = Query(1, ge=1, description="Page number"),
-    size: int = Query(50, ge=1, le=100, description="Page size")
+    size: int = Query(50, ge=1, le=100, description="Page size"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page (replaces page)"),
+    include_total: bool = Query(False, description="Return an estimated total count in X-Total-Count")
 ):
-    """Get all questions with their choices from Supabase with optional filtering"""
+    """Get all questions with their choices from Supabase with optional filtering
+
+    Keyset pagination: pass the X-Next-Cursor response header back as `cursor`.
+    """
+    # Build query parameters (ordered by created_at, id so pages can continue from a cursor);
+    # outside the try so an invalid cursor stays a 400
+    query_params = keyset_params(QUESTION_SORT_KEYS, cursor, size)
     try:
         async with httpx.AsyncClient() as client:
-            # Build query parameters
-            query_params = []
-            
+
             if topic:
-                query_params.append(f"topic=eq.{topic}")
+                query_params["topic"] = f"eq.{topic}"
             if question_type:
-                query_params.append(f"question_type=eq.{question_type}")
+                query_params["question_type"] = f"eq.{question_type}"
             if search:
-                query_params.append(f"question_text=ilike.*{search}*")
+                query_params["question_text"] = f"ilike.*{search}*"
             
             # Add pagination
-            offset = (page - 1) * size
-            query_params.extend([f"limit={size}", f"offset={offset}"])
-            
-            query_string = "&".join(query_params) if query_params else ""
-            questions_url = f"{SUPABASE_REST_URL}/questions"
-            if query_string:
-                questions_url += f"?{query_string}"
+            if not cursor:
+                query_params["offset"] = str((page - 1) * size)
             
             # Get filtered questions
-            questions_resp = await client.get(questions_url, headers=get_supabase_headers())
+            questions_resp = await client.get(
+                f"{SUPABASE_REST_URL}/questions",
+                headers=count_headers(include_total),
+                params=query_params
+            )
             
-            if questions_resp.status_code != 200:
+            if questions_resp.status_code not in [200, 206]:
                 raise HTTPException(status_code=questions_resp.status_code, detail=questions_resp.text)
             
             questions = questions_resp.json()
             
+            page_cursor = next_cursor(questions, QUESTION_SORT_KEYS, size)
+            if page_cursor:
+                response.headers["X-Next-Cursor"] = page_cursor
+            total = content_range_total(questions_resp) if include_total else None
+            if total is not None:
+                response.headers["X-Total-Count"] = str(total)
+            
             # Get all choices
             choices_resp = await client.get(
                 f"{SUPABASE_REST_URL}/choices",
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, HTTPException, status, Query
+from fastapi import APIRouter, HTTPException, status, Query, Response
 from typing import List, Optional, Dict, Any
 import os
 import httpx
 from uuid import UUID
+from course_cache import cache as course_cache
+from supabase_utils import keyset_params, next_cursor, count_headers, content_range_total
 
 # Import models from your models file
 from models import (
@@ -25,6 +27,9 @@ def get_supabase_headers():
 
 router = APIRouter()
 
+# Keyset sort columns for quiz listings
+QUIZ_SORT_KEYS = ("created_at", "id")
+
 # POST /quiz: Create a new quiz
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=APIResponse)
 async def create_quiz(quiz: QuizCreate):
@@ -32,12 +37,7 @@ async def create_quiz(quiz: QuizCreate):
     try:
         async with httpx.AsyncClient() as client:
             # Verify course exists
-            course_resp = await client.get(
-                f"{SUPABASE_REST_URL}/courses?id=eq.{quiz.course_id}",
-                headers=get_supabase_headers()
-            )
-            
-            if course_resp.status_code != 200 or not course_resp.json():
+            if not await course_cache.get_by_id(client, quiz.course_id):
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="Course not found"
@@ -82,38 +82,52 @@ async def create_quiz(quiz: QuizCreate):
 # GET /quiz: Get all quizzes with optional filtering
 @router.get("/", response_model=List[QuizResponse])
 async def get_quizzes(
+    response: Response,
     course_id: Optional[UUID] = Query(None, description="Filter by course ID"),
     topic: Optional[str] = Query(None, description="Filter by topic"),
     page: int = Query(1, ge=1, description="Page number"),
     size: int = Query(50, ge=1, le=100, description="Page size"),
-    include_questions: bool = Query(False, description="Include questions in response")
+    include_questions: bool = Query(False, description="Include questions in response"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page (replaces page)"),
+    include_total: bool = Query(False, description="Return an estimated total count in X-Total-Count")
 ):
-    """Get all quizzes with optional filtering"""
+    """Get all quizzes with optional filtering
+
+    Keyset pagination: pass the X-Next-Cursor response header back as `cursor`.
+    """
     try:
         async with httpx.AsyncClient() as client:
-            # Build query parameters
-            query_params = []
+            # Build query parameters (ordered by created_at, id so pages can continue from a cursor)
+            query_params = keyset_params(QUIZ_SORT_KEYS, cursor, size)
             
             if course_id:
-                query_params.append(f"course_id=eq.{course_id}")
+                query_params["course_id"] = f"eq.{course_id}"
             if topic:
-                query_params.append(f"topic=eq.{topic}")
+                query_params["topic"] = f"eq.{topic}"
             
             # Add pagination
-            offset = (page - 1) * size
-            query_params.extend([f"limit={size}", f"offset={offset}"])
-            
-            query_string = "&".join(query_params) if query_params else f"limit={size}&offset={offset}"
-            quizzes_url = f"{SUPABASE_REST_URL}/quiz?{query_string}"
+            if not cursor:
+                query_params["offset"] = str((page - 1) * size)
             
             # Get quizzes
-            quizzes_resp = await client.get(quizzes_url, headers=get_supabase_headers())
+            quizzes_resp = await client.get(
+                f"{SUPABASE_REST_URL}/quiz",
+                headers=count_headers(include_total),
+                params=query_params
+            )
             
-            if quizzes_resp.status_code != 200:
+            if quizzes_resp.status_code not in [200, 206]:
                 raise HTTPException(status_code=quizzes_resp.status_code, detail=quizzes_resp.text)
             
             quizzes = quizzes_resp.json()
             
+            page_cursor = next_cursor(quizzes, QUIZ_SORT_KEYS, size)
+            if page_cursor:
+                response.headers["X-Next-Cursor"] = page_cursor
+            total = content_range_total(quizzes_resp) if include_total else None
+            if total is not None:
+                response.headers["X-Total-Count"] = str(total)
+            
             # If include_questions is True, fetch questions for each quiz
             if include_questions:
                 for quiz in quizzes:
@@ -217,12 +231,9 @@ async def get_quiz(quiz_id: UUID, include_course: bool = Query(True, description
             
             # Get course details if requested
             if include_course:
-                course_resp = await client.get(
-                    f"{SUPABASE_REST_URL}/courses?id=eq.{quiz['course_id']}",
-                    headers=get_supabase_headers()
-                )
-                if course_resp.status_code == 200 and course_resp.json():
-                    quiz["course"] = course_resp.json()[0]
+                course = await course_cache.get_by_id(client, quiz['course_id'])
+                if course:
+                    quiz["course"] = course
             
             # Get questions for this quiz
             questions_resp = await client.get(
@@ -265,11 +276,7 @@ async def update_quiz(quiz_id: UUID, quiz_update: QuizUpdate):
             
             # If updating course_id, verify the course exists
             if 'course_id' in update_data:
-                course_resp = await client.get(
-                    f"{SUPABASE_REST_URL}/courses?id=eq.{update_data['course_id']}",
-                    headers=get_supabase_headers()
-                )
-                if course_resp.status_code != 200 or not course_resp.json():
+                if not await course_cache.get_by_id(client, update_data['course_id']):
                     raise HTTPException(
                         status_code=status.HTTP_404_NOT_FOUND,
                         detail="Course not found"
@@ -470,12 +477,7 @@ async def get_quizzes_by_course(course_id: UUID, include_questions: bool = Query
     try:
         async with httpx.AsyncClient() as client:
             # Verify course exists
-            course_resp = await client.get(
-                f"{SUPABASE_REST_URL}/courses?id=eq.{course_id}&select=id",
-                headers=get_supabase_headers()
-            )
-            
-            if course_resp.status_code != 200 or not course_resp.json():
+            if not await course_cache.get_by_id(client, course_id):
                 raise HTTPException(status_code=404, detail="Course not found")
             
             # Get quizzes for this course
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, status, Query
 import jwt
 from datetime import datetime, timedelta
 import os
@@ -20,6 +20,7 @@ from config import (
     logger,
 )
 from uuid import UUID
+from supabase_utils import run_checks, keyset_params, next_cursor, count_headers, content_range_total
 
 
 JWT_SECRET = os.environ.get("JWT_SECRET")
@@ -29,20 +30,31 @@ JWT_EXP_DELTA_SECONDS = 86400
 
 router = APIRouter()
 
+# Keyset sort columns for user listings
+USER_SORT_KEYS = ("created_at", "id")
+
 
 # Users endpoints
 @router.get("/users")
-async def get_users():
+async def get_users(
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size (all users if omitted)"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    include_total: bool = Query(False, description="Include an estimated total count"),
+):
     """Get all users from the database (passwords excluded)"""
     try:
+        params = {"select": "id,email,created_at"}
+        if limit or cursor:
+            params.update(keyset_params(USER_SORT_KEYS, cursor, limit or 100))
+
         async with httpx.AsyncClient() as client:
             response = await client.get(
                 f"{SUPABASE_REST_URL}/users",
-                headers=get_supabase_headers(),
-                params={"select": "id,email,created_at"},
+                headers=count_headers(include_total),
+                params=params,
             )
 
-            if response.status_code != 200:
+            if response.status_code not in [200, 206]:
                 raise HTTPException(
                     status_code=response.status_code,
                     detail=f"Supabase API error: {response.text}",
@@ -50,7 +62,15 @@ async def get_users():
 
             users = response.json()
             logger.info(f"Retrieved {len(users)} users")
-            return {"users": users, "count": len(users)}
+            result = {"users": users, "count": len(users)}
+            if limit or cursor:
+                result["next_cursor"] = next_cursor(users, USER_SORT_KEYS, limit or 100)
+            if include_total:
+                result["total"] = content_range_total(response)
+            return result
+
+    except HTTPException:
+        raise
 
     except httpx.RequestError as e:
         logger.error(f"Request error: {str(e)}")
@@ -441,33 +461,37 @@ async def enroll_user_in_course(user_id: UUID, course: CourseEnrollment):
     try:
         async with httpx.AsyncClient() as client:
             # Check if user exists
-            user_response = await client.get(
-                f"{SUPABASE_REST_URL}/users",
-                headers=get_supabase_headers(),
-                params={"id": f"eq.{user_id}", "select": "id"},
-            )
-
-            if user_response.status_code != 200 or not user_response.json():
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+            async def check_user():
+                user_response = await client.get(
+                    f"{SUPABASE_REST_URL}/users",
+                    headers=get_supabase_headers(),
+                    params={"id": f"eq.{user_id}", "select": "id"},
                 )
 
-            # Check if already enrolled
-            existing_enrollment = await client.get(
-                f"{SUPABASE_REST_URL}/courses",
-                headers=get_supabase_headers(),
-                params={
-                    "user_id": f"eq.{user_id}",
-                    "course_code": f"eq.{course.course_code}",
-                },
-            )
+                if user_response.status_code != 200 or not user_response.json():
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+                    )
 
-            if existing_enrollment.status_code == 200 and existing_enrollment.json():
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="User is already enrolled in this course",
+            # Check if already enrolled
+            async def check_not_enrolled():
+                existing_enrollment = await client.get(
+                    f"{SUPABASE_REST_URL}/courses",
+                    headers=get_supabase_headers(),
+                    params={
+                        "user_id": f"eq.{user_id}",
+                        "course_code": f"eq.{course.course_code}",
+                    },
                 )
 
+                if existing_enrollment.status_code == 200 and existing_enrollment.json():
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="User is already enrolled in this course",
+                    )
+
+            await run_checks(check_user(), check_not_enrolled())
+
             # Create enrollment
             enrollment_data = {
                 "user_id": str(user_id),  # Convert UUID to string
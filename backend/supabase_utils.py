@@ -0,0 +1,150 @@
+"""
+Shared helpers for Supabase (PostgREST) access from the routers: batched and
+concurrent reads, and keyset (cursor) pagination.
+"""
+import json
+import base64
+import asyncio
+import httpx
+from fastapi import HTTPException, status
+
+from config import get_supabase_headers, SUPABASE_REST_URL, logger
+
+# Ids per `in.(...)` filter; keeps request URLs well below proxy limits (~40 chars per uuid)
+IN_CHUNK_SIZE = 100
+
+
+def quote_value(value) -> str:
+    """A filter value for use inside `in.(...)`/`or=(...)`; double-quoted if it has reserved characters."""
+    value = str(value)
+    if any(c in value for c in ',.:()" \\'):
+        value = '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    return value
+
+
+def in_filter(values) -> str:
+    """PostgREST `in.(...)` filter; values with reserved characters are double-quoted."""
+    return f"in.({','.join(quote_value(value) for value in values)})"
+
+
+def chunked(items: list, size: int = IN_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+async def fetch_by_ids(client: httpx.AsyncClient, table: str, ids, select: str, column: str = "id") -> dict:
+    """Fetch rows of `table` whose `column` is in `ids`; returns {column value: row}.
+
+    Ids are de-duplicated and looked up with concurrent `in.(...)` requests of at
+    most IN_CHUNK_SIZE each. Failed chunks are logged and left out.
+    """
+    ids = sorted({str(i) for i in ids if i})
+    if not ids:
+        return {}
+
+    async def fetch_chunk(chunk):
+        response = await client.get(
+            f"{SUPABASE_REST_URL}/{table}",
+            headers=get_supabase_headers(),
+            params={column: in_filter(chunk), "select": select}
+        )
+        if response.status_code != 200:
+            logger.warning(f"Batch lookup on {table} failed: {response.text}")
+            return []
+        return response.json()
+
+    rows = {}
+    for chunk_rows in await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunked(ids))):
+        for row in chunk_rows:
+            rows[str(row[column])] = row
+    return rows
+
+
+def content_range_total(response: httpx.Response) -> int | None:
+    """Total row count from a `Prefer: count=...` response ("0-99/1234"), if present."""
+    total = response.headers.get("content-range", "").rpartition("/")[2]
+    return int(total) if total.isdigit() else None
+
+
+def encode_cursor(row: dict, keys: tuple[str, ...]) -> str:
+    """Opaque cursor holding the sort-key values of the last row of a page."""
+    raw = json.dumps([row.get(key) for key in keys], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, keys: tuple[str, ...]) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        values = None
+    # Only the leading sort key may be null (see keyset_params); the last one is the unique id
+    if not isinstance(values, list) or len(values) != len(keys) or values[-1] is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return values
+
+
+def keyset_params(keys: tuple[str, ...], cursor: str | None, limit: int) -> dict:
+    """PostgREST params for one keyset page ordered by `keys` (ascending), starting after `cursor`.
+
+    With keys ("created_at", "id") the page after (t, i) is
+    `or=(created_at.gt.t,created_at.is.null,and(created_at.eq.t,id.gt.i))`, which
+    Postgres serves from an index on the sort columns, so page N costs the same
+    as page 1. Rows with a null leading key sort last (`nullslast`); once the
+    cursor reaches them the page after (null, i) is `created_at=is.null&id=gt.i`.
+    """
+    if len(keys) == 1:
+        order = f"{keys[0]}.asc"
+    else:
+        order = ",".join([f"{keys[0]}.asc.nullslast", *(f"{key}.asc" for key in keys[1:])])
+    params = {"order": order, "limit": str(limit)}
+    if cursor:
+        raw = decode_cursor(cursor, keys)
+        values = [quote_value(v) for v in raw]
+        if len(keys) == 1:
+            params[keys[0]] = f"gt.{values[0]}"
+        elif raw[0] is None:
+            params[keys[0]] = "is.null"
+            params[keys[1]] = f"gt.{values[1]}"
+        else:
+            params["or"] = (f"({keys[0]}.gt.{values[0]},{keys[0]}.is.null,"
+                            f"and({keys[0]}.eq.{values[0]},{keys[1]}.gt.{values[1]}))")
+    return params
+
+
+def next_cursor(rows: list, keys: tuple[str, ...], limit: int) -> str | None:
+    """Cursor for the page after `rows`, or None when this was the last page."""
+    return encode_cursor(rows[-1], keys) if rows and len(rows) >= limit else None
+
+
+def count_headers(include_total: bool) -> dict:
+    """Supabase headers, asking for an estimated total row count (Content-Range) if requested."""
+    headers = get_supabase_headers()
+    if include_total:
+        headers["Prefer"] = "count=estimated"
+    return headers
+
+
+async def run_checks(*checks):
+    """Run independent precondition reads concurrently; returns their results in order.
+
+    Each check is an awaitable that raises (usually HTTPException) when its
+    precondition fails. The first failure cancels the checks still running and
+    is re-raised as-is, so endpoints keep their existing 404/400 responses while
+    paying for the slowest check instead of the sum of all of them.
+    """
+    tasks = [asyncio.ensure_future(check) for check in checks]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    # Several checks may have failed in the same tick; report the first one listed
+    for task in tasks:
+        if task in done and not task.cancelled() and task.exception() is not None:
+            raise task.exception()
+    return [task.result() for task in tasks]
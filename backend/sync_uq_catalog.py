@@ -0,0 +1,207 @@
+"""
+Mirror the UQ Library course catalog into the Supabase `courses` table.
+
+Usage:
+    python sync_uq_catalog.py                      # one full refresh
+    python sync_uq_catalog.py --dry-run --json     # show what would change
+    python sync_uq_catalog.py --every 360          # refresh every 6 hours (long-running)
+
+The suggestions API only returns a handful of matches per hint, so the catalog
+is crawled by fanning out over hint prefixes concurrently: every prefix whose
+result list is full (--saturation) is expanded by one more character until the
+results stop being truncated. Results are de-duplicated by course code, then
+diffed against `courses`: new codes are bulk-inserted and changed rows
+bulk-upserted by id. Courses that disappear upstream are only reported, never
+deleted (enrollments and quizzes reference them).
+
+Run it from cron / a scheduler with no flags, or keep it running with --every.
+"""
+import sys
+import json
+import time
+import string
+import asyncio
+import argparse
+import urllib.parse
+
+import httpx
+
+from config import get_supabase_headers, SUPABASE_REST_URL
+from supabase_utils import chunked
+
+UQ_SUGGESTIONS_URL = "https://api.library.uq.edu.au/v1/learning_resources/suggestions"
+COURSE_FIELDS = ("name", "url", "type", "course_title", "campus", "period")
+HINT_ALPHABET = string.ascii_uppercase + string.digits
+# Course codes are 8 characters (4 letters + 4 digits); never expand past that
+MAX_HINT_LENGTH = 8
+WRITE_CHUNK_SIZE = 200
+
+
+async def fetch_suggestions(client, semaphore, hint, retries=3):
+    url = f"{UQ_SUGGESTIONS_URL}?hint={urllib.parse.quote(hint)}"
+    for attempt in range(retries):
+        async with semaphore:
+            try:
+                response = await client.get(url)
+                if response.status_code == 200:
+                    return response.json() or []
+                error = f"HTTP {response.status_code}"
+            except httpx.RequestError as e:
+                error = str(e)
+        await asyncio.sleep(2 ** attempt)
+    raise RuntimeError(f"hint {hint!r}: {error}")
+
+
+async def crawl_catalog(seeds, saturation, concurrency):
+    """Breadth-first prefix fan-out; returns ({code: course row}, stats)."""
+    semaphore = asyncio.Semaphore(concurrency)
+    catalog, errors = {}, []
+    requests_made = 0
+    frontier = sorted(set(seeds))
+    async with httpx.AsyncClient(timeout=30) as client:
+        while frontier:
+            results = await asyncio.gather(
+                *(fetch_suggestions(client, semaphore, hint) for hint in frontier),
+                return_exceptions=True
+            )
+            requests_made += len(frontier)
+            next_frontier = []
+            for hint, rows in zip(frontier, results):
+                if isinstance(rows, Exception):
+                    errors.append(str(rows))
+                    continue
+                for row in rows:
+                    course = {field: (row.get(field) or "").strip() for field in COURSE_FIELDS}
+                    if not all(course.values()):
+                        continue
+                    code = course["name"].upper()
+                    # Same code offered in several periods/campuses: keep one deterministic row
+                    if code not in catalog or tuple(course.values()) > tuple(catalog[code].values()):
+                        catalog[code] = course
+                if len(rows) >= saturation and len(hint) < MAX_HINT_LENGTH:
+                    next_frontier.extend(hint + ch for ch in HINT_ALPHABET)
+            frontier = next_frontier
+    return catalog, {"requests": requests_made, "errors": errors}
+
+
+def fetch_existing_courses(client, page_size=1000):
+    """Every row of `courses` (the fields we mirror, plus id)."""
+    rows, offset = [], 0
+    while True:
+        response = client.get(
+            f"{SUPABASE_REST_URL}/courses",
+            headers=get_supabase_headers(),
+            params={
+                "select": "id," + ",".join(COURSE_FIELDS),
+                "order": "id.asc",
+                "limit": str(page_size),
+                "offset": str(offset),
+            },
+        )
+        response.raise_for_status()
+        page = response.json()
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        offset += page_size
+
+
+def diff_catalog(catalog, existing):
+    """Split the mirrored catalog into (inserts, updates, missing upstream codes)."""
+    by_code = {row["name"].upper(): row for row in existing}
+    inserts, updates = [], []
+    for code, course in sorted(catalog.items()):
+        current = by_code.get(code)
+        if current is None:
+            inserts.append(course)
+        elif any((current.get(field) or "") != course[field] for field in COURSE_FIELDS if field != "name"):
+            updates.append({"id": current["id"], **course, "name": current["name"]})
+    missing = sorted(code for code in by_code if code not in catalog)
+    return inserts, updates, missing
+
+
+def apply_changes(client, inserts, updates):
+    errors = []
+    for chunk in chunked(inserts, WRITE_CHUNK_SIZE):
+        response = client.post(f"{SUPABASE_REST_URL}/courses", headers=get_supabase_headers(), json=chunk)
+        if response.status_code not in (200, 201):
+            errors.append(f"insert of {len(chunk)} courses failed: {response.text}")
+    for chunk in chunked(updates, WRITE_CHUNK_SIZE):
+        response = client.post(
+            f"{SUPABASE_REST_URL}/courses",
+            headers={**get_supabase_headers(), "Prefer": "return=minimal,resolution=merge-duplicates"},
+            params={"on_conflict": "id"},
+            json=chunk,
+        )
+        if response.status_code not in (200, 201, 204):
+            errors.append(f"update of {len(chunk)} courses failed: {response.text}")
+    return errors
+
+
+def refresh(args):
+    started = time.time()
+    with httpx.Client(timeout=60) as client:
+        existing = fetch_existing_courses(client)
+        # Seed with the fixed-length prefixes plus every subject area we already know about
+        seeds = {"".join(p) for p in _prefixes(args.min_hint)}
+        seeds.update(row["name"][:4].upper() for row in existing if len(row["name"]) >= 4)
+        seeds.update(s.upper() for s in args.seed)
+        catalog, crawl = asyncio.run(crawl_catalog(seeds, args.saturation, args.concurrency))
+        inserts, updates, missing = diff_catalog(catalog, existing)
+        # A crawl with failed hints may have missed courses; only writes are safe to apply then
+        write_errors = [] if args.dry_run else apply_changes(client, inserts, updates)
+    return {
+        "catalog_size": len(catalog),
+        "existing": len(existing),
+        "inserted": len(inserts),
+        "updated": len(updates),
+        "missing_upstream": len(missing),
+        "uq_requests": crawl["requests"],
+        "crawl_errors": crawl["errors"],
+        "write_errors": write_errors,
+        "dry_run": args.dry_run,
+        "seconds": round(time.time() - started, 1),
+    }
+
+
+def _prefixes(length):
+    if length <= 0:
+        return [""]
+    return [p + ch for p in _prefixes(length - 1) for ch in string.ascii_uppercase]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mirror the UQ Library course catalog into Supabase.")
+    parser.add_argument("--min-hint", type=int, default=2, help="Length of the seed hint prefixes (A-Z)")
+    parser.add_argument("--seed", nargs="*", default=[], help="Extra hint prefixes to crawl (e.g. CSSE DECO)")
+    parser.add_argument("--saturation", type=int, default=10,
+                        help="Result count at which the API is assumed to truncate and a prefix is expanded")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent UQ API requests")
+    parser.add_argument("--dry-run", action="store_true", help="Crawl and diff, but don't write to Supabase")
+    parser.add_argument("--every", type=float, default=None, help="Repeat every N minutes instead of exiting")
+    parser.add_argument("--json", action="store_true", help="Print one JSON line per refresh")
+    args = parser.parse_args()
+
+    while True:
+        try:
+            summary = refresh(args)
+            if args.json:
+                print(json.dumps(summary), flush=True)
+            else:
+                print(f"[✓] Catalog {summary['catalog_size']} courses from {summary['uq_requests']} UQ requests: "
+                      f"{summary['inserted']} inserted, {summary['updated']} updated, "
+                      f"{summary['missing_upstream']} no longer listed upstream "
+                      f"({summary['seconds']}s{', dry run' if args.dry_run else ''})", flush=True)
+                for error in summary["crawl_errors"][:10] + summary["write_errors"]:
+                    print(f"[!] {error}", flush=True)
+        except Exception as e:
+            print(f"[!] Catalog refresh failed: {e}", flush=True)
+            if args.every is None:
+                sys.exit(1)
+        if args.every is None:
+            break
+        time.sleep(args.every * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The backend modules import each other as top-level modules (`from config import ...`)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# config.py refuses to import without Supabase settings; tests never reach this URL
+os.environ.setdefault("SUPABASE_URL", "http://supabase.test")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
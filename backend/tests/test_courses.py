@@ -0,0 +1,107 @@
+import asyncio
+import json
+import uuid
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import course_index
+from course_cache import CourseCache
+from routers import courses
+
+RealAsyncClient = httpx.AsyncClient
+
+
+@pytest.fixture
+def supabase(monkeypatch):
+    """Fake Supabase REST API serving `rows["courses"]` (eq filters on id/name); records every request."""
+    state = {"rows": [], "requests": []}
+
+    def matching(request: httpx.Request) -> list[dict]:
+        rows = state["rows"]
+        for column in ("id", "name"):
+            value = request.url.params.get(column, "")
+            if value.startswith("eq."):
+                rows = [row for row in rows if str(row[column]) == value[3:]]
+        return rows
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        state["requests"].append(request)
+        if request.method == "PATCH":
+            for row in matching(request):
+                row.update(json.loads(request.content))
+        return httpx.Response(200, json=matching(request))
+
+    transport = httpx.MockTransport(handler)
+    monkeypatch.setattr(
+        courses.httpx, "AsyncClient", lambda *args, **kwargs: RealAsyncClient(*args, transport=transport, **kwargs)
+    )
+    monkeypatch.setattr(courses, "course_cache", CourseCache())
+    monkeypatch.setattr(course_index, "index", course_index.CourseIndex())
+    return state
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(courses.router, prefix="/api/v1")
+    return TestClient(app)
+
+
+def test_get_courses_rejects_invalid_cursor(client, supabase):
+    response = client.get("/api/v1/courses", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+    assert supabase["requests"] == []
+
+
+def test_rename_drops_the_old_code_from_cache_and_index(client, supabase):
+    course = {"id": str(uuid.uuid4()), "name": "CSSE2310", "course_title": "Computer Systems"}
+    supabase["rows"] = [dict(course)]
+    course_index.index.load([course])
+    # Only the code key is cached, e.g. after a search-by-code lookup
+    courses.course_cache._set(("code", "CSSE2310"), course, courses.course_cache.ttl)
+
+    response = client.put(f"/api/v1/courses/{course['id']}", json={"name": "CSSE2311"})
+    assert response.status_code == 200
+
+    assert courses.course_cache.stats()["entries"] == 2  # id and new code only
+    assert courses.course_cache._get(("code", "CSSE2311"))["name"] == "CSSE2311"
+    assert [c["name"] for c in course_index.index.search("csse2310", fuzzy=False)] == []
+    assert [c["name"] for c in course_index.index.search("csse2311", fuzzy=False)] == ["CSSE2311"]
+
+
+def test_bulk_create_retries_failed_chunk_with_bounded_concurrency(supabase, monkeypatch):
+    monkeypatch.setattr(courses, "COURSE_INSERT_CONCURRENCY", 2)
+    rows = [{"name": f"TEST{i:04d}", "course_title": "T", "campus": "St Lucia", "period": "S1"} for i in range(6)]
+    active = {"now": 0, "max": 0}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.method == "GET":
+            return httpx.Response(200, json=[])  # none of them exist yet
+        body = json.loads(request.content)
+        if len(body) > 1:
+            return httpx.Response(400, json={"message": "bad row in chunk"})
+        active["now"] += 1
+        active["max"] = max(active["max"], active["now"])
+        await asyncio.sleep(0.01)
+        active["now"] -= 1
+        name = body[0]["name"]
+        if name == "TEST0001":
+            raise httpx.ConnectError("connection reset", request=request)
+        if name == "TEST0002":
+            return httpx.Response(400, json={"message": "duplicate"})
+        return httpx.Response(201, json=[{"id": str(uuid.uuid4()), **body[0]}])
+
+    async def run():
+        async with RealAsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await courses._bulk_create_courses(client, rows, "exists")
+
+    synced, skipped, errors = asyncio.run(run())
+
+    assert [c["name"] for c in synced] == ["TEST0000", "TEST0003", "TEST0004", "TEST0005"]
+    assert skipped == []
+    assert [e.split(":")[0] for e in errors] == ["Failed to create TEST0001", "Failed to create TEST0002"]
+    assert active["max"] == 2
@@ -0,0 +1,124 @@
+import json
+import uuid
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from routers import enrollments
+
+RealAsyncClient = httpx.AsyncClient
+
+
+def ids_in(request: httpx.Request, column: str = "id") -> list[str]:
+    value = request.url.params.get(column, "")
+    return value[len("in.("):-1].split(",") if value.startswith("in.(") else []
+
+
+@pytest.fixture
+def supabase(monkeypatch):
+    """Fake Supabase REST API serving `rows["enrollments"]`; records every request it receives."""
+    state = {"rows": [], "requests": []}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        state["requests"].append(request)
+        table = request.url.path.rsplit("/", 1)[-1]
+        if table == "enrollments":
+            if request.method == "POST":
+                rows = json.loads(request.content)
+                return httpx.Response(201, json=[{"id": row.get("id") or str(uuid.uuid4()), **row} for row in rows])
+            if request.method == "DELETE":
+                return httpx.Response(204)
+            return httpx.Response(200, json=state["rows"])
+        if table == "users":
+            return httpx.Response(200, json=[{"id": i, "email": f"{i}@uq.edu.au"} for i in ids_in(request)])
+        if table == "courses":
+            return httpx.Response(
+                200, json=[{"id": i, "name": "CSSE2310", "course_title": "Computer Systems"} for i in ids_in(request)]
+            )
+        return httpx.Response(404, json={"message": f"unexpected table {table}"})
+
+    transport = httpx.MockTransport(handler)
+    monkeypatch.setattr(
+        enrollments.httpx, "AsyncClient", lambda *args, **kwargs: RealAsyncClient(*args, transport=transport, **kwargs)
+    )
+    return state
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(enrollments.router, prefix="/api/v1")
+    return TestClient(app)
+
+
+def make_enrollments(n: int) -> list[dict]:
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "user_id": str(uuid.uuid4()),
+            "course_id": str(uuid.uuid4()),
+            "semester": "Semester 1",
+            "year": 2025,
+            "enrolled_at": f"2025-01-01T00:00:{i % 60:02d}",
+        }
+        for i in range(n)
+    ]
+
+
+def upstream_calls(client, supabase, n: int) -> int:
+    supabase["rows"] = make_enrollments(n)
+    supabase["requests"].clear()
+    response = client.get("/api/v1/enrollments", params={"limit": 100})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["count"] == n
+    assert all(e["user"]["email"] and e["course"]["name"] == "CSSE2310" for e in body["enrollments"])
+    return len(supabase["requests"])
+
+
+def test_get_enrollments_upstream_calls_do_not_grow_with_page_size(client, supabase):
+    # One listing plus one batched lookup each for users and courses, however many rows
+    assert upstream_calls(client, supabase, 1) == 3
+    assert upstream_calls(client, supabase, 100) == 3
+
+
+def test_update_enrollments_writes_only_changes(client, supabase):
+    user_id = str(uuid.uuid4())
+    kept, moved, dropped = (str(uuid.uuid4()) for _ in range(3))
+    stored = {"semester": "Semester 2", "year": 2025, "grade": None, "exam_date": "2025-11-03"}
+    supabase["rows"] = [
+        {"id": "e1", "user_id": user_id, "course_id": kept, **stored, "exam_time": "09:30:00"},
+        {"id": "e2", "user_id": user_id, "course_id": moved, **stored, "exam_time": "14:00:00"},
+        {"id": "e3", "user_id": user_id, "course_id": dropped, **stored, "exam_time": None},
+    ]
+    new_course = str(uuid.uuid4())
+    payload = [
+        # Unchanged apart from formatting (HH:MM vs HH:MM:SS, "" vs null)
+        {"user_id": user_id, "course_id": kept, "semester": "Semester 2", "year": 2025, "grade": "",
+         "exam_date": "2025-11-03", "exam_time": "09:30"},
+        {"user_id": user_id, "course_id": moved, "semester": "Semester 2", "year": 2025, "grade": "",
+         "exam_date": "2025-11-03", "exam_time": "15:00"},
+        {"user_id": user_id, "course_id": new_course, "semester": "Semester 2", "year": 2025},
+    ]
+
+    supabase["requests"].clear()
+    response = client.put("/api/v1/enrollments/update", params={"user_id": user_id}, json=payload)
+    assert response.status_code == 200
+    body = response.json()
+
+    writes = [r for r in supabase["requests"] if r.method != "GET"]
+    assert [r.method for r in writes] == ["POST", "POST", "DELETE"]
+    assert [row["course_id"] for row in body["inserted"]] == [new_course]
+    assert [row["id"] for row in body["updated"]] == ["e2"]
+    assert body["deleted"] == ["e3"]
+    # Pre-diff response shape: one single-row list per enrollment
+    assert [rows[0]["course_id"] for rows in body["created"]] == [kept, moved, new_course]
+
+    # Saving the same list again against the updated rows writes nothing
+    supabase["rows"] = [rows[0] for rows in body["created"]]
+    supabase["requests"].clear()
+    response = client.put("/api/v1/enrollments/update", params={"user_id": user_id}, json=payload)
+    assert response.status_code == 200
+    assert [r.method for r in supabase["requests"]] == ["GET"]
@@ -0,0 +1,34 @@
+import pytest
+from fastapi import HTTPException
+
+from supabase_utils import keyset_params, next_cursor
+
+KEYS = ("created_at", "id")
+
+
+def test_cursor_after_null_sort_key_continues_among_null_rows():
+    rows = [{"id": "a", "created_at": "2024-01-01T00:00:00"}, {"id": "b", "created_at": None}]
+    cursor = next_cursor(rows, KEYS, limit=2)
+
+    params = keyset_params(KEYS, cursor, limit=2)
+
+    assert params["order"] == "created_at.asc.nullslast,id.asc"
+    assert params["created_at"] == "is.null"
+    assert params["id"] == "gt.b"
+    assert "or" not in params
+
+
+def test_cursor_after_non_null_sort_key_includes_null_rows():
+    cursor = next_cursor([{"id": "a", "created_at": "2024-01-01"}], KEYS, limit=1)
+
+    params = keyset_params(KEYS, cursor, limit=1)
+
+    assert params["or"] == "(created_at.gt.2024-01-01,created_at.is.null,and(created_at.eq.2024-01-01,id.gt.a))"
+
+
+def test_cursor_without_id_is_rejected():
+    cursor = next_cursor([{"id": None, "created_at": "2024-01-01"}], KEYS, limit=1)
+
+    with pytest.raises(HTTPException) as excinfo:
+        keyset_params(KEYS, cursor, limit=1)
+    assert excinfo.value.status_code == 400
@@ -43,16 +43,20 @@ export function getPastPaperPdfUrl(courseCode, filename) {
 }
 
 export async function fetchCourses(hint = "") {
+    // Typed hints go to the backend's in-memory course index (prefix + fuzzy match)
+    if (hint) {
+        const res = await axios.get(`${API_BASE}/courses/autocomplete`, {
+            params: { q: hint, limit: 6 }
+        });
+        return res.data.courses || [];
+    }
+
     const params = {
         limit: 6,
         offset: 0,
         include_enrollment_count: false,
     };
 
-    if (hint) {
-        params.name = hint;
-    }
-
     const res = await axios.get(`${API_BASE}/courses`, { params });
     return res.data.courses || [];
 }
@@ -26,14 +26,17 @@ if (workerSrcCandidate) {
  * Renders a single page of a PDF and allows sending the visible text to the backend LLM endpoint.
  * Props:
  *  - url: string (PDF URL)
+ *  - courseCode / filename: optional; when set, the backend extracts and caches page text
+ *    itself and only the page identifiers are sent.
  */
-export default function PDFWithAI({ url }) {
+export default function PDFWithAI({ url, courseCode, filename }) {
   const canvasRef = useRef(null);
   const [pageNumber, setPageNumber] = useState(1);
   const [numPages, setNumPages] = useState(0);
   const [loading, setLoading] = useState(true);
   const [extracting, setExtracting] = useState(false);
   const [aiLoading, setAiLoading] = useState(false);
+  const [aiStreaming, setAiStreaming] = useState(false);
   const [aiAnswer, setAiAnswer] = useState('');
   const [error, setError] = useState('');
   const [scale, setScale] = useState(1.1);
@@ -97,47 +100,100 @@ export default function PDFWithAI({ url }) {
     }
   }
 
+  async function postSolvePaper(body, stream = false) {
+    return fetch(`http://localhost:8000/api/v1/ai/solve-paper${stream ? '?stream=true' : ''}`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(body),
+    });
+  }
+
+  // Read a text/event-stream answer, rendering tokens as they arrive
+  async function readStreamedAnswer(res) {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let answer = '';
+    setAiStreaming(true);
+    try {
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let idx;
+        while ((idx = buffer.indexOf('\n\n')) !== -1) {
+          const rawEvent = buffer.slice(0, idx);
+          buffer = buffer.slice(idx + 2);
+          const event = (rawEvent.match(/^event: (.*)$/m) || [])[1];
+          const dataLine = (rawEvent.match(/^data: (.*)$/m) || [])[1];
+          if (!dataLine) continue;
+          const data = JSON.parse(dataLine);
+          if (event === 'token') {
+            answer += data.text;
+            setAiAnswer(answer);
+            setAiLoading(false);
+          } else if (event === 'error') {
+            throw new Error(data.detail || 'AI request failed');
+          }
+        }
+      }
+    } finally {
+      setAiStreaming(false);
+    }
+    return answer;
+  }
+
   async function handleAskAI() {
     setAiLoading(true);
     setAiAnswer('');
     setError('');
     try {
-      const text = await extractVisibleText();
-      if (!text) {
-        setError('No text extracted to send');
-        return;
+      // Preferred: send page identifiers only; server has the text cached per page
+      if (courseCode && filename) {
+        const res = await postSolvePaper({ course_code: courseCode, filename, page_number: pageNumber }, true);
+        if (res.ok) {
+          const answer = await readStreamedAnswer(res);
+          if (!answer) setAiAnswer('No answer');
+          return;
+        }
+        // 422 = no text layer on this page; fall through to the screenshot path
+        if (res.status !== 422) {
+          const detail = await res.json().catch(() => ({}));
+          throw new Error(detail.detail || 'AI request failed');
+        }
       }
-      // Capture canvas screenshot (PNG) - always included
-      let image_base64 = null;
+
+      const text = await extractVisibleText();
+      // Capture canvas screenshot as a binary PNG; the server downscales/recompresses it
+      let imageBlob = null;
       if (canvasRef.current) {
-        try {
-          const canvas = canvasRef.current;
-          let srcCanvas = canvas;
-          // Downscale if very large (>1600px width) to reduce payload size
-          if (canvas.width > 1600) {
-            const ratio = 1600 / canvas.width;
-            const off = document.createElement('canvas');
-            off.width = 1600;
-            off.height = Math.round(canvas.height * ratio);
-            const octx = off.getContext('2d');
-            octx.drawImage(canvas, 0, 0, off.width, off.height);
-            srcCanvas = off;
+        imageBlob = await new Promise(resolve => {
+          try {
+            canvasRef.current.toBlob(resolve, 'image/png');
+          } catch (e) {
+            // Non-fatal; we can still send text
+            console.warn('Failed to capture canvas image', e);
+            resolve(null);
           }
-            const dataUrl = srcCanvas.toDataURL('image/png');
-            image_base64 = dataUrl.split(',')[1]; // strip header
-        } catch (e) {
-          // Non-fatal; we can still send text
-          console.warn('Failed to capture canvas image', e);
-        }
+        });
+      }
+      if (!text && !imageBlob) {
+        setError('No text extracted to send');
+        return;
       }
 
-      const body = { text, page_number: pageNumber };
-      if (image_base64) body.image_base64 = image_base64;
+      const form = new FormData();
+      form.append('text', text);
+      form.append('page_number', String(pageNumber));
+      if (courseCode && filename) {
+        form.append('course_code', courseCode);
+        form.append('filename', filename);
+      }
+      if (imageBlob) form.append('image', imageBlob, `page-${pageNumber}.png`);
 
-      const res = await fetch('http://localhost:8000/api/v1/ai/solve-paper', {
+      const res = await fetch('http://localhost:8000/api/v1/ai/solve-paper/upload', {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(body),
+        body: form,
       });
       if (!res.ok) {
         const detail = await res.json().catch(() => ({}));
@@ -202,7 +258,7 @@ export default function PDFWithAI({ url }) {
             <button 
               className="btn btn-primary w-full h-10 text-base font-medium" 
               onClick={handleAskAI} 
-              disabled={aiLoading || extracting || loading}
+              disabled={aiLoading || aiStreaming || extracting || loading}
             >
               {aiLoading ? (
                 <span className="flex items-center gap-2">
@@ -1268,7 +1268,7 @@ const MockExam = () => {
                 </button>
               </div>
               <div className="flex-1 overflow-hidden">
-                <PDFWithAI url={getPastPaperPdfUrl(courseId, pdfView)} />
+                <PDFWithAI url={getPastPaperPdfUrl(courseId, pdfView)} courseCode={courseId} filename={pdfView} />
               {/* <div className="flex-1 flex flex-col items-center justify-center">
                 <iframe
                   src={getPastPaperPdfUrl(courseId, pdfView)}